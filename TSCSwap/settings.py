@@ -221,14 +221,19 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Generated from the database by `manage.py build_geo_bundle` (home.geo_bundle)
+GEO_BUNDLE_ROOT = os.path.join(BASE_DIR, 'generated_static')
+
 # Additional locations of static files
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
+    GEO_BUNDLE_ROOT,
 ]
 
 # Ensure the staticfiles directory exists
 os.makedirs(STATIC_ROOT, exist_ok=True)
 os.makedirs(os.path.join(BASE_DIR, 'static'), exist_ok=True)
+os.makedirs(GEO_BUNDLE_ROOT, exist_ok=True)
 
 # Media files (User-uploaded files like profile pictures)
 MEDIA_URL = '/media/'
@@ -238,3 +243,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Swap rotation search (home.cycle_finder)
+# Longest rotation to look for, and seconds a search may run (0 = no limit).
+# Rotations always cross counties: same-county pairs come from find_matches only.
+SWAP_CYCLE_MAX_LENGTH = int(os.getenv('SWAP_CYCLE_MAX_LENGTH', '5'))
+SWAP_CYCLE_TIME_BUDGET = float(os.getenv('SWAP_CYCLE_TIME_BUDGET', '10'))
@@ -47,4 +47,16 @@ class StaticViewSitemap(Sitemap):
             return 'monthly'
 
 
+class RecentListingSitemap(Sitemap):
+    """Detail pages of the newest public swaps and FastSwaps (home.activity_feed)."""
+    changefreq = 'daily'
+    priority = 0.5
+    protocol = 'https'
+
+    def items(self):
+        from home.activity_feed import FEED_SIZE, recent
+
+        return recent(2 * FEED_SIZE)
 
+    def lastmod(self, entry):
+        return entry.updated_at
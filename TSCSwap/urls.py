@@ -19,10 +19,11 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.sitemaps.views import sitemap
-from .sitemaps import StaticViewSitemap
+from .sitemaps import RecentListingSitemap, StaticViewSitemap
 
 sitemaps = {
     'static': StaticViewSitemap,
+    'listings': RecentListingSitemap,
 }
 
 urlpatterns = [
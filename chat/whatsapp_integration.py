@@ -375,7 +375,7 @@ def find_swaps_by_location(location: str, user_level, asking_user, counties_list
     """
     try:
         from users.models import PersonalProfile
-        from home.models import Counties, Schools
+        from home.models import Counties
         
         error_info = {'no_counties_found': False, 'suggestions': []}
         
@@ -398,26 +398,21 @@ def find_swaps_by_location(location: str, user_level, asking_user, counties_list
             # No location and no counties_list provided
             return [], error_info
         
-        # Find schools in those counties (through ward → constituency → county)
-        # Schools are linked: school.ward.constituency.county
-        schools_query = Schools.objects.filter(
-            ward__constituency__county__in=counties,
-            level=user_level  # Same teaching level
-        ).select_related('ward__constituency__county', 'level')
-        
         location_text = location or f"{counties.count()} preferred county/counties"
-        print(f"🔍 Found {schools_query.count()} schools in {location_text} at level {user_level.name}")
         
-        # Find users who teach at those schools and have the same level
+        # Find users teaching in those counties at the same level, using the
+        # county stored on the profile instead of school → ward → constituency
         matching_users = PersonalProfile.objects.filter(
-            school__in=schools_query,
+            current_county__in=counties,
+            school__level=user_level,
             level=user_level,  # Same teaching level as asking user
             user__is_active=True
         ).exclude(
             user=asking_user  # Exclude the asking user
         ).select_related(
-            'user', 'school', 'level', 'school__ward__constituency__county'
-        ).distinct()
+            'user', 'school', 'level', 'current_county'
+        )
+        print(f"🔍 Searching {location_text} at level {user_level.name}")
         
         print(f"✅ Found {matching_users.count()} matching users")
         
@@ -470,14 +465,8 @@ def find_triangle_swaps_for_whatsapp(asking_user, location: str, user_level) ->
         Formatted string with triangle swap opportunities, or empty string if none found
     """
     try:
-        from home.triangle_swap_utils import (
-            find_triangle_swaps_primary,
-            find_triangle_swaps_secondary,
-            get_current_county,
-            get_user_subjects
-        )
-        from home.models import MyUser, Counties
-        from users.models import PersonalProfile
+        from home.triangle_store import get_stored_triangles
+        from home.models import Counties
         
         # Check if user has complete profile and swap preferences
         # Note: We don't return error messages here as triangle swaps are optional
@@ -488,103 +477,60 @@ def find_triangle_swaps_for_whatsapp(asking_user, location: str, user_level) ->
         if not hasattr(asking_user, 'swappreference') or not asking_user.swappreference:
             return ""
         
-        # Determine if user is primary or secondary
-        user_school_level = asking_user.profile.school.level
-        is_secondary = user_school_level and ('secondary' in user_school_level.name.lower() or 'high' in user_school_level.name.lower())
-        
-        # Get all teachers at the same level with complete profiles
-        # Note: Include the asking user in the queryset so they can be part of triangle swaps
-        # Note: For triangle swaps, we don't filter by location upfront because
-        # triangle swaps involve circular exchanges, and the location might be relevant
-        # to any teacher in the triangle (current location or desired location)
-        teachers = MyUser.objects.filter(
-            is_active=True,
-            role='Teacher',
-            profile__isnull=False,
-            profile__school__isnull=False,
-            profile__school__level=user_school_level,
-            swappreference__isnull=False
-        ).select_related(
-            'profile__school__ward__constituency__county',
-            'swappreference__desired_county'
-        ).prefetch_related(
-            'swappreference__open_to_all'
-        )
-        
-        # Find triangle swaps
-        if is_secondary:
-            all_triangles = find_triangle_swaps_secondary(teachers)
-        else:
-            all_triangles = find_triangle_swaps_primary(teachers)
+        # If location is provided, only keep triangles where a teacher is in
+        # that location (either current location or desired location)
+        location_county_ids = set()
+        if location:
+            location_county_ids = set(
+                Counties.objects.filter(name__icontains=location).values_list('id', flat=True)
+            )
         
-        # Filter triangles that include the asking user
+        # Stored triangles through the asking user, who is teacher A
+        triangles = get_stored_triangles(asking_user).prefetch_related(
+            'teacher_a__swappreference__open_to_all',
+            'teacher_b__swappreference__open_to_all',
+            'teacher_c__swappreference__open_to_all',
+        )
         user_triangles = []
-        for teacher_a, teacher_b, teacher_c in all_triangles:
-            if asking_user.id in [teacher_a.id, teacher_b.id, teacher_c.id]:
-                # Get locations
-                county_a = get_current_county(teacher_a)
-                county_b = get_current_county(teacher_b)
-                county_c = get_current_county(teacher_c)
-                
-                # If location is provided, check if any teacher in the triangle is in that location
-                # (either current location or desired location)
-                if location:
-                    counties = Counties.objects.filter(name__icontains=location)
-                    if counties.exists():
-                        county_ids = set(counties.values_list('id', flat=True))
-                        triangle_counties = set()
-                        if county_a:
-                            triangle_counties.add(county_a.id)
-                        if county_b:
-                            triangle_counties.add(county_b.id)
-                        if county_c:
-                            triangle_counties.add(county_c.id)
-                        
-                        # Check desired counties too
-                        for teacher in [teacher_a, teacher_b, teacher_c]:
-                            if hasattr(teacher, 'swappreference') and teacher.swappreference:
-                                if teacher.swappreference.desired_county:
-                                    triangle_counties.add(teacher.swappreference.desired_county.id)
-                                triangle_counties.update(
-                                    teacher.swappreference.open_to_all.values_list('id', flat=True)
-                                )
-                        
-                        # Only include if location matches any county in the triangle
-                        if not triangle_counties.intersection(county_ids):
-                            continue
-                
-                # Determine the user's position in the triangle
-                if asking_user.id == teacher_a.id:
-                    user_position = "A"
-                elif asking_user.id == teacher_b.id:
-                    user_position = "B"
-                else:
-                    user_position = "C"
+        for triangle in triangles:
+            (teacher_a, county_a), (teacher_b, county_b), (teacher_c, county_c) = triangle.rotated_for(asking_user)
+            
+            if location_county_ids:
+                triangle_counties = {county_a.id, county_b.id, county_c.id}
                 
-                # Get common subjects for secondary teachers
-                common_subjects_text = ""
-                if is_secondary:
-                    subjects_a = get_user_subjects(teacher_a)
-                    subjects_b = get_user_subjects(teacher_b)
-                    subjects_c = get_user_subjects(teacher_c)
-                    common_subjects = subjects_a.intersection(subjects_b).intersection(subjects_c)
-                    if common_subjects:
-                        from home.models import Subject
-                        subject_names = Subject.objects.filter(id__in=common_subjects).values_list('name', flat=True)
-                        common_subjects_text = f"\n📚 Common Subjects: {', '.join(subject_names[:3])}"
-                        if len(subject_names) > 3:
-                            common_subjects_text += f" +{len(subject_names) - 3} more"
+                # Check desired counties too
+                for teacher in [teacher_a, teacher_b, teacher_c]:
+                    if hasattr(teacher, 'swappreference') and teacher.swappreference:
+                        if teacher.swappreference.desired_county_id:
+                            triangle_counties.add(teacher.swappreference.desired_county_id)
+                        triangle_counties.update(
+                            county.id for county in teacher.swappreference.open_to_all.all()
+                        )
                 
-                user_triangles.append({
-                    'teacher_a': teacher_a,
-                    'teacher_b': teacher_b,
-                    'teacher_c': teacher_c,
-                    'county_a': county_a.name if county_a else 'Unknown',
-                    'county_b': county_b.name if county_b else 'Unknown',
-                    'county_c': county_c.name if county_c else 'Unknown',
-                    'user_position': user_position,
-                    'common_subjects': common_subjects_text
-                })
+                # Only include if location matches any county in the triangle
+                if not triangle_counties.intersection(location_county_ids):
+                    continue
+            
+            user_position = "A"
+            
+            # Common subjects are stored for secondary triangles
+            common_subjects_text = ""
+            subject_names = [subject.name for subject in triangle.common_subjects.all()]
+            if subject_names:
+                common_subjects_text = f"\n📚 Common Subjects: {', '.join(subject_names[:3])}"
+                if len(subject_names) > 3:
+                    common_subjects_text += f" +{len(subject_names) - 3} more"
+            
+            user_triangles.append({
+                'teacher_a': teacher_a,
+                'teacher_b': teacher_b,
+                'teacher_c': teacher_c,
+                'county_a': county_a.name,
+                'county_b': county_b.name,
+                'county_c': county_c.name,
+                'user_position': user_position,
+                'common_subjects': common_subjects_text
+            })
         
         # Format for WhatsApp (limit to 3 triangles)
         if not user_triangles:
@@ -667,9 +613,7 @@ Found {total_count} matching teacher(s):
             
             # Get school and location
             school_name = profile.school.name if profile.school else "Not set"
-            county_name = ""
-            if profile.school and profile.school.ward:
-                county_name = profile.school.ward.constituency.county.name if profile.school.ward.constituency else ""
+            county_name = profile.current_county.name if profile.current_county else ""
             
             # Get subjects if available
             subjects_text = ""
@@ -0,0 +1,133 @@
+"""
+Recent public activity: the newest active swaps and FastSwaps, with the
+fields their preview cards show copied into ActivityFeedEntry rows.
+
+The landing page, the activity API and the sitemap read the feed with one
+query on its (kind, created_at, id) index, however many related rows a
+preview card names. home.signals records a listing when it is saved - or
+drops it once it is archived or deactivated - and refreshes the entries
+of a poster whose profile changes. Each kind keeps its FEED_SIZE newest
+entries. Renames of schools, locations and levels, and bulk FastSwap
+imports, rebuild the feed (rebuild_feed), as does ``manage.py
+rebuild_activity_feed``.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ActivityFeedEntry, FastSwap, Swaps
+
+FEED_SIZE = 200
+
+UNKNOWN = 'N/A'
+ANY_COUNTY = 'Any County'
+
+
+def _name(obj, default=UNKNOWN):
+    return obj.name if obj else default
+
+
+def _swap_fields(swap):
+    profile = getattr(swap.user, 'profile', None)
+    school = getattr(profile, 'school', None)
+    ward = school.ward if school else None
+    return {
+        'kind': 'swap',
+        'school_name': _name(school),
+        'level_name': _name(getattr(profile, 'level', None)),
+        'from_county': _name(ward.constituency.county if ward else None),
+        'to_county': _name(swap.county, ANY_COUNTY),
+        'created_at': swap.created_at,
+    }
+
+
+def _fast_swap_fields(fast_swap):
+    return {
+        'kind': 'fastswap',
+        'school_name': _name(fast_swap.school),
+        'level_name': _name(fast_swap.level),
+        'from_county': _name(fast_swap.current_county),
+        'to_county': _name(fast_swap.most_preferred, ANY_COUNTY),
+        'created_at': fast_swap.created_at,
+    }
+
+
+def _swaps():
+    return Swaps.objects.filter(archived=False, status=True).select_related(
+        'county', 'user__profile__level', 'user__profile__school__ward__constituency__county',
+    )
+
+
+def _fast_swaps():
+    return FastSwap.objects.select_related('school', 'level', 'current_county', 'most_preferred')
+
+
+def trim(kind):
+    """Drop the entries of ``kind`` past its FEED_SIZE newest."""
+    entries = ActivityFeedEntry.objects.filter(kind=kind)
+    cutoff = entries.order_by('-created_at', '-id').values_list('created_at', 'id')[FEED_SIZE:FEED_SIZE + 1]
+    for created_at, entry_id in cutoff:
+        entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lte=entry_id)).delete()
+
+
+def record_swap(swap_id):
+    """Add or refresh a swap's entry, or drop it when the swap isn't public."""
+    swap = _swaps().filter(pk=swap_id).first()
+    if swap is None:
+        ActivityFeedEntry.objects.filter(swap_id=swap_id).delete()
+        return
+    _, created = ActivityFeedEntry.objects.update_or_create(swap=swap, defaults=_swap_fields(swap))
+    if created:
+        trim('swap')
+
+
+def record_fast_swap(fast_swap_id):
+    """Add or refresh a FastSwap's entry."""
+    fast_swap = _fast_swaps().filter(pk=fast_swap_id).first()
+    if fast_swap is None:
+        return
+    _, created = ActivityFeedEntry.objects.update_or_create(fast_swap=fast_swap, defaults=_fast_swap_fields(fast_swap))
+    if created:
+        trim('fastswap')
+
+
+def refresh_user(user_id):
+    """Re-copy the poster's details into the entries of their swaps."""
+    for swap_id in ActivityFeedEntry.objects.filter(swap__user_id=user_id).values_list('swap_id', flat=True):
+        record_swap(swap_id)
+
+
+def rebuild_feed(kinds=('swap', 'fastswap')):
+    """Refill the feed from the newest listings of each kind."""
+    sources = {
+        'swap': (_swaps, 'swap', _swap_fields),
+        'fastswap': (_fast_swaps, 'fast_swap', _fast_swap_fields),
+    }
+    for kind in kinds:
+        queryset, field, fields = sources[kind]
+        newest = queryset().order_by('-created_at', '-id')[:FEED_SIZE]
+        with transaction.atomic():
+            ActivityFeedEntry.objects.filter(kind=kind).delete()
+            ActivityFeedEntry.objects.bulk_create([
+                ActivityFeedEntry(**{field: listing}, **fields(listing)) for listing in newest
+            ])
+
+
+def recent(limit, kind=None):
+    """The ``limit`` newest entries, of one kind or of both; one query."""
+    entries = ActivityFeedEntry.objects.all()
+    if kind:
+        entries = entries.filter(kind=kind)
+    return list(entries.order_by('-created_at', '-id')[:limit])
+
+
+def serialize_entry(entry):
+    """JSON-friendly form of a feed entry."""
+    return {
+        'kind': entry.kind,
+        'url': entry.get_absolute_url(),
+        'school_name': entry.school_name,
+        'level': entry.level_name,
+        'from_county': entry.from_county,
+        'to_county': entry.to_county,
+        'created_at': entry.created_at.isoformat(),
+    }
@@ -1,40 +1,110 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views import View
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.utils.decorators import method_decorator
-from .models import Constituencies, Wards
+from . import geo_bundle, geo_cache
+from .conditional import LOCATION_MAX_AGE, constituencies_etag, facets_etag, geography_bundle_etag, wards_etag
+from .facets import facet_counts
 
 class ConstituencyAPIView(View):
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
         return super().dispatch(*args, **kwargs)
-        
+
+    @method_decorator(cache_control(public=True, max_age=LOCATION_MAX_AGE))
+    @method_decorator(condition(etag_func=constituencies_etag))
     def get(self, request):
-        county_id = request.GET.get('county')
-        if not county_id:
-            return JsonResponse([], safe=False)
-            
-        try:
-            constituencies = Constituencies.objects.filter(county_id=county_id).values('id', 'name').order_by('name')
-            return JsonResponse(list(constituencies), safe=False)
-        except Exception as e:
-            print(f"Error in ConstituencyAPIView: {str(e)}")
-            return JsonResponse([], safe=False)
+        return JsonResponse(geo_cache.constituencies(request.GET.get('county')), safe=False)
 
 class WardAPIView(View):
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
         return super().dispatch(*args, **kwargs)
-        
+
+    @method_decorator(cache_control(public=True, max_age=LOCATION_MAX_AGE))
+    @method_decorator(condition(etag_func=wards_etag))
+    def get(self, request):
+        return JsonResponse(geo_cache.wards(request.GET.get('constituency')), safe=False)
+
+
+class GeographyBundleAPIView(View):
+    """
+    The geography bundle (home.geo_bundle) served from memory, for when the
+    collected static copy is missing or older than the data.
+    """
+
+    @method_decorator(cache_control(public=True, max_age=LOCATION_MAX_AGE))
+    @method_decorator(condition(etag_func=geography_bundle_etag))
+    def get(self, request):
+        return HttpResponse(geo_bundle.bundle_content(), content_type='application/json')
+
+
+class FacetCountsAPIView(View):
+    """
+    Active listings per county, constituency and ward (home.facets):
+    {"swaps"|"fast_swaps": {"county"|"constituency"|"ward": {id: {"total", "levels": {level_id: n}}}}}.
+    """
+
+    @method_decorator(condition(etag_func=facets_etag))
+    def get(self, request):
+        return JsonResponse(facet_counts())
+
+
+class ActivityFeedAPIView(View):
+    """
+    Newest public listings for previews (home.activity_feed):
+    ?kind=swap|fastswap (default both) and ?limit= up to FEED_SIZE.
+    """
+
     def get(self, request):
-        constituency_id = request.GET.get('constituency')
-        if not constituency_id:
-            return JsonResponse([], safe=False)
-            
-        try:
-            wards = Wards.objects.filter(constituency_id=constituency_id).values('id', 'name').order_by('name')
-            return JsonResponse(list(wards), safe=False)
-        except Exception as e:
-            print(f"Error in WardAPIView: {str(e)}")
-            return JsonResponse([], safe=False)
-        return JsonResponse(list(wards), safe=False)
+        from .activity_feed import FEED_SIZE, recent, serialize_entry
+
+        kind = request.GET.get('kind')
+        if kind not in (None, 'swap', 'fastswap'):
+            return JsonResponse({'error': 'kind must be swap or fastswap'}, status=400)
+        limit = request.GET.get('limit', '')
+        limit = min(int(limit), FEED_SIZE) if limit.isdigit() else 10
+        return JsonResponse({'results': [serialize_entry(entry) for entry in recent(limit, kind)]})
+
+
+class SwapSearchAPIView(View):
+    """
+    Free-text search over active swaps (home.search): ?q=<words> and a
+    cursor from the previous response. Best match first.
+    """
+
+    def get(self, request):
+        from .listings import serialize_swap
+        from .search import search_swaps
+
+        page = search_swaps(request.GET.get('q', ''), cursor=request.GET.get('cursor'))
+        return JsonResponse({
+            'words': page['words'],
+            'results': [{**serialize_swap(row), 'rank': row['rank']} for row in page['rows']],
+            'next_cursor': page['next_cursor'],
+            'previous_cursor': page['previous_cursor'],
+        })
+
+
+class SwapListingAPIView(View):
+    """
+    JSON version of the swap listing pages: ?level=all|primary|secondary,
+    the county / constituency / ward filters and a cursor from the
+    previous response. See home.listings.
+    """
+
+    def get(self, request):
+        from .listings import LISTING_LEVELS, get_listing_page, get_viewer, read_filters, serialize_row
+
+        kind = request.GET.get('level', 'all')
+        if kind not in LISTING_LEVELS:
+            return JsonResponse({'error': f"level must be one of {', '.join(LISTING_LEVELS)}"}, status=400)
+
+        page = get_listing_page(kind, get_viewer(request.user), read_filters(request.GET), cursor=request.GET.get('cursor'))
+        return JsonResponse({
+            'results': [serialize_row(row) for row in page['rows']],
+            'next_cursor': page['next_cursor'],
+            'previous_cursor': page['previous_cursor'],
+        })
@@ -0,0 +1,30 @@
+"""
+Version counters shared by every worker, kept in CacheVersion rows.
+
+The default cache is local to each worker process, so a counter kept there
+would only move in the worker that handled the change. Caches that must be
+retired everywhere at once (home.public_cache, home.geo_cache) key their
+entries on one of these rows instead.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CacheVersion
+
+
+def stored_version(name):
+    """Current version of ``name``; 0 until it is first bumped."""
+    return CacheVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+def bump_version(name):
+    """Record a change to the data behind ``name``."""
+    updated = CacheVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        try:
+            with transaction.atomic():
+                CacheVersion.objects.create(name=name, version=1)
+        except IntegrityError:
+            # Created by another worker in the meantime
+            CacheVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=timezone.now())
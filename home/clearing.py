@@ -0,0 +1,131 @@
+"""
+Swap clearing: one consistent set of swaps for a whole level.
+
+Stored pairs and triangles overlap - a teacher can be in dozens of them -
+so they are options, not a plan. A clearing run picks rotations (pairs,
+triangles and optionally longer cycles) that share no teacher, trying to
+relocate as many teachers as possible, in the spirit of kidney-exchange
+solvers.
+
+Exact packing with bounded cycle length is NP-hard, so the run is a greedy
+pass over the county graph of home.cycle_finder:
+
+- rotations are taken shortest first; short swaps are easier to carry out
+  and leave the most teachers for the longer ones
+- within a county cycle, rotations are taken while every bucket on it
+  still has a free teacher, so a busy cycle is cleared many times over
+- each bucket hands out its least flexible teachers (fewest wanted
+  counties) first, keeping flexible teachers available for other cycles
+- the graph is rebuilt from the free teachers before each length, which
+  drops exhausted buckets from the search
+
+The result also carries an upper bound: a county can't send away more
+teachers than it receives, so no packing relocates more than
+sum over counties of min(teachers wanting out, teachers wanting in).
+"""
+import time
+
+from .cycle_finder import (
+    CycleSearchTimeout,
+    build_county_graph,
+    get_deadline,
+    iter_county_cycles,
+    level_teachers,
+)
+from .match_engine import is_secondary_level
+from .triangle_swap_utils import load_triangle_buckets
+
+DEFAULT_CLEARING_LENGTH = 3
+
+
+def _upper_bound(group):
+    leaving = {}
+    arriving = {}
+    for user_id, wanted in group['wants'].items():
+        x = group['county'][user_id]
+        wanted = wanted - {x}
+        if wanted:
+            leaving[x] = leaving.get(x, 0) + 1
+        for y in wanted:
+            arriving[y] = arriving.get(y, 0) + 1
+    return sum(min(count, arriving.get(x, 0)) for x, count in leaving.items())
+
+
+def _clear_group(group, max_length, deadline, chosen):
+    """Greedy packing of one bucket group. Appends rotations to ``chosen``."""
+    free = dict(group['county'])
+    for length in range(2, max_length + 1):
+        residual = {
+            'county': free,
+            'wants': {user_id: group['wants'][user_id] for user_id in free},
+        }
+        graph = build_county_graph(residual)
+        # Least flexible teachers at the end, popped first
+        queues = {
+            edge: sorted(users, key=lambda u: (len(residual['wants'][u]), u), reverse=True)
+            for edge, users in graph['index'].items()
+        }
+        for cycle in iter_county_cycles(graph, length, deadline, min_length=length):
+            edges = [(cycle[i], cycle[(i + 1) % len(cycle)]) for i in range(len(cycle))]
+            while True:
+                rotation = []
+                for edge in edges:
+                    queue = queues[edge]
+                    while queue and queue[-1] not in free:
+                        queue.pop()
+                    if not queue:
+                        break
+                    rotation.append(queue[-1])
+                if len(rotation) < len(edges):
+                    break
+                for user_id in rotation:
+                    del free[user_id]
+                chosen.append(tuple(rotation))
+
+
+def clear_swaps(groups, max_length=DEFAULT_CLEARING_LENGTH, deadline=None):
+    """
+    Pack disjoint rotations over ``groups`` from load_triangle_buckets().
+
+    Returns {'cycles': [user id tuples in rotation order], 'unmatched':
+    sorted user ids, 'relocated': teachers moved, 'upper_bound',
+    'by_length': {length: rotations}, 'complete': False if the deadline
+    cut the run short, 'elapsed': seconds}.
+    """
+    started = time.monotonic()
+    chosen = []
+    complete = True
+    try:
+        for group in groups.values():
+            _clear_group(group, max_length, deadline, chosen)
+    except CycleSearchTimeout:
+        complete = False
+
+    moved = {user_id for rotation in chosen for user_id in rotation}
+    by_length = {}
+    for rotation in chosen:
+        by_length[len(rotation)] = by_length.get(len(rotation), 0) + 1
+    return {
+        'cycles': chosen,
+        'unmatched': sorted(
+            user_id for group in groups.values() for user_id in group['county'] if user_id not in moved
+        ),
+        'relocated': len(moved),
+        'upper_bound': sum(_upper_bound(group) for group in groups.values()),
+        'by_length': by_length,
+        'complete': complete,
+        'elapsed': time.monotonic() - started,
+    }
+
+
+def clear_level(level, max_length=DEFAULT_CLEARING_LENGTH, time_budget=None, teachers=None):
+    """
+    Run clearing on a level: by default every active teacher of the level
+    with swap preferences, grouped by subject fingerprint on secondary
+    levels. See clear_swaps() for the result.
+    """
+    if teachers is None:
+        teachers = level_teachers(level)
+    deadline = get_deadline(time_budget)
+    groups = load_triangle_buckets(teachers, secondary=is_secondary_level(level))
+    return clear_swaps(groups, max_length, deadline)
@@ -0,0 +1,91 @@
+"""
+Validators for conditional GET.
+
+Listings and location lookups are reloaded often, mostly on metered mobile
+data. Each endpoint gets a cheap ETag - the latest updated_at and the row
+count of what it shows, plus whatever else the page depends on - and
+django.views.decorators.http.condition answers 304 Not Modified without
+running the view when the browser's copy is still current.
+
+The location lookups validate on the version of the geography cache
+(home.geo_cache) instead of querying the tables. Locations almost never change, so
+browsers and nginx may also reuse them for LOCATION_MAX_AGE without asking
+at all.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+
+from .geo_cache import geography_version
+from .models import Bookmark, FastSwap, SwapPreference, Swaps
+from .public_cache import public_cache_version
+
+LOCATION_MAX_AGE = 60 * 60 * 24
+
+
+def _etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _state(queryset):
+    """(latest updated_at, row count) of a queryset, in one query."""
+    found = queryset.aggregate(last=Max('updated_at'), count=Count('id'))
+    return found['last'], found['count']
+
+
+def _viewer_state(user, bookmark_type):
+    """What a listing shows differently to this user: scores, bookmarks, admin details."""
+    if not user.is_authenticated:
+        return None
+    bookmarks = Bookmark.objects.filter(user=user, bookmark_type=bookmark_type).aggregate(
+        count=Count('id'), last=Max('id'),
+    )
+    return (
+        user.id,
+        user.is_staff,
+        user.is_superuser,
+        SwapPreference.objects.filter(user=user).values_list('updated_at', flat=True).first(),
+        bookmarks['count'],
+        bookmarks['last'],
+    )
+
+
+def _listing_etag(request, queryset, bookmark_type):
+    if len(get_messages(request)):
+        # A flash message is shown once; don't let a 304 swallow it
+        return None
+    return _etag(
+        request.path,
+        sorted(request.GET.lists()),
+        _state(queryset),
+        # Poster profile, school and location changes show up only here: the
+        # version is a CacheVersion row, so a change made in another worker counts
+        public_cache_version(),
+        _viewer_state(request.user, bookmark_type),
+    )
+
+
+def swap_list_etag(request, *args, **kwargs):
+    return _listing_etag(request, Swaps.objects.all(), 'swap')
+
+
+def fast_swap_list_etag(request, *args, **kwargs):
+    return _listing_etag(request, FastSwap.objects.all(), 'fastswap')
+
+
+def constituencies_etag(request, *args, **kwargs):
+    return _etag('constituencies', request.GET.get('county'), geography_version())
+
+
+def wards_etag(request, *args, **kwargs):
+    return _etag('wards', request.GET.get('constituency'), geography_version())
+
+
+def geography_bundle_etag(request, *args, **kwargs):
+    return _etag('geography_bundle', geography_version())
+
+
+def facets_etag(request, *args, **kwargs):
+    # Facet counts are recounted exactly when this version is bumped
+    return _etag('facets', public_cache_version())
@@ -0,0 +1,393 @@
+"""
+Swap rotations of any length up to k.
+
+Pairs and triangles are the 2- and 3-cycles of a more general structure: a
+rotation t1 -> t2 -> ... -> tk -> t1 where every teacher moves to the
+next teacher's county. This module finds such rotations on the county
+"wants" graph instead of on teachers:
+
+- teachers are bucketed by (current county x, wanted county y); a bucket is
+  an edge x -> y of the county graph (47 nodes at most)
+- simple county cycles are enumerated shortest first by a DFS that starts
+  from each cycle's smallest county only (canonical rotation, so every
+  cycle is found once), visits only larger counties, prunes any branch
+  that cannot get back to the start in time, and closes the last step
+  with a bitmask intersection
+- teacher rotations are the product of the buckets along a county cycle,
+  expanded lazily
+
+Counties are never repeated within a rotation: a rotation that visits a
+county twice splits into two shorter, disjoint rotations that are found on
+their own. Nor does a rotation stay in one county: a teacher's wish for
+their own current county is not an edge, so the same-county pairs that
+find_matches() and the MatchEdge store report are not found here. For
+secondary levels the graph is built per subject fingerprint,
+as in the triangle search.
+
+Rotations are reported as user id tuples, rotated so that the smallest id
+comes first. A dense county graph has millions of 5-cycles, so searches
+stop at a time budget (settings.SWAP_CYCLE_TIME_BUDGET seconds, 0 for no
+limit) or a result limit and report whether they were complete. Because
+shorter rotations come first, a cut-off search keeps the most practical
+ones.
+"""
+import time
+from itertools import product
+
+from django.conf import settings
+
+from users.models import MyUser, PersonalProfile
+from .triangle_swap_utils import load_triangle_buckets
+
+DEFAULT_MAX_LENGTH = 5
+DEFAULT_TIME_BUDGET = 10.0
+
+
+class CycleSearchTimeout(Exception):
+    """Raised inside the search once the time budget is spent."""
+
+
+def get_max_length(max_length=None):
+    return max_length or getattr(settings, 'SWAP_CYCLE_MAX_LENGTH', DEFAULT_MAX_LENGTH)
+
+
+def get_time_budget(time_budget=None):
+    if time_budget is not None:
+        return time_budget
+    return getattr(settings, 'SWAP_CYCLE_TIME_BUDGET', DEFAULT_TIME_BUDGET)
+
+
+def get_deadline(time_budget=None):
+    """time.monotonic() value a search started now must finish by, or None."""
+    time_budget = get_time_budget(time_budget)
+    return time.monotonic() + time_budget if time_budget else None
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        raise CycleSearchTimeout()
+
+
+def build_county_graph(group):
+    """
+    Turn one bucket group from load_triangle_buckets() into the county
+    graph. Counties are numbered 0..n-1 in id order; the graph holds
+    'counties' (node -> county id), 'index' ({(x, y): [user ids]}),
+    'successors' / 'predecessors' (sorted node lists) and 'succ_mask' /
+    'pred_mask' (the same as bitsets).
+
+    Wanting one's own current county adds no edge (no self-loops), so
+    same-county pairs are left to find_matches(). Counties that cannot lie
+    on a cycle (no way in or no way out) are trimmed away, so the DFS
+    never walks into dead ends.
+    """
+    buckets = {}
+    for user_id, wanted in group['wants'].items():
+        x = group['county'][user_id]
+        for y in wanted:
+            if y != x:
+                buckets.setdefault((x, y), []).append(user_id)
+
+    edges = set(buckets)
+    while True:
+        sources = {x for x, _ in edges}
+        targets = {y for _, y in edges}
+        kept = {(x, y) for x, y in edges if x in targets and y in sources}
+        if kept == edges:
+            break
+        edges = kept
+
+    counties = sorted({x for x, _ in edges})
+    node = {county_id: i for i, county_id in enumerate(counties)}
+    successors = [[] for _ in counties]
+    predecessors = [[] for _ in counties]
+    succ_mask = [0] * len(counties)
+    pred_mask = [0] * len(counties)
+    index = {}
+    for x, y in sorted(edges):
+        i, j = node[x], node[y]
+        successors[i].append(j)
+        predecessors[j].append(i)
+        succ_mask[i] |= 1 << j
+        pred_mask[j] |= 1 << i
+        index[(i, j)] = sorted(buckets[(x, y)])
+    return {
+        'counties': counties,
+        'node': node,
+        'index': index,
+        'successors': successors,
+        'predecessors': predecessors,
+        'succ_mask': succ_mask,
+        'pred_mask': pred_mask,
+    }
+
+
+def _distances_to(graph, target, allowed):
+    """Fewest edges from each node in the ``allowed`` bitset to ``target``."""
+    distances = {target: 0}
+    frontier = [target]
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            for previous in graph['predecessors'][node]:
+                if previous not in distances and (allowed >> previous) & 1:
+                    distances[previous] = distances[node] + 1
+                    next_frontier.append(previous)
+        frontier = next_frontier
+    return distances
+
+
+def _prefixes(graph, path, used, length, allowed, distances, deadline):
+    """
+    Extend ``path`` (a node list, ``used`` its bitset) to every simple path
+    of ``length - 1`` nodes through ``allowed`` nodes from which the start
+    can still be reached in the one closing step that is left.
+    """
+    if len(path) == length - 1:
+        yield path, used
+        return
+    _check_deadline(deadline)
+    steps_left = length - len(path)
+    for nxt in graph['successors'][path[-1]]:
+        if (used >> nxt) & 1 or not (allowed >> nxt) & 1:
+            continue
+        if distances.get(nxt, steps_left + 1) > steps_left:
+            continue
+        yield from _prefixes(graph, path + [nxt], used | (1 << nxt), length, allowed, distances, deadline)
+
+
+def _closing_nodes(graph, path, used, allowed):
+    """Nodes that close ``path`` into a cycle back to path[0]."""
+    candidates = graph['succ_mask'][path[-1]] & graph['pred_mask'][path[0]] & allowed & ~used
+    while candidates:
+        low = candidates & -candidates
+        yield low.bit_length() - 1
+        candidates ^= low
+
+
+def _cycles_of_length(graph, start, length, deadline):
+    """Simple cycles of exactly ``length`` nodes whose smallest node is ``start``."""
+    allowed = ~((1 << (start + 1)) - 1)
+    distances = _distances_to(graph, start, allowed)
+    if length == 2:
+        prefixes = [([start], 1 << start)]
+    else:
+        prefixes = _prefixes(graph, [start], 1 << start, length, allowed, distances, deadline)
+    for path, used in prefixes:
+        for last in _closing_nodes(graph, path, used, allowed):
+            yield path + [last]
+
+
+def iter_county_cycles(graph, max_length, deadline=None, min_length=2):
+    """
+    Yield every simple county cycle of min_length..max_length counties
+    once, as a tuple of graph nodes starting from the smallest, shortest
+    cycles first.
+    """
+    for length in range(min_length, max_length + 1):
+        for start in range(len(graph['counties'])):
+            for cycle in _cycles_of_length(graph, start, length, deadline):
+                yield tuple(cycle)
+
+
+def _buckets(graph, cycle):
+    index = graph['index']
+    return [index[(cycle[i], cycle[(i + 1) % len(cycle)])] for i in range(len(cycle))]
+
+
+def _canonical(rotation):
+    start = rotation.index(min(rotation))
+    return rotation[start:] + rotation[:start]
+
+
+def _expand(graph, cycle, deadline, skip_first=False):
+    buckets = _buckets(graph, cycle)
+    if skip_first:
+        buckets = buckets[1:]
+    for count, rotation in enumerate(product(*buckets)):
+        if count % 1000 == 999:
+            _check_deadline(deadline)
+        yield rotation
+
+
+def iter_cycles(groups, max_length=None, deadline=None):
+    """
+    Lazily yield teacher rotations (tuples of user ids, smallest first) of
+    2..max_length teachers over ``groups`` from load_triangle_buckets(),
+    shortest first within each group. Raises CycleSearchTimeout when
+    ``deadline`` (time.monotonic()) passes.
+    """
+    max_length = get_max_length(max_length)
+    for group in groups.values():
+        graph = build_county_graph(group)
+        for cycle in iter_county_cycles(graph, max_length, deadline):
+            for rotation in _expand(graph, cycle, deadline):
+                yield _canonical(rotation)
+
+
+def count_cycles(groups, max_length=None, deadline=None):
+    """
+    {length: (county cycles, teacher rotations)} without expanding the
+    rotations, for sizing and benchmarks.
+
+    The last county of each cycle is never enumerated: for a prefix
+    s .. v, the closing counts are sum over w of A[v, w] * A[w, s] for all
+    w above s (precomputed per start), minus the w already on the prefix.
+    """
+    max_length = get_max_length(max_length)
+    counts = {}
+    for group in groups.values():
+        graph = build_county_graph(group)
+        size = {edge: len(users) for edge, users in graph['index'].items()}
+        nodes = range(len(graph['counties']))
+        for length in range(2, max_length + 1):
+            county_cycles = rotations = 0
+            for start in nodes:
+                allowed = ~((1 << (start + 1)) - 1)
+                distances = _distances_to(graph, start, allowed)
+                # Two-step closings v -> w -> start through any allowed w
+                closing = {}
+                for w in graph['predecessors'][start]:
+                    if w <= start:
+                        continue
+                    for v in graph['predecessors'][w]:
+                        paths, weight = closing.get(v, (0, 0))
+                        closing[v] = (paths + 1, weight + size[(v, w)] * size[(w, start)])
+                if length == 2:
+                    prefixes = [([start], 1 << start)]
+                else:
+                    prefixes = _prefixes(graph, [start], 1 << start, length, allowed, distances, deadline)
+                for path, _ in prefixes:
+                    v = path[-1]
+                    paths, weight = closing.get(v, (0, 0))
+                    for u in path[1:-1]:
+                        # Closing through a county already on the path
+                        if (v, u) in size and (u, start) in size:
+                            paths -= 1
+                            weight -= size[(v, u)] * size[(u, start)]
+                    if not paths:
+                        continue
+                    prefix_weight = 1
+                    for i in range(len(path) - 1):
+                        prefix_weight *= size[(path[i], path[i + 1])]
+                    county_cycles += paths
+                    rotations += prefix_weight * weight
+            if county_cycles:
+                previous_cycles, previous_rotations = counts.get(length, (0, 0))
+                counts[length] = (previous_cycles + county_cycles, previous_rotations + rotations)
+    return counts
+
+
+def _run(iterator, limit):
+    """Drain ``iterator`` within its deadline and ``limit``. Returns the result dict."""
+    started = time.monotonic()
+    cycles = []
+    complete = True
+    try:
+        for cycle in iterator:
+            if limit is not None and len(cycles) >= limit:
+                complete = False
+                break
+            cycles.append(cycle)
+    except CycleSearchTimeout:
+        complete = False
+    return {
+        'cycles': cycles,
+        'complete': complete,
+        'elapsed': time.monotonic() - started,
+    }
+
+
+def level_teachers(level):
+    """Default candidates: active teachers of ``level`` with swap preferences."""
+    return MyUser.objects.filter(
+        is_active=True,
+        profile__level=level,
+        swappreference__isnull=False,
+    )
+
+
+def _is_secondary(level):
+    name = level.name.lower()
+    return 'secondary' in name or 'high' in name
+
+
+def find_cycles_for_level(level, max_length=None, time_budget=None, limit=None, teachers=None):
+    """
+    Every rotation of 2..max_length teachers within a level.
+
+    ``teachers`` is the candidate queryset, by default every active teacher
+    of the level with swap preferences. Returns {'cycles': [user id tuples],
+    'complete': False if the time budget or ``limit`` cut the search short,
+    'elapsed': seconds}.
+    """
+    if teachers is None:
+        teachers = level_teachers(level)
+    deadline = get_deadline(time_budget)
+    groups = load_triangle_buckets(teachers, secondary=_is_secondary(level))
+    return _run(iter_cycles(groups, max_length, deadline), limit)
+
+
+def iter_cycles_for_user(user_id, group, max_length=None, deadline=None):
+    """
+    Lazily yield the rotations through ``user_id`` within one bucket group,
+    as tuples starting with ``user_id``, shortest first.
+    """
+    max_length = get_max_length(max_length)
+    graph = build_county_graph(group)
+    home = graph['node'].get(group['county'].get(user_id))
+    if home is None:
+        return
+    wanted = {graph['node'][c] for c in group['wants'][user_id] if c in graph['node']}
+    firsts = [first for first in graph['successors'][home] if first in wanted]
+    allowed = ~(1 << home)
+    distances = _distances_to(graph, home, allowed)
+
+    for length in range(2, max_length + 1):
+        for first in firsts:
+            if length == 2:
+                cycles = [[home, first]] if (graph['succ_mask'][first] >> home) & 1 else []
+            else:
+                used = (1 << home) | (1 << first)
+                cycles = (
+                    path + [last]
+                    for path, used in _prefixes(graph, [home, first], used, length, allowed, distances, deadline)
+                    for last in _closing_nodes(graph, path, used, allowed)
+                )
+            for cycle in cycles:
+                for rest in _expand(graph, cycle, deadline, skip_first=True):
+                    yield (user_id,) + rest
+
+
+def find_cycles_for_user(user, max_length=None, time_budget=None, limit=None, teachers=None):
+    """
+    The rotations of 2..max_length teachers that include ``user``, each
+    starting with the user. Same return value as find_cycles_for_level().
+
+    Only the user's group is loaded (their subject fingerprint on
+    secondary levels).
+    """
+    profile = getattr(user, 'profile', None)
+    empty = {'cycles': [], 'complete': True, 'elapsed': 0.0}
+    if not profile or not profile.level_id:
+        return empty
+
+    secondary = _is_secondary(profile.level)
+    if teachers is None:
+        teachers = level_teachers(profile.level)
+    fingerprint = None
+    if secondary:
+        # Read from the database: signals update the column, not instances
+        fingerprint = PersonalProfile.objects.filter(
+            pk=profile.pk
+        ).values_list('subject_fingerprint', flat=True).first()
+        if not fingerprint:
+            return empty
+        teachers = teachers.filter(profile__subject_fingerprint=fingerprint)
+
+    deadline = get_deadline(time_budget)
+    groups = load_triangle_buckets(teachers, secondary=secondary)
+    group = groups.get(fingerprint)
+    if group is None or user.id not in group['county']:
+        return empty
+    return _run(iter_cycles_for_user(user.id, group, max_length, deadline), limit)
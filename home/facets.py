@@ -0,0 +1,96 @@
+"""
+How many active listings each location filter option leads to.
+
+The counts cover active, unarchived Swaps (by the swap's county,
+constituency and ward, split by the poster's level) and FastSwaps (by
+their current location, split by level). Both come from one grouped
+query - a UNION ALL of the two GROUP BYs - rolled up per county,
+constituency and ward in Python.
+
+The result is cached under the public cache version (home.public_cache), a
+CacheVersion row that home.signals bumps on every Swaps, FastSwap and
+poster profile write. Each worker caches its own copy, but they all key it
+on that shared row, so the next request after a change recounts whichever
+worker answers it. The counts are the same for every viewer: a teacher's
+own swaps are included.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Value
+
+from . import geo_cache
+from .models import FastSwap, Swaps
+from .public_cache import PUBLIC_CACHE_SECONDS, public_cache_version
+
+DIMENSIONS = ('county', 'constituency', 'ward')
+
+# Listing -> (location fields in DIMENSIONS order, level field)
+_SOURCES = {
+    'swaps': (('county_id', 'constituency_id', 'ward_id'), 'user__profile__level_id'),
+    'fast_swaps': (('current_county_id', 'current_constituency_id', 'current_ward_id'), 'level_id'),
+}
+
+
+def _grouped(queryset, listing):
+    locations, level = _SOURCES[listing]
+    return queryset.annotate(
+        facet_listing=Value(listing),
+        facet_county=F(locations[0]),
+        facet_constituency=F(locations[1]),
+        facet_ward=F(locations[2]),
+        facet_level=F(level),
+    ).values(
+        'facet_listing', 'facet_county', 'facet_constituency', 'facet_ward', 'facet_level',
+    ).annotate(rows=Count('id')).order_by()
+
+
+def count_facets():
+    """
+    Recount from the database, one query:
+    {listing: {dimension: {location_id: {'total': n, 'levels': {level_id: n}}}}}.
+    """
+    counts = {listing: {dimension: {} for dimension in DIMENSIONS} for listing in _SOURCES}
+    groups = _grouped(Swaps.objects.filter(archived=False, status=True), 'swaps').union(
+        _grouped(FastSwap.objects.all(), 'fast_swaps'), all=True,
+    )
+    for group in groups:
+        for dimension in DIMENSIONS:
+            location_id = group[f'facet_{dimension}']
+            if location_id is None:
+                continue
+            entry = counts[group['facet_listing']][dimension].setdefault(location_id, {'total': 0, 'levels': {}})
+            entry['total'] += group['rows']
+            if group['facet_level'] is not None:
+                entry['levels'][group['facet_level']] = entry['levels'].get(group['facet_level'], 0) + group['rows']
+    return counts
+
+
+def facet_counts():
+    """count_facets(), cached until the next listing or profile change."""
+    return cache.get_or_set(f'listing_facets:{public_cache_version()}', count_facets, PUBLIC_CACHE_SECONDS)
+
+
+def level_ids(name_part):
+    """Ids of the levels whose name contains ``name_part`` ('primary', 'secondary')."""
+    return [level['id'] for level in geo_cache.levels() if name_part in level['name'].lower()]
+
+
+def option_counts(listing, levels=None):
+    """
+    {dimension: {location_id: count}} for one listing, limited to the
+    given level ids (None: every level, and posters without one).
+    """
+    options = {}
+    for dimension, entries in facet_counts()[listing].items():
+        if levels is None:
+            options[dimension] = {location_id: entry['total'] for location_id, entry in entries.items()}
+        else:
+            options[dimension] = {
+                location_id: sum(entry['levels'].get(level_id, 0) for level_id in levels)
+                for location_id, entry in entries.items()
+            }
+    return options
+
+
+def with_counts(entries, counts):
+    """Copies of geo_cache entries with a 'count' for the dropdown labels."""
+    return [{**entry, 'count': counts.get(entry['id'], 0)} for entry in entries]
@@ -0,0 +1,169 @@
+"""
+In-memory graph of everyone on a level who can take part in a swap:
+registered teachers and FastSwap entries alike.
+
+Both kinds of entity are reduced to the same node - current county, wanted
+counties and subject fingerprint - keyed by ('user', id) or ('fastswap',
+id), the entity types used by the FastSwap detail page. A graph is built
+in four queries and matching any number of FastSwaps against it touches
+the database only to load the matched objects, so it is built once per
+batch (see match_fast_swaps()).
+
+Matching rules are those of the FastSwap matchers in home.fast_swap_utils:
+
+- teachers must be active and have swap preferences; both kinds need a
+  current county
+- on secondary levels only entities with the same subject fingerprint
+  match, and entities without subjects match nobody
+"""
+from users.models import MyUser, PersonalProfile
+from .match_engine import is_secondary_level
+from .models import FastSwap, SwapPreference
+
+USER = 'user'
+FAST_SWAP = 'fastswap'
+
+
+def build_fast_swap_graph(level):
+    """
+    Load every teacher and FastSwap of ``level`` as graph nodes.
+
+    Returns {'level_id', 'secondary', 'nodes': {key: {'county', 'wants':
+    frozenset of county ids, 'fingerprint'}}, 'by_county': {(fingerprint,
+    county_id): sorted keys}}.
+    """
+    secondary = is_secondary_level(level)
+    nodes = {}
+
+    wanted = {}
+    users = []
+    for user_id, county_id, fingerprint, pref_id, desired in PersonalProfile.objects.filter(
+        level=level,
+        current_county__isnull=False,
+        user__is_active=True,
+        user__swappreference__isnull=False,
+    ).values_list(
+        'user_id', 'current_county_id', 'subject_fingerprint',
+        'user__swappreference__id', 'user__swappreference__desired_county_id',
+    ):
+        wanted[pref_id] = {desired} if desired else set()
+        users.append((user_id, county_id, fingerprint, pref_id))
+    for pref_id, county_id in SwapPreference.open_to_all.through.objects.filter(
+        swappreference__user__profile__level=level,
+    ).values_list('swappreference_id', 'counties_id'):
+        if pref_id in wanted:
+            wanted[pref_id].add(county_id)
+    for user_id, county_id, fingerprint, pref_id in users:
+        nodes[(USER, user_id)] = {'county': county_id, 'wants': frozenset(wanted[pref_id]), 'fingerprint': fingerprint}
+
+    wanted = {}
+    fast_swaps = []
+    for fs_id, county_id, fingerprint, preferred in FastSwap.objects.filter(
+        level=level,
+        current_county__isnull=False,
+    ).values_list('id', 'current_county_id', 'subject_fingerprint', 'most_preferred_id'):
+        wanted[fs_id] = {preferred} if preferred else set()
+        fast_swaps.append((fs_id, county_id, fingerprint))
+    for fs_id, county_id in FastSwap.acceptable_county.through.objects.filter(
+        fastswap__level=level,
+    ).values_list('fastswap_id', 'counties_id'):
+        if fs_id in wanted:
+            wanted[fs_id].add(county_id)
+    for fs_id, county_id, fingerprint in fast_swaps:
+        nodes[(FAST_SWAP, fs_id)] = {'county': county_id, 'wants': frozenset(wanted[fs_id]), 'fingerprint': fingerprint}
+
+    by_county = {}
+    for key, node in nodes.items():
+        if not secondary:
+            node['fingerprint'] = ''
+        elif not node['fingerprint']:
+            continue
+        by_county.setdefault((node['fingerprint'], node['county']), []).append(key)
+    for keys in by_county.values():
+        keys.sort()
+
+    return {'level_id': level.id, 'secondary': secondary, 'nodes': nodes, 'by_county': by_county}
+
+
+def _wanted_nodes(graph, node):
+    """Keys of the nodes sitting in a county ``node`` wants, in key order."""
+    found = []
+    for county_id in sorted(node['wants']):
+        found.extend(graph['by_county'].get((node['fingerprint'], county_id), ()))
+    return found
+
+
+def mutual_keys(graph, key):
+    """Keys of the nodes that match ``key`` both ways, sorted."""
+    node = graph['nodes'].get(key)
+    if node is None or (graph['secondary'] and not node['fingerprint']):
+        return []
+    return sorted(
+        other for other in _wanted_nodes(graph, node)
+        if other != key and node['county'] in graph['nodes'][other]['wants']
+    )
+
+
+def triangle_keys(graph, key):
+    """
+    (b, c) key pairs closing a rotation key -> b -> c -> key: key wants
+    b's county, b wants c's county and c wants key's county. Each set of
+    three is listed once.
+    """
+    node = graph['nodes'].get(key)
+    if node is None or (graph['secondary'] and not node['fingerprint']):
+        return []
+    nodes = graph['nodes']
+    triangles = []
+    seen = set()
+    for b in _wanted_nodes(graph, node):
+        if b == key:
+            continue
+        for c in _wanted_nodes(graph, nodes[b]):
+            if c == key or c == b or node['county'] not in nodes[c]['wants']:
+                continue
+            members = frozenset((b, c))
+            if members not in seen:
+                seen.add(members)
+                triangles.append((b, c))
+    return triangles
+
+
+def load_entities(keys):
+    """{key: MyUser or FastSwap} for ``keys``, two queries at most."""
+    ids = {USER: set(), FAST_SWAP: set()}
+    for kind, entity_id in keys:
+        ids[kind].add(entity_id)
+    entities = {}
+    if ids[USER]:
+        for user in MyUser.objects.filter(id__in=ids[USER]).select_related(
+            'profile__school__ward__constituency__county',
+            'profile__current_county',
+            'swappreference__desired_county',
+        ):
+            entities[(USER, user.id)] = user
+    if ids[FAST_SWAP]:
+        for fs in FastSwap.objects.filter(id__in=ids[FAST_SWAP]).select_related('current_county', 'most_preferred'):
+            entities[(FAST_SWAP, fs.id)] = fs
+    return entities
+
+
+def match_fast_swaps(level, fast_swap_ids=None, graph=None):
+    """
+    Mutual and triangle matches for the FastSwaps of ``level`` (or only
+    ``fast_swap_ids``) against one graph.
+
+    Returns {fast_swap_id: {'mutual': [keys], 'triangles': [(b, c)]}};
+    resolve keys with load_entities().
+    """
+    if graph is None:
+        graph = build_fast_swap_graph(level)
+    if fast_swap_ids is None:
+        fast_swap_ids = sorted(entity_id for kind, entity_id in graph['nodes'] if kind == FAST_SWAP)
+    return {
+        fs_id: {
+            'mutual': mutual_keys(graph, (FAST_SWAP, fs_id)),
+            'triangles': triangle_keys(graph, (FAST_SWAP, fs_id)),
+        }
+        for fs_id in fast_swap_ids
+    }
@@ -0,0 +1,298 @@
+"""
+Bulk FastSwap import from CSV or XLSX spreadsheets.
+
+Rows are streamed from the file and handled in chunks. Level, county,
+school and subject names are resolved against lookups loaded once per
+import (NameLookup), and each chunk is written in one transaction: the
+FastSwap rows with one bulk insert, then their acceptable-county and
+subject rows with one bulk insert each. Rows that fail validation are
+skipped and reported with their line number; the rest of the chunk is
+still written.
+
+Bulk inserts don't send signals, so the subject columns (home.subject_sets)
+are filled in before the insert, and at the end the stored matches of
+every level touched are marked stale (home.fast_swap_store) and the cached
+public pages retired (home.public_cache).
+
+Columns (header names are case-insensitive; list cells are separated by
+commas, semicolons or '|'):
+
+    names, phone, level, county      required
+    school, most_preferred, acceptable_counties, subjects
+"""
+import csv
+import io
+import re
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .activity_feed import rebuild_feed
+from .fast_swap_store import mark_level_stale
+from .models import Counties, FastSwap, Level, Schools, Subject
+from .public_cache import bump_public_cache
+from .subject_sets import subject_bitmask, subject_fingerprint
+
+DEFAULT_CHUNK_SIZE = 500
+
+REQUIRED_COLUMNS = ('names', 'phone', 'level', 'county')
+COLUMN_ALIASES = {
+    'name': 'names',
+    'full_name': 'names',
+    'phone_number': 'phone',
+    'current_county': 'county',
+    'preferred_county': 'most_preferred',
+    'acceptable_county': 'acceptable_counties',
+    'subject': 'subjects',
+}
+
+_LIST_SEPARATOR = re.compile(r'[,;|]')
+
+
+def normalize_name(value):
+    """Case- and whitespace-insensitive form of a name, for lookups."""
+    return ' '.join(str(value or '').split()).casefold()
+
+
+def split_list(value):
+    return [item.strip() for item in _LIST_SEPARATOR.split(str(value or '')) if item.strip()]
+
+
+def normalize_header(value):
+    column = normalize_name(value).replace(' ', '_').replace('-', '_')
+    return COLUMN_ALIASES.get(column, column)
+
+
+class NameLookup:
+    """
+    Names -> ids for levels, counties, schools and subjects. Each table
+    is loaded with one query the first time it is needed.
+    """
+
+    def __init__(self):
+        self._levels = None
+        self._counties = None
+        self._schools = None
+        self._subjects = None
+
+    def level(self, name):
+        """Level id by name or code; a unique partial name match also counts."""
+        if self._levels is None:
+            self._levels = list(Level.objects.values_list('id', 'name', 'code'))
+        key = normalize_name(name)
+        for level_id, level_name, code in self._levels:
+            if key in (normalize_name(level_name), normalize_name(code)):
+                return level_id
+        partial = [level_id for level_id, level_name, _ in self._levels if key and key in normalize_name(level_name)]
+        return partial[0] if len(partial) == 1 else None
+
+    def county(self, name):
+        if self._counties is None:
+            self._counties = {normalize_name(name): county_id for county_id, name in Counties.objects.values_list('id', 'name')}
+        return self._counties.get(normalize_name(name))
+
+    def schools(self, name):
+        """[(school_id, level_id, ward_id, constituency_id, county_id)] of the schools with this name."""
+        if self._schools is None:
+            self._schools = {}
+            for row in Schools.objects.values_list(
+                'id', 'name', 'level_id', 'ward_id', 'ward__constituency_id', 'ward__constituency__county_id',
+            ):
+                self._schools.setdefault(normalize_name(row[1]), []).append((row[0],) + row[2:])
+        return self._schools.get(normalize_name(name), [])
+
+    def subject(self, level_id, name):
+        if self._subjects is None:
+            self._subjects = {
+                (level, normalize_name(name)): subject_id
+                for subject_id, level, name in Subject.objects.values_list('id', 'level_id', 'name')
+            }
+        return self._subjects.get((level_id, normalize_name(name)))
+
+
+def iter_csv_rows(handle):
+    """Yield (line number, {column: value}) from a text file of CSV."""
+    reader = csv.reader(handle)
+    header = None
+    for row in reader:
+        if header is None:
+            header = [normalize_header(cell) for cell in row]
+            continue
+        if any(cell.strip() for cell in row):
+            yield reader.line_num, dict(zip(header, (cell.strip() for cell in row)))
+
+
+def iter_xlsx_rows(handle):
+    """Yield (row number, {column: value}) from the first sheet of an XLSX file."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('Reading .xlsx files needs openpyxl (pip install openpyxl); CSV files work without it.')
+
+    workbook = load_workbook(handle, read_only=True, data_only=True)
+    try:
+        header = None
+        for number, row in enumerate(workbook.worksheets[0].iter_rows(values_only=True), start=1):
+            cells = ['' if cell is None else str(cell).strip() for cell in row]
+            if header is None:
+                header = [normalize_header(cell) for cell in cells]
+                continue
+            if any(cells):
+                yield number, dict(zip(header, cells))
+    finally:
+        workbook.close()
+
+
+def iter_rows(handle, filename):
+    """Rows of an uploaded or opened binary file, by extension."""
+    if filename.lower().endswith('.xlsx'):
+        return iter_xlsx_rows(handle)
+    if filename.lower().endswith('.csv'):
+        return iter_csv_rows(io.TextIOWrapper(handle, encoding='utf-8-sig', newline=''))
+    raise ValueError(f'Unsupported file type: {filename}. Use .csv or .xlsx.')
+
+
+def parse_row(row, lookup):
+    """
+    Validate one row. Returns (fields, acceptable county ids, subject ids,
+    errors); fields are FastSwap constructor arguments.
+    """
+    errors = []
+    for column in REQUIRED_COLUMNS:
+        if not row.get(column):
+            errors.append(f'{column} is required')
+    if errors:
+        return None, [], [], errors
+
+    fields = {'names': row['names'][:255], 'phone': row['phone'][:255]}
+    level_id = lookup.level(row['level'])
+    if level_id is None:
+        errors.append(f"Unknown level '{row['level']}'")
+    county_id = lookup.county(row['county'])
+    if county_id is None:
+        errors.append(f"Unknown county '{row['county']}'")
+    fields['level_id'] = level_id
+    fields['current_county_id'] = county_id
+
+    if row.get('most_preferred'):
+        fields['most_preferred_id'] = lookup.county(row['most_preferred'])
+        if fields['most_preferred_id'] is None:
+            errors.append(f"Unknown county '{row['most_preferred']}'")
+
+    if row.get('school') and level_id and county_id:
+        schools = [
+            school for school in lookup.schools(row['school'])
+            if school[1] == level_id and school[4] == county_id
+        ]
+        if len(schools) == 1:
+            school_id, _, ward_id, constituency_id, _ = schools[0]
+            fields.update(school_id=school_id, current_ward_id=ward_id, current_constituency_id=constituency_id)
+        elif schools:
+            errors.append(f"School '{row['school']}' is ambiguous in {row['county']}")
+        else:
+            errors.append(f"Unknown school '{row['school']}' for this level in {row['county']}")
+
+    acceptable = []
+    for name in split_list(row.get('acceptable_counties')):
+        acceptable_id = lookup.county(name)
+        if acceptable_id is None:
+            errors.append(f"Unknown county '{name}'")
+        elif acceptable_id not in acceptable:
+            acceptable.append(acceptable_id)
+
+    subjects = []
+    for name in split_list(row.get('subjects')):
+        subject_id = lookup.subject(level_id, name)
+        if subject_id is None:
+            errors.append(f"Unknown subject '{name}' for this level")
+        elif subject_id not in subjects:
+            subjects.append(subject_id)
+
+    return fields, acceptable, subjects, errors
+
+
+def _write_chunk(entries):
+    """
+    Insert one chunk of (fields, acceptable, subjects) in a transaction.
+    Returns the number of FastSwaps created.
+    """
+    with transaction.atomic():
+        last_id = FastSwap.objects.aggregate(last=Max('id'))['last'] or 0
+        fast_swaps = [
+            FastSwap(subject_fingerprint=subject_fingerprint(subjects), subject_bits=subject_bitmask(subjects), **fields)
+            for fields, _, subjects in entries
+        ]
+        FastSwap.objects.bulk_create(fast_swaps)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # MySQL: recover the new ids in insert order
+            queues = {}
+            for fs_id, names, phone, level_id in FastSwap.objects.filter(
+                id__gt=last_id, phone__in={fs.phone for fs in fast_swaps},
+            ).order_by('id').values_list('id', 'names', 'phone', 'level_id'):
+                queues.setdefault((names, phone, level_id), []).append(fs_id)
+            for fs in fast_swaps:
+                fs.id = queues[(fs.names, fs.phone, fs.level_id)].pop(0)
+
+        AcceptableCounty = FastSwap.acceptable_county.through
+        FastSwapSubject = FastSwap.subjects.through
+        AcceptableCounty.objects.bulk_create([
+            AcceptableCounty(fastswap_id=fs.id, counties_id=county_id)
+            for fs, (_, acceptable, _) in zip(fast_swaps, entries)
+            for county_id in acceptable
+        ], batch_size=1000)
+        FastSwapSubject.objects.bulk_create([
+            FastSwapSubject(fastswap_id=fs.id, subject_id=subject_id)
+            for fs, (_, _, subjects) in zip(fast_swaps, entries)
+            for subject_id in subjects
+        ], batch_size=1000)
+    return len(fast_swaps)
+
+
+def import_fast_swaps(rows, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, lookup=None):
+    """
+    Import (line number, {column: value}) rows, e.g. from iter_rows().
+
+    A row whose phone is already listed on the same level, in the
+    database or earlier in the file, is reported as a duplicate.
+
+    Returns {'rows': rows read, 'created': FastSwaps written (0 on a dry
+    run), 'valid': rows that passed validation, 'errors': [{'line',
+    'names', 'errors': [messages]}]}.
+    """
+    lookup = lookup or NameLookup()
+    seen = set(FastSwap.objects.values_list('phone', 'level_id'))
+    levels = set()
+    result = {'rows': 0, 'created': 0, 'valid': 0, 'errors': []}
+
+    chunk = []
+
+    def flush():
+        if chunk and not dry_run:
+            result['created'] += _write_chunk(chunk)
+        chunk.clear()
+
+    for line, row in rows:
+        result['rows'] += 1
+        fields, acceptable, subjects, errors = parse_row(row, lookup)
+        if not errors:
+            key = (fields['phone'], fields['level_id'])
+            if key in seen:
+                errors.append(f"{fields['phone']} already has a FastSwap on this level")
+            seen.add(key)
+        if errors:
+            result['errors'].append({'line': line, 'names': row.get('names', ''), 'errors': errors})
+            continue
+        result['valid'] += 1
+        levels.add(fields['level_id'])
+        chunk.append((fields, acceptable, subjects))
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    if not dry_run:
+        for level_id in levels:
+            mark_level_stale(level_id)
+        if result['created']:
+            bump_public_cache()
+            rebuild_feed(('fastswap',))
+    return result
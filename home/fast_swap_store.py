@@ -0,0 +1,112 @@
+"""
+Stored FastSwap matches.
+
+The detail page of a FastSwap reads its mutual and triangle matches from
+FastSwapMatchCache instead of running the matchers on every view. A
+FastSwap's matches can change whenever any teacher or FastSwap on its
+level changes, so home.signals marks every stored row of the level stale
+(one UPDATE) and the row is recomputed against a fresh level graph on its
+next read. `manage.py match_fast_swaps --store` fills the store for whole
+levels in one pass.
+
+Rows only hold [type, id] keys. On read, entities that no longer exist or
+have moved to another level since the row was computed are dropped.
+"""
+from django.db import connection
+
+from users.models import PersonalProfile
+
+from .fast_swap_graph import FAST_SWAP, USER, load_entities, match_fast_swaps
+from .models import FastSwapMatchCache
+
+
+def write_fast_swap_matches(matches):
+    """
+    Replace the stored rows of the FastSwaps in ``matches``, a result of
+    match_fast_swaps(). Returns the new FastSwapMatchCache rows.
+
+    Rows are upserted, so two requests computing the same FastSwap (a
+    first view racing another, or the level rebuild) both succeed.
+    """
+    rows = [
+        FastSwapMatchCache(
+            fast_swap_id=fs_id,
+            mutual=[list(key) for key in found['mutual']],
+            triangles=[[list(b), list(c)] for b, c in found['triangles']],
+        )
+        for fs_id, found in matches.items()
+    ]
+    FastSwapMatchCache.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+        unique_fields=['fast_swap'] if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=['mutual', 'triangles', 'is_stale', 'computed_at'],
+    )
+    return rows
+
+
+def store_fast_swap_matches(level, fast_swap_ids=None, graph=None):
+    """
+    Compute and store the matches of the FastSwaps of ``level`` (or only
+    ``fast_swap_ids``). Returns the new FastSwapMatchCache rows.
+    """
+    return write_fast_swap_matches(match_fast_swaps(level, fast_swap_ids, graph))
+
+
+def mark_level_stale(level_id):
+    """Mark the stored matches of every FastSwap on a level stale."""
+    if level_id:
+        FastSwapMatchCache.objects.filter(fast_swap__level_id=level_id, is_stale=False).update(is_stale=True)
+
+
+def mark_user_level_stale(user_id, previous_level_id=None):
+    """
+    Mark stale the FastSwaps on the level of a teacher that changed, and
+    on ``previous_level_id`` when the teacher has just left it.
+    """
+    level_id = PersonalProfile.objects.filter(user_id=user_id).values_list('level_id', flat=True).first()
+    mark_level_stale(level_id)
+    if previous_level_id != level_id:
+        mark_level_stale(previous_level_id)
+
+
+def _on_level(key, entity, level_id):
+    if key[0] == FAST_SWAP:
+        return entity.level_id == level_id
+    profile = getattr(entity, 'profile', None)
+    return entity.is_active and profile is not None and profile.level_id == level_id
+
+
+def get_fast_swap_matches(fs, recompute=False):
+    """
+    Stored matches of ``fs``, recomputed first when missing, stale or
+    ``recompute`` is set.
+
+    Returns {'fast_swaps': [FastSwap], 'users': [MyUser], 'triangles':
+    [{'entity_b': {'type', 'obj'}, 'entity_c': {...}}], 'computed_at'},
+    the shapes of the matchers in home.fast_swap_utils.
+    """
+    cache = None if recompute else FastSwapMatchCache.objects.filter(fast_swap_id=fs.id).first()
+    if cache is None or cache.is_stale:
+        cache = store_fast_swap_matches(fs.level, [fs.id])[0]
+
+    mutual = [tuple(key) for key in cache.mutual]
+    triangles = [(tuple(b), tuple(c)) for b, c in cache.triangles]
+    entities = load_entities(set(mutual) | {key for pair in triangles for key in pair})
+    entities = {key: entity for key, entity in entities.items() if _on_level(key, entity, fs.level_id)}
+
+    return {
+        'fast_swaps': [entities[key] for key in mutual if key[0] == FAST_SWAP and key in entities],
+        'users': [entities[key] for key in mutual if key[0] == USER and key in entities],
+        'triangles': [
+            {
+                'entity_b': {'type': b[0], 'obj': entities[b]},
+                'entity_c': {'type': c[0], 'obj': entities[c]},
+            }
+            for b, c in triangles
+            if b in entities and c in entities
+        ],
+        'computed_at': cache.computed_at,
+    }
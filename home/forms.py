@@ -1,4 +1,5 @@
 from django import forms
+from .geo_cache import counties, constituencies, levels, subjects, use_cached_choices, wards
 from .models import MySubject, Subject, Swaps, Counties, Constituencies, Wards, Schools, Level, Curriculum, SwapPreference, FastSwap
 
 
@@ -14,6 +15,7 @@ class MySubjectForm(forms.ModelForm):
         # Filter subjects by user's level if available, otherwise show all
         if user_level:
             self.fields['subject'].queryset = Subject.objects.filter(level=user_level).order_by('name')
+            use_cached_choices(self.fields['subject'], subjects(user_level))
             
             # Get user's current subjects and set initial values
             current_subjects = Subject.objects.filter(
@@ -22,6 +24,7 @@ class MySubjectForm(forms.ModelForm):
             self.initial['subject'] = list(current_subjects)
         else:
             self.fields['subject'].queryset = Subject.objects.all().order_by('name')
+            use_cached_choices(self.fields['subject'], subjects())
     
     subject = forms.ModelMultipleChoiceField(
         queryset=Subject.objects.none(),  # Will be set in __init__
@@ -46,6 +49,12 @@ class FastSwapForm(forms.ModelForm):
             level__name="Secondary/High School"
         ).order_by('name')
         self.fields['current_county'].queryset = Counties.objects.all().order_by('name')
+        # Options come from the geography cache; the querysets validate
+        for field in ('most_preferred', 'acceptable_county', 'current_county'):
+            use_cached_choices(self.fields[field], counties())
+        use_cached_choices(self.fields['level'], levels())
+        secondary = [level['id'] for level in levels() if level['name'] == "Secondary/High School"]
+        use_cached_choices(self.fields['subjects'], subjects(secondary[0]) if secondary else [])
         
         # Make fields required
         self.fields['names'].required = True
@@ -77,6 +86,13 @@ class FastSwapForm(forms.ModelForm):
         elif self.instance.pk and self.instance.current_constituency:
             self.fields['current_ward'].queryset = Wards.objects.filter(constituency=self.instance.current_constituency).order_by('name')
 
+        use_cached_choices(self.fields['current_constituency'], constituencies(
+            self.data.get('current_county') if 'current_county' in self.data else self.instance.current_county_id
+        ))
+        use_cached_choices(self.fields['current_ward'], wards(
+            self.data.get('current_constituency') if 'current_constituency' in self.data else self.instance.current_constituency_id
+        ))
+
     class Meta:
         model = FastSwap
         fields = ['names', 'phone', 'school', 'current_county', 'current_constituency', 'current_ward', 'most_preferred', 'acceptable_county', 'level', 'subjects']
@@ -94,6 +110,21 @@ class FastSwapForm(forms.ModelForm):
         }
 
 
+
+class FastSwapImportForm(forms.Form):
+    file = forms.FileField(
+        label="Spreadsheet",
+        help_text="CSV or XLSX with columns names, phone, level, county and optionally school, most_preferred, acceptable_counties, subjects.",
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,.xlsx'}),
+    )
+    dry_run = forms.BooleanField(required=False, label="Only check the rows, don't import")
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Upload a .csv or .xlsx file.")
+        return upload
+
 class SwapForm(forms.ModelForm):
     gender = forms.ChoiceField(
         choices=Swaps.Gender,
@@ -151,6 +182,10 @@ class SwapForm(forms.ModelForm):
             except (ValueError, TypeError):
                 pass
 
+        use_cached_choices(self.fields['county'], counties())
+        use_cached_choices(self.fields['constituency'], constituencies(self.data.get('county')))
+        use_cached_choices(self.fields['ward'], wards(self.data.get('constituency')))
+
 
 class SchoolForm(forms.ModelForm):
     county = forms.ModelChoiceField(
@@ -191,6 +226,8 @@ class SchoolForm(forms.ModelForm):
         
         # Order the choices in the dropdowns
         self.fields['level'].queryset = Level.objects.all().order_by('name')
+        use_cached_choices(self.fields['level'], levels())
+        use_cached_choices(self.fields['county'], counties())
         self.fields['curriculum'].queryset = Curriculum.objects.all().order_by('name')
         
         # Set initial values if we're editing an existing school
@@ -317,6 +354,15 @@ class SwapPreferenceForm(forms.ModelForm):
                 pass
         elif self.instance.pk and self.instance.desired_constituency:
             self.fields['ward'].queryset = self.instance.desired_constituency.wards_set.order_by('name')
+
+        use_cached_choices(self.fields['county'], counties())
+        use_cached_choices(self.fields['selected_counties'], counties())
+        use_cached_choices(self.fields['constituency'], constituencies(
+            self.data.get('county') if 'county' in self.data else self.instance.desired_county_id
+        ))
+        use_cached_choices(self.fields['ward'], wards(
+            self.data.get('constituency') if 'constituency' in self.data else self.instance.desired_constituency_id
+        ))
         
         # Set initial values if editing an existing instance
         if self.instance.pk:
@@ -0,0 +1,95 @@
+"""
+The location tree and the level / subject taxonomy as one JSON bundle for
+the browser (static/js/geography.js), so cascading dropdowns need no
+request per change.
+
+``manage.py build_geo_bundle`` writes the bundle to GEO_BUNDLE_ROOT, one of
+the STATICFILES_DIRS, and collects it: the manifest storage gives it a
+content-hashed name, which WhiteNoise serves as immutable. It runs at
+deploy and at the end of populate_kenya_admin and load_subjects.
+
+Pages link to the bundle through {% geography_script %}. While the
+collected bundle matches the live data (an admin may have added a ward
+since the last build) the tag points at it; otherwise at
+GeographyBundleAPIView, which serves the same JSON from home.geo_cache.
+"""
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+from django.templatetags.static import static
+from django.urls import reverse
+
+from . import geo_cache
+
+BUNDLE_PATH = 'data/geography.json'
+
+_built = {'source': None, 'content': None, 'digest': None}
+
+
+def _rows(entries):
+    return [[entry['id'], entry['name']] for entry in entries]
+
+
+def build_bundle():
+    """
+    The bundle as a dict. Rows are [id, name] pairs (levels add their
+    code), grouped by parent id like the geo_cache lookups.
+    """
+    counties = geo_cache.counties()
+    constituencies = {county['id']: geo_cache.constituencies(county['id']) for county in counties}
+    levels = geo_cache.levels()
+    return {
+        'counties': _rows(counties),
+        'constituencies': {county_id: _rows(rows) for county_id, rows in constituencies.items()},
+        'wards': {
+            constituency['id']: _rows(geo_cache.wards(constituency['id']))
+            for rows in constituencies.values()
+            for constituency in rows
+        },
+        'levels': [[level['id'], level['name'], level['code']] for level in levels],
+        'subjects': {level['id']: _rows(geo_cache.subjects(level['id'])) for level in levels},
+    }
+
+
+def bundle_content():
+    """
+    The bundle serialized, byte for byte the same for the same data; kept
+    until geo_cache reloads.
+    """
+    source = geo_cache.snapshot()
+    if _built['source'] is not source:
+        content = json.dumps(build_bundle(), separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode()
+        _built.update(source=source, content=content, digest=hashlib.md5(content).hexdigest())
+    return _built['content']
+
+
+def write_bundle():
+    """Write the bundle into GEO_BUNDLE_ROOT; returns the file's path."""
+    path = os.path.join(settings.GEO_BUNDLE_ROOT, BUNDLE_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as bundle:
+        bundle.write(bundle_content())
+    return path
+
+
+def _collected_is_current():
+    if not isinstance(staticfiles_storage, ManifestFilesMixin):
+        return False
+    try:
+        stored = staticfiles_storage.stored_name(BUNDLE_PATH)
+    except ValueError:
+        # Not collected yet
+        return False
+    bundle_content()
+    # ManifestFilesMixin names files after the first 12 hex digits of their md5
+    return stored.endswith(f".{_built['digest'][:12]}.json")
+
+
+def bundle_url():
+    """Where pages should load the bundle from."""
+    if _collected_is_current():
+        return static(BUNDLE_PATH)
+    return f"{reverse('home:geography_bundle')}?v={geo_cache.geography_version()}"
@@ -0,0 +1,127 @@
+"""
+Process-local copy of the location tree (county -> constituency -> ward)
+and the level / subject taxonomy.
+
+Almost every page needs some of it for its dropdowns and it hardly ever
+changes, so each worker loads it once (five queries) and answers from
+memory after that. Entries are {'id', 'name'} dicts (levels also carry
+'code'), sorted by name, ready for templates and JsonResponse; treat them
+as read-only.
+
+Edits are picked up through the 'geography' CacheVersion row. home.signals
+bumps it whenever a county, constituency, ward, level or subject is saved
+or deleted; the worker that made the change drops its copy at once and
+every other worker notices the new version within CHECK_SECONDS.
+"""
+import time
+
+from .cache_versions import bump_version, stored_version
+from .models import Constituencies, Counties, Level, Subject, Wards
+
+VERSION_NAME = 'geography'
+
+# How often a worker asks the database whether its copy is still current
+CHECK_SECONDS = 5
+
+_loaded = {'data': None, 'version': None, 'checked_at': 0.0}
+
+
+def bump_geography_version():
+    """Record a change to the cached tables and drop this worker's copy."""
+    bump_version(VERSION_NAME)
+    _loaded['data'] = None
+
+
+def _group(rows, parent):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.pop(parent), []).append(row)
+    return grouped
+
+
+def _load():
+    constituencies = list(Constituencies.objects.order_by('name', 'id').values('id', 'name', 'county_id'))
+    wards = list(Wards.objects.order_by('name', 'id').values('id', 'name', 'constituency_id'))
+    subjects = list(Subject.objects.order_by('name', 'id').values('id', 'name', 'level_id'))
+    return {
+        'counties': list(Counties.objects.order_by('name', 'id').values('id', 'name')),
+        'all_constituencies': [{'id': row['id'], 'name': row['name']} for row in constituencies],
+        'all_wards': [{'id': row['id'], 'name': row['name']} for row in wards],
+        'all_subjects': [{'id': row['id'], 'name': row['name']} for row in subjects],
+        'constituencies': _group(constituencies, 'county_id'),
+        'wards': _group(wards, 'constituency_id'),
+        'levels': list(Level.objects.order_by('name', 'id').values('id', 'name', 'code')),
+        'subjects': _group(subjects, 'level_id'),
+    }
+
+
+def _data():
+    now = time.monotonic()
+    if _loaded['data'] is None or now - _loaded['checked_at'] >= CHECK_SECONDS:
+        version = stored_version(VERSION_NAME)
+        if _loaded['data'] is None or version != _loaded['version']:
+            _loaded['data'] = _load()
+            _loaded['version'] = version
+        _loaded['checked_at'] = now
+    return _loaded['data']
+
+
+def geography_version():
+    """Version of the copy this worker is serving, for validators."""
+    _data()
+    return _loaded['version']
+
+
+def snapshot():
+    """This worker's whole copy; a new object every time it is reloaded."""
+    return _data()
+
+
+def _id(value):
+    """An id from a model, number or query-string value; None when there isn't one."""
+    value = getattr(value, 'pk', value)
+    if isinstance(value, int):
+        return value
+    return int(value) if isinstance(value, str) and value.isdigit() else None
+
+
+def counties():
+    return _data()['counties']
+
+
+def constituencies(county):
+    """Constituencies of a county (instance or id); [] without one."""
+    return _data()['constituencies'].get(_id(county), [])
+
+
+def wards(constituency):
+    """Wards of a constituency (instance or id); [] without one."""
+    return _data()['wards'].get(_id(constituency), [])
+
+
+def all_constituencies():
+    return _data()['all_constituencies']
+
+
+def all_wards():
+    return _data()['all_wards']
+
+
+def levels():
+    return _data()['levels']
+
+
+def subjects(level=None):
+    """Subjects of a level (instance or id), or every subject when ``level`` is None."""
+    if level is None:
+        return _data()['all_subjects']
+    return _data()['subjects'].get(_id(level), [])
+
+
+def use_cached_choices(field, entries):
+    """
+    Render a ModelChoiceField's options from cached entries instead of
+    querying its queryset; the queryset still validates submitted values.
+    """
+    empty = [('', field.empty_label)] if getattr(field, 'empty_label', None) is not None else []
+    field.choices = empty + [(entry['id'], entry['name']) for entry in entries]
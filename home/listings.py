@@ -0,0 +1,536 @@
+"""
+Swap listings shared by the all / primary / secondary swap pages and the
+JSON endpoint (home.api_views.SwapListingAPIView).
+
+A listing is the active, unarchived swaps of other teachers, optionally
+limited to one level and narrowed by the location filters, best match
+first and newest first among equal scores. Scores are computed in the
+database (annotate_scores) from the viewer's preferences, school location
+and subjects, so ordering by score and paging are done by one query over
+the whole listing. Pages are keyset pages (home.pagination) on
+(match_score, created_at, id). Every page takes a fixed number of queries:
+
+- the viewer (get_viewer): preferences, profile with school location,
+  subjects - once per request
+- the page itself, with poster profiles and school locations joined
+- the posters' subjects for the page
+
+score_all, score_primary and score_secondary are the same rules written in
+Python, row by row; they are kept as the reference the annotations are
+tested against.
+"""
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThanOrEqual
+from django.urls import reverse
+
+from users.models import PersonalProfile
+from . import geo_cache
+from .facets import option_counts, with_counts
+from .models import MySubject, SwapPreference, Swaps
+from .pagination import keyset_page
+
+LISTING_PAGE_SIZE = 50
+LISTING_ORDERING = ('-match_score', '-created_at', '-id')
+
+# Listing kind -> Level.name the posters must have (None: every level)
+LISTING_LEVELS = {
+    'all': None,
+    'primary': 'Primary School',
+    'secondary': 'Secondary/High School',
+}
+
+FILTER_FIELDS = ('county', 'constituency', 'ward')
+
+
+def read_filters(params):
+    """{'county', 'constituency', 'ward'} ids from query parameters; None when unset or not a number."""
+    return {
+        field: int(params[field]) if params.get(field, '').isdigit() else None
+        for field in FILTER_FIELDS
+    }
+
+
+def filter_options(filters, kind='all'):
+    """
+    Choices for the location dropdowns, narrowed by the selected county and
+    constituency, each with the number of active swaps of ``kind`` it has
+    (home.facets). Read from the geography and facet caches.
+    """
+    level = LISTING_LEVELS[kind]
+    levels = [entry['id'] for entry in geo_cache.levels() if entry['name'] == level] if level else None
+    counts = option_counts('swaps', levels)
+    return {
+        'counties': with_counts(geo_cache.counties(), counts['county']),
+        'constituencies': with_counts(geo_cache.constituencies(filters['county']), counts['constituency']),
+        'wards': with_counts(geo_cache.wards(filters['constituency']), counts['ward']),
+    }
+
+
+def get_viewer(user):
+    """
+    What the scores need to know about the teacher looking at a listing.
+    Anonymous users get an empty viewer and every row scores 0.
+    """
+    viewer = {
+        'user_id': None,
+        'prefs': None,
+        'profile': None,
+        'school_county_id': None,
+        'school_constituency_id': None,
+        'school_ward_id': None,
+        'subject_ids': set(),
+        'subject_names': set(),
+    }
+    if not user.is_authenticated:
+        return viewer
+
+    viewer['user_id'] = user.id
+    viewer['prefs'] = SwapPreference.objects.filter(user=user).first()
+    profile = PersonalProfile.objects.filter(user=user).select_related('school__ward__constituency').first()
+    viewer['profile'] = profile
+    school = profile.school if profile else None
+    if school and school.ward:
+        viewer['school_ward_id'] = school.ward_id
+        viewer['school_constituency_id'] = school.ward.constituency_id
+        viewer['school_county_id'] = school.ward.constituency.county_id
+    for subject_id, name in MySubject.objects.filter(user=user).values_list('subject__id', 'subject__name'):
+        if subject_id is not None:
+            viewer['subject_ids'].add(subject_id)
+            viewer['subject_names'].add(name)
+    return viewer
+
+
+def listing_queryset(kind, viewer, filters):
+    """Active swaps of ``kind`` that match ``filters``, without ordering."""
+    swaps = Swaps.objects.filter(archived=False, status=True)
+    if LISTING_LEVELS[kind]:
+        swaps = swaps.filter(user__profile__level__name=LISTING_LEVELS[kind])
+    if viewer['user_id']:
+        swaps = swaps.exclude(user_id=viewer['user_id'])
+    for field in FILTER_FIELDS:
+        if filters[field]:
+            swaps = swaps.filter(**{f'{field}_id': filters[field]})
+    return swaps.select_related(
+        'county',
+        'constituency',
+        'ward',
+        'user__profile__school__ward__constituency__county',
+    )
+
+
+def _poster_subjects(user_ids):
+    """{user_id: [Subject]} for the posters of a page, one query."""
+    subjects = {}
+    for row in MySubject.subject.through.objects.filter(
+        mysubject__user_id__in=user_ids,
+    ).select_related('mysubject', 'subject').order_by('mysubject_id', 'subject__name'):
+        subjects.setdefault(row.mysubject.user_id, []).append(row.subject)
+    return subjects
+
+
+def _school_location(school):
+    """(county_id, constituency_id, ward_id) of a poster's school."""
+    if school and school.ward:
+        return school.ward.constituency.county_id, school.ward.constituency_id, school.ward_id
+    return None, None, None
+
+
+def score_all(swap, school, subjects, viewer):
+    """Score used on the all-levels page: shared subjects plus desired-location hits."""
+    poster_subjects = {subject.name for subject in subjects}
+    match_score = 0
+    common_subjects = set()
+
+    # 1. Subject match (50 points max)
+    if viewer['user_id'] and poster_subjects:
+        common_subjects = viewer['subject_names'] & poster_subjects
+        if common_subjects:
+            match_score += 50
+
+    # 2. Location match (50 points max)
+    prefs = viewer['prefs']
+    location_score = 0
+    if prefs and swap.county_id and swap.constituency_id and swap.ward_id:
+        if prefs.desired_county_id and prefs.desired_county_id == swap.county_id:
+            location_score += 20
+            if prefs.desired_constituency_id and prefs.desired_constituency_id == swap.constituency_id:
+                location_score += 20
+                if prefs.desired_ward_id and prefs.desired_ward_id == swap.ward_id:
+                    location_score += 10
+
+    return _all_row(match_score + location_score, location_score, common_subjects, viewer)
+
+
+def _all_row(match_score, location_score, common_subjects, viewer):
+    prefs = viewer['prefs']
+    return {
+        'match_score': match_score,
+        'is_perfect_match': match_score == 100,
+        # County and constituency match, ward doesn't
+        'is_near_perfect_match': bool(location_score == 40 and prefs.desired_ward_id and common_subjects),
+        'common_subjects': list(common_subjects)[:3],
+    }
+
+
+def _directions(swap, school, viewer):
+    """
+    Location hits both ways. Direction 1: the poster's school is where the
+    viewer wants to go. Direction 2: the poster wants to go where the
+    viewer's school is.
+    """
+    prefs = viewer['prefs']
+    county_id, constituency_id, ward_id = _school_location(school)
+    return {
+        'dir1_county': bool(county_id and prefs.desired_county_id and county_id == prefs.desired_county_id),
+        'dir1_constituency': bool(constituency_id and prefs.desired_constituency_id and constituency_id == prefs.desired_constituency_id),
+        'dir1_ward': bool(ward_id and prefs.desired_ward_id and ward_id == prefs.desired_ward_id),
+        'dir2_county': bool(swap.county_id and swap.county_id == viewer['school_county_id']),
+        'dir2_constituency': bool(
+            swap.constituency_id and viewer['school_constituency_id']
+            and swap.constituency_id == viewer['school_constituency_id']
+        ),
+        'dir2_ward': bool(swap.ward_id and viewer['school_ward_id'] and swap.ward_id == viewer['school_ward_id']),
+    }
+
+
+def _labelled(match_score, match_label, common_subjects=()):
+    return {
+        'match_score': match_score,
+        'match_label': match_label,
+        'is_perfect_match': match_label == "Perfect Match",
+        'is_excellent_match': match_label == "Excellent Match",
+        'is_good_match': match_label == "Good Match",
+        'common_subjects': list(common_subjects),
+    }
+
+
+# Primary page scores and their labels
+PRIMARY_LABELS = {
+    100: "Perfect Match",
+    95: "Perfect Match",
+    90: "Perfect Match",
+    80: "Excellent Match",
+    70: "Good Match",
+    60: "Good Match",
+    55: "Good Match",
+    0: "Normal",
+}
+
+
+def _primary_row(match_score):
+    return _labelled(match_score, PRIMARY_LABELS[match_score])
+
+
+def score_primary(swap, school, subjects, viewer):
+    """Score used on the primary page: mutual location fit only."""
+    if not (viewer['user_id'] and viewer['prefs'] and viewer['school_county_id']):
+        return _primary_row(0)
+    d = _directions(swap, school, viewer)
+
+    # Perfect Match: both directions match at county level or better
+    if d['dir1_county'] and d['dir2_county']:
+        if d['dir1_ward'] and d['dir2_ward']:
+            return _primary_row(100)
+        if d['dir1_constituency'] and d['dir2_constituency']:
+            return _primary_row(95)
+        return _primary_row(90)
+    # Excellent Match: one direction fully matches, the other partially
+    if (d['dir1_county'] and d['dir2_constituency']) or (d['dir1_constituency'] and d['dir2_county']):
+        return _primary_row(80)
+    # Good Match: at least one direction has a county match
+    if d['dir1_county'] or d['dir2_county']:
+        if d['dir1_constituency'] or d['dir2_constituency']:
+            return _primary_row(70)
+        if d['dir1_county']:
+            return _primary_row(60)
+        return _primary_row(55)
+    return _primary_row(0)
+
+
+def score_secondary(swap, school, subjects, viewer):
+    """Score used on the secondary page: subject overlap plus mutual location fit."""
+    if not viewer['user_id']:
+        return dict(_labelled(0, "Normal"), has_subject_match=False)
+
+    # === SUBJECT MATCHING ===
+    subject_score = 0
+    common_subjects = []
+    poster_subject_ids = {subject.id for subject in subjects}
+    common_ids = viewer['subject_ids'] & poster_subject_ids
+    if common_ids:
+        common_subjects = [subject.name for subject in subjects if subject.id in common_ids][:3]
+        match_percentage = len(common_ids) / len(viewer['subject_ids'] | poster_subject_ids)
+        if match_percentage >= 0.5:
+            subject_score = 50
+        elif match_percentage >= 0.25:
+            subject_score = 35
+        else:
+            subject_score = 20
+
+    # === LOCATION MATCHING ===
+    location_score = 0
+    if viewer['prefs'] and viewer['school_county_id']:
+        d = _directions(swap, school, viewer)
+        if d['dir1_county'] and d['dir2_county']:
+            location_score = 50 if d['dir1_constituency'] and d['dir2_constituency'] else 45
+        elif d['dir1_county'] or d['dir2_county']:
+            location_score = 35 if d['dir1_constituency'] or d['dir2_constituency'] else 25
+
+    return _secondary_row(location_score, subject_score, common_subjects)
+
+
+def _secondary_row(location_score, subject_score, common_subjects):
+    # Location and subjects both count for secondary
+    match_score = location_score + subject_score
+    if location_score >= 45 and subject_score >= 35:
+        match_label = "Perfect Match"
+    elif location_score >= 35 and subject_score >= 20:
+        match_label = "Excellent Match"
+    elif (location_score >= 25 and subject_score >= 20) or (location_score >= 35 and subject_score > 0):
+        match_label = "Good Match"
+    else:
+        match_label = "Normal"
+    return dict(_labelled(match_score, match_label, common_subjects), has_subject_match=bool(common_subjects))
+
+
+SCORERS = {
+    'all': score_all,
+    'primary': score_primary,
+    'secondary': score_secondary,
+}
+
+
+# Where the poster's school is, seen from a Swaps row
+POSTER_COUNTY = 'user__profile__school__ward__constituency__county_id'
+POSTER_CONSTITUENCY = 'user__profile__school__ward__constituency_id'
+POSTER_WARD = 'user__profile__school__ward_id'
+
+
+def _is(field, value):
+    """Q(field=value); None, a condition that never holds, when the viewer has no value."""
+    return Q(**{field: value}) if value else None
+
+
+def _all_of(*conditions):
+    if any(condition is None for condition in conditions):
+        return None
+    combined = conditions[0]
+    for condition in conditions[1:]:
+        combined &= condition
+    return combined
+
+
+def _any_of(*conditions):
+    conditions = [condition for condition in conditions if condition is not None]
+    if not conditions:
+        return None
+    combined = conditions[0]
+    for condition in conditions[1:]:
+        combined |= condition
+    return combined
+
+
+def _score_case(*branches):
+    """First (condition, points) that holds, else 0; branches whose condition is None are left out."""
+    whens = [When(condition, then=Value(points)) for condition, points in branches if condition is not None]
+    if not whens:
+        return Value(0, output_field=IntegerField())
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def _sql_directions(viewer):
+    """The conditions of _directions(), as Q objects on Swaps (None: never)."""
+    prefs = viewer['prefs']
+    return {
+        'dir1_county': _is(POSTER_COUNTY, prefs.desired_county_id),
+        'dir1_constituency': _is(POSTER_CONSTITUENCY, prefs.desired_constituency_id),
+        'dir1_ward': _is(POSTER_WARD, prefs.desired_ward_id),
+        'dir2_county': _is('county_id', viewer['school_county_id']),
+        'dir2_constituency': _is('constituency_id', viewer['school_constituency_id']),
+        'dir2_ward': _is('ward_id', viewer['school_ward_id']),
+    }
+
+
+def _primary_scores(swaps, viewer):
+    if not (viewer['user_id'] and viewer['prefs'] and viewer['school_county_id']):
+        return swaps.annotate(location_score=Value(0, output_field=IntegerField()))
+    d = _sql_directions(viewer)
+    both_counties = _all_of(d['dir1_county'], d['dir2_county'])
+    return swaps.annotate(location_score=_score_case(
+        (_all_of(both_counties, d['dir1_ward'], d['dir2_ward']), 100),
+        (_all_of(both_counties, d['dir1_constituency'], d['dir2_constituency']), 95),
+        (both_counties, 90),
+        (_any_of(
+            _all_of(d['dir1_county'], d['dir2_constituency']),
+            _all_of(d['dir1_constituency'], d['dir2_county']),
+        ), 80),
+        (_all_of(
+            _any_of(d['dir1_county'], d['dir2_county']),
+            _any_of(d['dir1_constituency'], d['dir2_constituency']),
+        ), 70),
+        (d['dir1_county'], 60),
+        (d['dir2_county'], 55),
+    ))
+
+
+def _secondary_scores(swaps, viewer):
+    if viewer['user_id'] and viewer['prefs'] and viewer['school_county_id']:
+        d = _sql_directions(viewer)
+        both_counties = _all_of(d['dir1_county'], d['dir2_county'])
+        either_county = _any_of(d['dir1_county'], d['dir2_county'])
+        swaps = swaps.annotate(location_score=_score_case(
+            (_all_of(both_counties, d['dir1_constituency'], d['dir2_constituency']), 50),
+            (both_counties, 45),
+            (_all_of(either_county, _any_of(d['dir1_constituency'], d['dir2_constituency'])), 35),
+            (either_county, 25),
+        ))
+    else:
+        swaps = swaps.annotate(location_score=Value(0, output_field=IntegerField()))
+
+    subject_ids = viewer['subject_ids']
+    if not (viewer['user_id'] and subject_ids):
+        return swaps.annotate(subject_score=Value(0, output_field=IntegerField()))
+
+    # Share of common subjects in the union of both teachers' subjects
+    poster_subjects = MySubject.subject.through.objects.filter(mysubject__user_id=OuterRef('user_id'))
+
+    def count(rows):
+        return Coalesce(
+            Subquery(
+                rows.values('mysubject__user_id').annotate(n=Count('subject_id', distinct=True)).values('n')[:1],
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    swaps = swaps.alias(
+        listing_common_subjects=count(poster_subjects.filter(subject_id__in=subject_ids)),
+        listing_poster_subjects=count(poster_subjects),
+    )
+    common = F('listing_common_subjects')
+    union = Value(len(subject_ids)) + F('listing_poster_subjects') - common
+    return swaps.annotate(subject_score=Case(
+        When(listing_common_subjects=0, then=Value(0)),
+        When(GreaterThanOrEqual(common * 2, union), then=Value(50)),
+        When(GreaterThanOrEqual(common * 4, union), then=Value(35)),
+        default=Value(20),
+        output_field=IntegerField(),
+    ))
+
+
+def _all_scores(swaps, viewer):
+    names = viewer['subject_names']
+    if viewer['user_id'] and names:
+        swaps = swaps.annotate(subject_score=_score_case((Exists(MySubject.subject.through.objects.filter(
+            mysubject__user_id=OuterRef('user_id'), subject__name__in=names,
+        )), 50)))
+    else:
+        swaps = swaps.annotate(subject_score=Value(0, output_field=IntegerField()))
+
+    prefs = viewer['prefs']
+    if not prefs:
+        return swaps.annotate(location_score=Value(0, output_field=IntegerField()))
+    full_location = Q(county_id__isnull=False, constituency_id__isnull=False, ward_id__isnull=False)
+    county = _all_of(full_location, _is('county_id', prefs.desired_county_id))
+    constituency = _all_of(county, _is('constituency_id', prefs.desired_constituency_id))
+    return swaps.annotate(location_score=_score_case(
+        (_all_of(constituency, _is('ward_id', prefs.desired_ward_id)), 50),
+        (constituency, 40),
+        (county, 20),
+    ))
+
+
+def annotate_scores(swaps, kind, viewer):
+    """
+    Annotate a Swaps queryset with match_score against ``viewer``, by the
+    rules of SCORERS[kind], plus its parts location_score and
+    subject_score (always 0 on the primary page).
+    """
+    if kind == 'primary':
+        swaps = _primary_scores(swaps, viewer).annotate(subject_score=Value(0, output_field=IntegerField()))
+    elif kind == 'secondary':
+        swaps = _secondary_scores(swaps, viewer)
+    else:
+        swaps = _all_scores(swaps, viewer)
+    return swaps.annotate(match_score=F('location_score') + F('subject_score'))
+
+
+def _row_scores(kind, swap, subjects, viewer):
+    """The keys SCORERS[kind] returns, from an annotated swap and its poster's subjects."""
+    if kind == 'primary':
+        return _primary_row(swap.match_score)
+    if kind == 'secondary':
+        common_subjects = [subject.name for subject in subjects if subject.id in viewer['subject_ids']][:3]
+        return _secondary_row(swap.location_score, swap.subject_score, common_subjects)
+    common_subjects = viewer['subject_names'] & {subject.name for subject in subjects} if viewer['user_id'] else set()
+    return _all_row(swap.match_score, swap.location_score, common_subjects, viewer)
+
+
+def get_listing_page(kind, viewer, filters, cursor=None, page_size=LISTING_PAGE_SIZE):
+    """
+    One page of a listing. Returns {'rows': [{'swap', 'user_school',
+    'user_subjects', 'match_score', ...}], 'next_cursor',
+    'previous_cursor'}; rows carry the keys of SCORERS[kind].
+    """
+    swaps = annotate_scores(listing_queryset(kind, viewer, filters), kind, viewer)
+    page = keyset_page(swaps, ordering=LISTING_ORDERING, cursor=cursor, page_size=page_size)
+
+    rows = swap_rows(page['items'])
+    for row in rows:
+        row.update(_row_scores(kind, row['swap'], row['user_subjects'], viewer))
+
+    return {'rows': rows, 'next_cursor': page['next_cursor'], 'previous_cursor': page['previous_cursor']}
+
+
+def swap_rows(swaps):
+    """
+    [{'swap', 'user_school', 'user_subjects'}] for swaps loaded with
+    user__profile__school__ward__constituency__county; one query for the
+    subjects.
+    """
+    subjects = _poster_subjects({swap.user_id for swap in swaps})
+    rows = []
+    for swap in swaps:
+        profile = getattr(swap.user, 'profile', None)
+        rows.append({
+            'swap': swap,
+            'user_school': getattr(profile, 'school', None),
+            'user_subjects': subjects.get(swap.user_id, []),
+        })
+    return rows
+
+
+def serialize_swap(row):
+    """JSON-friendly form of the swap, school and subjects of a row."""
+    swap = row['swap']
+    school = row['user_school']
+    county_id, constituency_id, ward_id = _school_location(school)
+    return {
+        'id': swap.id,
+        'url': reverse('home:swap_detail', args=[swap.id]),
+        'created_at': swap.created_at.isoformat(),
+        'wants': {
+            'county': swap.county.name if swap.county else None,
+            'constituency': swap.constituency.name if swap.constituency else None,
+            'ward': swap.ward.name if swap.ward else None,
+        },
+        'school': {
+            'name': school.name if school else None,
+            'county': school.ward.constituency.county.name if county_id else None,
+            'constituency': school.ward.constituency.name if constituency_id else None,
+            'ward': school.ward.name if ward_id else None,
+        },
+        'subjects': [subject.name for subject in row['user_subjects']],
+    }
+
+
+def serialize_row(row):
+    """JSON-friendly form of a listing row."""
+    return {
+        **serialize_swap(row),
+        'common_subjects': row['common_subjects'],
+        'match_score': row['match_score'],
+        'match_label': row.get('match_label'),
+        'is_perfect_match': row['is_perfect_match'],
+    }
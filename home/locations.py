@@ -0,0 +1,48 @@
+"""
+Denormalized teacher locations.
+
+PersonalProfile.current_county / current_constituency mirror
+school.ward.constituency(.county). PersonalProfile.save() keeps a single
+profile right; the helpers here repair many profiles at once after a
+school, ward or constituency moves, and back the
+sync_profile_locations command.
+"""
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+
+from users.models import PersonalProfile
+
+
+def location_drift(profiles=None):
+    """
+    Profiles whose stored county/constituency differ from their school's.
+    """
+    if profiles is None:
+        profiles = PersonalProfile.objects.all()
+    # Coalesce so that NULL on either side compares like any other value
+    return profiles.alias(
+        stored_constituency=Coalesce('current_constituency_id', 0),
+        actual_constituency=Coalesce('school__ward__constituency_id', 0),
+        stored_county=Coalesce('current_county_id', 0),
+        actual_county=Coalesce('school__ward__constituency__county_id', 0),
+    ).filter(
+        ~Q(stored_constituency=F('actual_constituency')) | ~Q(stored_county=F('actual_county'))
+    )
+
+
+def sync_profile_locations(profiles=None):
+    """
+    Rewrite current_county/current_constituency on drifted profiles.
+    Returns the user ids whose location changed.
+    """
+    changed = list(
+        location_drift(profiles).values_list(
+            'id', 'user_id', 'school__ward__constituency_id', 'school__ward__constituency__county_id'
+        )
+    )
+    updates = [
+        PersonalProfile(id=profile_id, current_constituency_id=constituency_id, current_county_id=county_id)
+        for profile_id, _, constituency_id, county_id in changed
+    ]
+    PersonalProfile.objects.bulk_update(updates, ['current_constituency', 'current_county'], batch_size=500)
+    return [user_id for _, user_id, _, _ in changed]
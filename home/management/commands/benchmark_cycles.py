@@ -0,0 +1,107 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.models import MyUser
+from home.cycle_finder import (
+    CycleSearchTimeout,
+    count_cycles,
+    find_cycles_for_level,
+    find_cycles_for_user,
+    get_deadline,
+    get_max_length,
+    get_time_budget,
+)
+from home.models import Level
+from home.triangle_swap_utils import load_triangle_buckets
+
+
+class Command(BaseCommand):
+    help = 'Time the swap rotation search (pairs up to k-way cycles) per level, per teacher or on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--level', type=int, help='Only benchmark the level with this id')
+        parser.add_argument('--email', help='Benchmark the per-teacher search for this teacher')
+        parser.add_argument('--max-length', type=int, help='Longest rotation (default SWAP_CYCLE_MAX_LENGTH)')
+        parser.add_argument('--time-budget', type=float, help='Seconds per search, 0 for no limit (default SWAP_CYCLE_TIME_BUDGET)')
+        parser.add_argument('--limit', type=int, default=100000, help='Rotations to expand per level (default 100000)')
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            help='Search a random in-memory level of this many teachers over 47 counties instead of the database',
+        )
+
+    def write_counts(self, counts, seconds, complete):
+        for length in sorted(counts):
+            county_cycles, rotations = counts[length]
+            self.stdout.write(f'  {length}-way: {county_cycles:8d} county cycles  {rotations:12d} rotations')
+        status = 'complete' if complete else self.style.WARNING('stopped at time budget')
+        self.stdout.write(f'  counted in {seconds:.3f}s ({status})')
+
+    def count(self, groups, max_length, time_budget):
+        deadline = get_deadline(time_budget)
+        start = time.perf_counter()
+        try:
+            counts, complete = count_cycles(groups, max_length, deadline), True
+        except CycleSearchTimeout:
+            counts, complete = {}, False
+        self.write_counts(counts, time.perf_counter() - start, complete)
+
+    def synthetic_groups(self, teacher_count):
+        rng = random.Random(teacher_count)
+        counties = list(range(1, 48))
+        county = {}
+        wants = {}
+        for user_id in range(1, teacher_count + 1):
+            county[user_id] = rng.choice(counties)
+            wants[user_id] = set(rng.sample(counties, rng.randint(1, 3))) - {county[user_id]}
+        return {None: {'county': county, 'wants': wants}}
+
+    def handle(self, *args, **options):
+        max_length = get_max_length(options['max_length'])
+        time_budget = get_time_budget(options['time_budget'])
+
+        if options['synthetic']:
+            self.stdout.write(f"\nSynthetic level, {options['synthetic']} teachers, up to {max_length}-way")
+            self.count(self.synthetic_groups(options['synthetic']), max_length, time_budget)
+            return
+
+        if options['email']:
+            user = MyUser.objects.select_related('profile__level').filter(email=options['email']).first()
+            if not user:
+                self.stdout.write(self.style.ERROR(f"No user with email {options['email']}"))
+                return
+            result = find_cycles_for_user(user, max_length, time_budget, options['limit'])
+            by_length = {}
+            for cycle in result['cycles']:
+                by_length[len(cycle)] = by_length.get(len(cycle), 0) + 1
+            self.stdout.write(f'\n{user.email}, up to {max_length}-way')
+            for length in sorted(by_length):
+                self.stdout.write(f'  {length}-way: {by_length[length]} rotations')
+            status = 'complete' if result['complete'] else self.style.WARNING('stopped at time budget or limit')
+            self.stdout.write(f"  found in {result['elapsed']:.3f}s ({status})")
+            return
+
+        levels = Level.objects.order_by('id')
+        if options['level']:
+            levels = levels.filter(id=options['level'])
+
+        for level in levels:
+            name = level.name.lower()
+            is_secondary = 'secondary' in name or 'high' in name
+            teachers = MyUser.objects.filter(
+                is_active=True,
+                profile__level=level,
+                swappreference__isnull=False,
+            )
+            self.stdout.write(f'\n{level.name}, up to {max_length}-way')
+
+            start = time.perf_counter()
+            groups = load_triangle_buckets(teachers, secondary=is_secondary)
+            self.stdout.write(f'  loaded {sum(len(g["county"]) for g in groups.values())} teachers in {time.perf_counter() - start:.3f}s')
+            self.count(groups, max_length, time_budget)
+
+            result = find_cycles_for_level(level, max_length, time_budget, options['limit'], teachers=teachers)
+            status = 'complete' if result['complete'] else self.style.WARNING('stopped at time budget or limit')
+            self.stdout.write(f"  expanded {len(result['cycles'])} rotations in {result['elapsed']:.3f}s ({status})")
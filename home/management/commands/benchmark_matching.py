@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.models import MyUser
+from home.match_engine import compute_level_matches
+from home.matching import find_matches
+from home.models import Level
+
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized match engine with per-teacher find_matches() on each level'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--level',
+            type=int,
+            help='Only benchmark the level with this id',
+        )
+        parser.add_argument(
+            '--skip-find-matches',
+            action='store_true',
+            help='Only time the engine (find_matches on a large level can take minutes)',
+        )
+
+    def handle(self, *args, **options):
+        levels = Level.objects.order_by('id')
+        if options['level']:
+            levels = levels.filter(id=options['level'])
+
+        for level in levels:
+            self.stdout.write(f'\n{level.name}')
+
+            start = time.perf_counter()
+            result = compute_level_matches(level)
+            engine_seconds = time.perf_counter() - start
+            self.stdout.write(
+                f'  engine:       {engine_seconds:8.3f}s  '
+                f'{len(result["counts"])} teachers, {len(result["pairs"])} pairs'
+            )
+
+            if options['skip_find_matches']:
+                continue
+
+            users = MyUser.objects.filter(id__in=list(result['counts'])).select_related('profile__level')
+            start = time.perf_counter()
+            legacy_counts = {user.id: find_matches(user).count() for user in users}
+            legacy_seconds = time.perf_counter() - start
+            self.stdout.write(f'  find_matches: {legacy_seconds:8.3f}s')
+
+            mismatched = [
+                user_id for user_id, count in legacy_counts.items()
+                if result['counts'].get(user_id) != count
+            ]
+            if mismatched:
+                self.stdout.write(self.style.ERROR(
+                    f'  {len(mismatched)} teachers disagree, e.g. user ids {mismatched[:10]}'
+                ))
+            else:
+                speedup = legacy_seconds / engine_seconds if engine_seconds else float('inf')
+                self.stdout.write(self.style.SUCCESS(f'  counts agree, {speedup:.1f}x faster'))
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from users.models import MyUser
+from home.models import Level
+from home.triangle_swap_utils import (
+    find_triangle_swaps_primary,
+    find_triangle_swaps_primary_reference,
+    find_triangle_swaps_secondary,
+    find_triangle_swaps_secondary_reference,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare the county-graph triangle engine with the reference per-teacher loops on each level'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--level',
+            type=int,
+            help='Only benchmark the level with this id',
+        )
+        parser.add_argument(
+            '--skip-reference',
+            action='store_true',
+            help='Only time the engine (the reference loops can take minutes on a full level)',
+        )
+
+    def run(self, finder, teachers):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            triangles = finder(teachers)
+            seconds = time.perf_counter() - start
+        return triangles, seconds, len(queries)
+
+    def handle(self, *args, **options):
+        levels = Level.objects.order_by('id')
+        if options['level']:
+            levels = levels.filter(id=options['level'])
+
+        for level in levels:
+            name = level.name.lower()
+            is_secondary = 'secondary' in name or 'high' in name
+            engine, reference = (
+                (find_triangle_swaps_secondary, find_triangle_swaps_secondary_reference) if is_secondary
+                else (find_triangle_swaps_primary, find_triangle_swaps_primary_reference)
+            )
+            teachers = MyUser.objects.filter(
+                is_active=True,
+                profile__level=level,
+                swappreference__isnull=False,
+            ).select_related(
+                'profile__current_county',
+                'swappreference__desired_county',
+            ).prefetch_related('swappreference__open_to_all')
+
+            self.stdout.write(f'\n{level.name}')
+            triangles, seconds, query_count = self.run(engine, teachers)
+            self.stdout.write(
+                f'  engine:    {seconds:8.3f}s  {query_count:6d} queries  {len(triangles)} triangles'
+            )
+            if options['skip_reference']:
+                continue
+
+            expected, reference_seconds, reference_queries = self.run(reference, teachers)
+            self.stdout.write(
+                f'  reference: {reference_seconds:8.3f}s  {reference_queries:6d} queries  {len(expected)} triangles'
+            )
+            found = {frozenset(t.id for t in triangle) for triangle in triangles}
+            if found == {frozenset(t.id for t in triangle) for triangle in expected} and len(found) == len(triangles):
+                self.stdout.write(self.style.SUCCESS('  same triangles'))
+            else:
+                self.stdout.write(self.style.ERROR('  triangle sets differ'))
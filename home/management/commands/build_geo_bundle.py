@@ -0,0 +1,21 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from home.geo_bundle import write_bundle
+
+
+class Command(BaseCommand):
+    help = 'Write the counties/constituencies/wards/levels/subjects bundle for the dropdowns and collect it (see home.geo_bundle)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-collectstatic', action='store_true', help='Only write the bundle; collectstatic runs later (e.g. in the deploy script)')
+
+    def handle(self, *args, **options):
+        path = write_bundle()
+        self.stdout.write(f'Wrote {path} ({os.path.getsize(path) / 1024:.1f} KB)')
+
+        if not options['no_collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=0)
+            self.stdout.write(self.style.SUCCESS('Collected static files; restart the app servers to serve the new bundle'))
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from home.clearing import DEFAULT_CLEARING_LENGTH, clear_level
+from home.models import Level
+
+
+class Command(BaseCommand):
+    help = 'Pick disjoint pairs, triangles and longer rotations that relocate as many teachers as possible'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--level', type=int, help='Only clear the level with this id')
+        parser.add_argument(
+            '--max-length',
+            type=int,
+            default=DEFAULT_CLEARING_LENGTH,
+            help=f'Longest rotation to use (default {DEFAULT_CLEARING_LENGTH}: pairs and triangles)',
+        )
+        parser.add_argument('--time-budget', type=float, help='Seconds per level, 0 for no limit (default SWAP_CYCLE_TIME_BUDGET)')
+        parser.add_argument('--output', help='Write the chosen rotations and unmatched teachers to this JSON file')
+
+    def handle(self, *args, **options):
+        levels = Level.objects.order_by('id')
+        if options['level']:
+            levels = levels.filter(id=options['level'])
+
+        report = {}
+        for level in levels:
+            result = clear_level(level, options['max_length'], options['time_budget'])
+            report[level.name] = result
+
+            self.stdout.write(f'\n{level.name}')
+            for length in sorted(result['by_length']):
+                self.stdout.write(f"  {length}-way: {result['by_length'][length]} rotations")
+            self.stdout.write(
+                f"  relocated {result['relocated']} teachers (upper bound {result['upper_bound']}), "
+                f"{len(result['unmatched'])} unmatched, {result['elapsed']:.3f}s"
+            )
+            if not result['complete']:
+                self.stdout.write(self.style.WARNING('  stopped at time budget'))
+            if options['verbosity'] > 1:
+                for rotation in result['cycles']:
+                    self.stdout.write('  ' + ' -> '.join(str(user_id) for user_id in rotation))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.models import Level
+from home.swap_compute import compute_swaps, write_swaps
+
+
+class Command(BaseCommand):
+    help = 'Recompute all pairs and triangles, sharded by level and subject group, and store them in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes (default 1: no pool)')
+        parser.add_argument('--level', type=int, action='append', help='Only this level id (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Compute without writing the stores')
+        parser.add_argument('--output', help='Also write the merged result to this JSON file, for diffing runs')
+
+    def handle(self, *args, **options):
+        level_ids = options['level']
+        level_names = dict(Level.objects.values_list('id', 'name'))
+
+        def progress(done, total, result, partition):
+            level_id, fingerprint = result['key']
+            group = level_names.get(level_id, level_id)
+            if fingerprint:
+                group = f'{group} [{fingerprint[:8]}]'
+            self.stdout.write(
+                f"  [{done}/{total}] {group}: {len(partition['county'])} teachers, "
+                f"{len(result['edges'])} match edges, {len(result['triangles'])} triangles "
+                f"({result['seconds']:.2f}s)"
+            )
+
+        started = time.perf_counter()
+        self.stdout.write(f"Computing swaps with {options['workers']} worker(s)...")
+        result = compute_swaps(workers=options['workers'], level_ids=level_ids, progress=progress)
+        self.stdout.write(
+            f"Computed {len(result['edges'])} match edges and {len(result['triangles'])} triangles "
+            f"over {len(result['partitions'])} partitions in {time.perf_counter() - started:.2f}s"
+        )
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(result, handle)
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if options['dry_run']:
+            return
+        edge_count, triangle_count = write_swaps(result, level_ids)
+        self.stdout.write(self.style.SUCCESS(f'Stored {edge_count} match edges and {triangle_count} triangles'))
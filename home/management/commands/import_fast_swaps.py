@@ -0,0 +1,47 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.fast_swap_import import DEFAULT_CHUNK_SIZE, import_fast_swaps, iter_rows
+
+
+class Command(BaseCommand):
+    help = 'Import FastSwap entries from a CSV or XLSX file (names, phone, level, county, school, most_preferred, acceptable_counties, subjects)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.csv or .xlsx file')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help=f'Rows per transaction (default {DEFAULT_CHUNK_SIZE})')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row without writing')
+        parser.add_argument('--errors', help='Write rejected rows to this CSV file')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as handle:
+                result = import_fast_swaps(
+                    iter_rows(handle, options['path']),
+                    chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in result['errors'][:20]:
+            self.stdout.write(self.style.WARNING(f"  line {error['line']} ({error['names']}): {'; '.join(error['errors'])}"))
+        if len(result['errors']) > 20:
+            self.stdout.write(f"  ... and {len(result['errors']) - 20} more")
+
+        if options['errors'] and result['errors']:
+            with open(options['errors'], 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(['line', 'names', 'errors'])
+                for error in result['errors']:
+                    writer.writerow([error['line'], error['names'], '; '.join(error['errors'])])
+            self.stdout.write(f"Wrote rejected rows to {options['errors']}")
+
+        verb = 'would be created' if options['dry_run'] else 'created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['rows']} rows: {result['valid'] if options['dry_run'] else result['created']} FastSwaps {verb}, "
+            f"{len(result['errors'])} rejected ({time.perf_counter() - started:.2f}s)"
+        ))
@@ -1,5 +1,7 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from home.models import Level, Subject
+from home.signals import bulk_location_load
 
 class Command(BaseCommand):
     help = 'Load subjects data into the database from a predefined dataset'
@@ -77,32 +79,37 @@ class Command(BaseCommand):
         
         created_count = 0
         
-        for level_name, subjects in SUBJECTS_DATA.items():
-            try:
-                # Get or create the level
-                level, created = Level.objects.get_or_create(
-                    name=level_name,
-                    defaults={
-                        'code': level_name.upper()[:3]
-                    }
-                )
-                
-                # Create subjects for this level
-                for subject_name in subjects:
-                    subject, created = Subject.objects.get_or_create(
-                        name=subject_name,
-                        level=level,
+        # One cache version bump for the whole load, not one per row
+        with bulk_location_load():
+            for level_name, subjects in SUBJECTS_DATA.items():
+                try:
+                    # Get or create the level
+                    level, created = Level.objects.get_or_create(
+                        name=level_name,
                         defaults={
-                            'code': ''.join(word[0].upper() for word in subject_name.split())
+                            'code': level_name.upper()[:3]
                         }
                     )
-                    if created:
-                        created_count += 1
                 
-                self.stdout.write(self.style.SUCCESS(f'Successfully processed {level_name} level with {len(subjects)} subjects'))
+                    # Create subjects for this level
+                    for subject_name in subjects:
+                        subject, created = Subject.objects.get_or_create(
+                            name=subject_name,
+                            level=level,
+                            defaults={
+                                'code': ''.join(word[0].upper() for word in subject_name.split())
+                            }
+                        )
+                        if created:
+                            created_count += 1
+                
+                    self.stdout.write(self.style.SUCCESS(f'Successfully processed {level_name} level with {len(subjects)} subjects'))
                 
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error processing {level_name}: {str(e)}'))
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Error processing {level_name}: {str(e)}'))
         
         total_subjects = sum(len(subjects) for subjects in SUBJECTS_DATA.values())
         self.stdout.write(self.style.SUCCESS(f'\nSuccessfully created/updated {created_count} out of {total_subjects} total subjects'))
+
+        # The dropdowns read the data from the static bundle
+        call_command('build_geo_bundle')
@@ -0,0 +1,54 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.fast_swap_graph import build_fast_swap_graph, match_fast_swaps
+from home.fast_swap_store import write_fast_swap_matches
+from home.models import Level
+
+
+class Command(BaseCommand):
+    help = 'Match every FastSwap against teachers and other FastSwaps, loading each level once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--level', type=int, help='Only match FastSwaps on the level with this id')
+        parser.add_argument('--store', action='store_true', help='Save the matches for the FastSwap detail pages')
+        parser.add_argument('--output', help='Write the matches of every FastSwap to this JSON file')
+
+    def handle(self, *args, **options):
+        levels = Level.objects.order_by('id')
+        if options['level']:
+            levels = levels.filter(id=options['level'])
+
+        report = {}
+        for level in levels:
+            started = time.perf_counter()
+            graph = build_fast_swap_graph(level)
+            loaded = time.perf_counter() - started
+            matches = match_fast_swaps(level, graph=graph)
+            elapsed = time.perf_counter() - started
+
+            with_matches = sum(1 for found in matches.values() if found['mutual'] or found['triangles'])
+            self.stdout.write(
+                f"{level.name}: {len(graph['nodes'])} nodes, {len(matches)} FastSwaps, "
+                f"{with_matches} with matches, "
+                f"{sum(len(found['mutual']) for found in matches.values())} mutual, "
+                f"{sum(len(found['triangles']) for found in matches.values())} triangles "
+                f"({loaded:.3f}s load, {elapsed:.3f}s total)"
+            )
+            if options['store']:
+                stored = write_fast_swap_matches(matches)
+                self.stdout.write(self.style.SUCCESS(f'  stored matches for {len(stored)} FastSwaps'))
+            report[level.name] = {
+                fs_id: {
+                    'mutual': [list(key) for key in found['mutual']],
+                    'triangles': [[list(b), list(c)] for b, c in found['triangles']],
+                }
+                for fs_id, found in matches.items()
+            }
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
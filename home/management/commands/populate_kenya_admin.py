@@ -1,5 +1,7 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from home.models import Counties, Constituencies, Wards
+from home.signals import bulk_location_load
 
 class Command(BaseCommand):
     help = 'Populates the database with Kenya administrative data (Counties, Constituencies, Wards)'
@@ -1572,25 +1574,30 @@ class Command(BaseCommand):
         # Counties.objects.all().delete()
 
         # Populate the database
-        for county_name, constituencies in KENYA_ADMIN.items():
-            # Create or get county
-            county, created = Counties.objects.get_or_create(name=county_name)
-            self.stdout.write(self.style.SUCCESS(f'Processing county: {county_name}'))
+        # One cache version bump for the whole load, not one per row
+        with bulk_location_load():
+            for county_name, constituencies in KENYA_ADMIN.items():
+                # Create or get county
+                county, created = Counties.objects.get_or_create(name=county_name)
+                self.stdout.write(self.style.SUCCESS(f'Processing county: {county_name}'))
             
-            for constituency_name, wards in constituencies.items():
-                # Create or get constituency
-                constituency, created = Constituencies.objects.get_or_create(
-                    name=constituency_name,
-                    county=county
-                )
-                self.stdout.write(f'  - Processing constituency: {constituency_name}')
-                
-                for ward_name in wards:
-                    # Create or get ward
-                    ward, created = Wards.objects.get_or_create(
-                        name=ward_name,
-                        constituency=constituency
+                for constituency_name, wards in constituencies.items():
+                    # Create or get constituency
+                    constituency, created = Constituencies.objects.get_or_create(
+                        name=constituency_name,
+                        county=county
                     )
-                    self.stdout.write(f'    - Added ward: {ward_name}')
+                    self.stdout.write(f'  - Processing constituency: {constituency_name}')
+                
+                    for ward_name in wards:
+                        # Create or get ward
+                        ward, created = Wards.objects.get_or_create(
+                            name=ward_name,
+                            constituency=constituency
+                        )
+                        self.stdout.write(f'    - Added ward: {ward_name}')
 
         self.stdout.write(self.style.SUCCESS('Successfully populated Kenya administrative data!'))
+
+        # The dropdowns read the data from the static bundle
+        call_command('build_geo_bundle')
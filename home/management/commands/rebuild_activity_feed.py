@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from home.activity_feed import FEED_SIZE, rebuild_feed
+from home.models import ActivityFeedEntry
+
+
+class Command(BaseCommand):
+    help = f'Refill the recent-activity feed with the {FEED_SIZE} newest public swaps and FastSwaps (see home.activity_feed)'
+
+    def handle(self, *args, **options):
+        rebuild_feed()
+        self.stdout.write(self.style.SUCCESS(f'Activity feed holds {ActivityFeedEntry.objects.count()} entries'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from users.models import MyUser
+from home.match_store import rebuild_match_edges, refresh_user_matches
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized match store (MatchEdge) from find_matches()'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            help='Only rebuild the edges of this teacher',
+        )
+
+    def handle(self, *args, **options):
+        if options['email']:
+            user = MyUser.objects.filter(email=options['email']).first()
+            if not user:
+                self.stdout.write(self.style.ERROR(f"No user with email {options['email']}"))
+                return
+            match_count = refresh_user_matches(user.id)
+            self.stdout.write(self.style.SUCCESS(f'{user.email} now has {match_count} stored matches'))
+            return
+
+        self.stdout.write('Rebuilding match edges...')
+        user_count, edge_count = rebuild_match_edges(stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {edge_count} match edges for {user_count} teachers'
+        ))
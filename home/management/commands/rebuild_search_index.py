@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from home.models import SwapSearchToken, Swaps
+from home.search import index_swaps
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search tokens of every swap (see home.search)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Indexing swaps...')
+        index_swaps(Swaps.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Swaps.objects.count()} swaps as {SwapSearchToken.objects.count()} tokens'
+        ))
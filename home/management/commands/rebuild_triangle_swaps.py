@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from users.models import MyUser
+from home.triangle_store import rebuild_triangle_swaps, refresh_user_triangles
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized triangle-swap store (TriangleSwap)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            help='Only recompute the triangles of this teacher',
+        )
+
+    def handle(self, *args, **options):
+        if options['email']:
+            user = MyUser.objects.filter(email=options['email']).first()
+            if not user:
+                self.stdout.write(self.style.ERROR(f"No user with email {options['email']}"))
+                return
+            triangle_count = refresh_user_triangles(user.id)
+            self.stdout.write(self.style.SUCCESS(f'{user.email} is now in {triangle_count} stored triangles'))
+            return
+
+        self.stdout.write('Rebuilding triangle swaps...')
+        triangle_count = rebuild_triangle_swaps(stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Stored {triangle_count} triangle swaps'))
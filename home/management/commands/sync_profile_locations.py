@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from home.locations import location_drift, sync_profile_locations
+from home.signals import refresh_user_swaps
+
+
+class Command(BaseCommand):
+    help = 'Backfill or check PersonalProfile.current_county / current_constituency against each school'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report profiles that are out of sync',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drifted = location_drift().select_related('user', 'school')
+            total = drifted.count()
+            for profile in drifted[:50]:
+                self.stdout.write(f'  {profile.user.email}: school {profile.school or "-"}')
+            if total:
+                self.stdout.write(self.style.ERROR(f'{total} profiles are out of sync'))
+            else:
+                self.stdout.write(self.style.SUCCESS('All profile locations are in sync'))
+            return
+
+        user_ids = sync_profile_locations()
+        # Matches, triangles and FastSwap matches all follow the current county
+        for user_id in user_ids:
+            refresh_user_swaps(user_id)
+        self.stdout.write(self.style.SUCCESS(f'Updated the location of {len(user_ids)} profiles'))
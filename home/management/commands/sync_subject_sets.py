@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from home.subject_sets import sync_all_subject_sets
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored subject fingerprints and bitsets of every teacher and FastSwap'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Syncing subject sets...')
+        profile_count, fast_swap_count = sync_all_subject_sets()
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {profile_count} teacher profiles and {fast_swap_count} fast swaps'
+        ))
+        self.stdout.write('Run rebuild_match_edges if subjects changed outside the app.')
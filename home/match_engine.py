@@ -0,0 +1,157 @@
+"""
+Vectorized mutual matching for a whole level.
+
+find_matches() answers "who matches this teacher" with a multi-table join.
+When every teacher of a level is needed (rebuilds, reports, benchmarks) this
+module loads the level once into NumPy arrays instead:
+
+- county[t]      index of teacher t's current county
+- wants[t, c]    True when county c is teacher t's desired_county or in
+                 their open_to_all
+- active[t]      teacher t is active (only active teachers are candidates)
+
+Teachers s and t match when wants[s, county[t]] and wants[t, county[s]],
+and, for secondary levels, their subject fingerprints are equal. The rules
+are the same as find_matches(), so counts agree with find_matches(u).count().
+"""
+import numpy as np
+
+from users.models import PersonalProfile
+from .models import SwapPreference
+
+
+def is_secondary_level(level):
+    name = level.name.lower()
+    return 'secondary' in name or 'high' in name
+
+
+def load_level_arrays(level):
+    """
+    Load every teacher of ``level`` with complete location data and
+    preferences. Two queries regardless of the number of teachers.
+    """
+    rows = list(
+        PersonalProfile.objects.filter(
+            level=level,
+            current_county__isnull=False,
+            user__swappreference__isnull=False,
+        ).values_list(
+            'user_id',
+            'current_county_id',
+            'user__is_active',
+            'subject_fingerprint',
+            'user__swappreference__id',
+            'user__swappreference__desired_county_id',
+        ).order_by('user_id')
+    )
+    open_to_all = SwapPreference.open_to_all.through.objects.filter(
+        swappreference__user__profile__level=level,
+    ).values_list('swappreference_id', 'counties_id')
+
+    county_ids = sorted(
+        {row[1] for row in rows}
+        | {row[5] for row in rows if row[5] is not None}
+        | {county_id for _, county_id in open_to_all}
+    )
+    county_index = {county_id: i for i, county_id in enumerate(county_ids)}
+    teacher_index = {row[4]: t for t, row in enumerate(rows)}
+
+    wants = np.zeros((len(rows), len(county_ids)), dtype=bool)
+    for t, row in enumerate(rows):
+        if row[5] is not None:
+            wants[t, county_index[row[5]]] = True
+    for preference_id, county_id in open_to_all:
+        t = teacher_index.get(preference_id)
+        if t is not None:
+            wants[t, county_index[county_id]] = True
+
+    return {
+        'user_ids': np.array([row[0] for row in rows], dtype=np.int64),
+        'county': np.array([county_index[row[1]] for row in rows], dtype=np.int64),
+        'active': np.array([row[2] for row in rows], dtype=bool),
+        'fingerprints': [row[3] for row in rows],
+        'wants': wants,
+        'county_ids': county_ids,
+    }
+
+
+def _match_group(members, county, active, wants, active_only):
+    """
+    Counts and active-active pairs for one group of mutually comparable
+    teachers (the whole level, or one subject fingerprint).
+    """
+    county = county[members]
+    wants = wants[members]
+    candidate = active[members] if active_only else np.ones(len(members), dtype=bool)
+    county_count = wants.shape[1]
+
+    # flows[x, y]: candidates currently in county x who want county y
+    onehot = np.zeros((len(members), county_count), dtype=np.int64)
+    onehot[np.arange(len(members)), county] = 1
+    flows = (onehot * candidate[:, None]).T @ wants.astype(np.int64)
+
+    # Teacher t matches every candidate in a county y it wants who wants t's
+    # county back: sum_y wants[t, y] * flows[y, county[t]], minus t itself.
+    counts = (wants * flows.T[county]).sum(axis=1)
+    counts -= (wants[np.arange(len(members)), county] & candidate).astype(np.int64)
+
+    pairs = []
+    mutual = (flows > 0) & (flows.T > 0)
+    for x, y in zip(*np.nonzero(np.triu(mutual))):
+        side_a = members[candidate & (county == x) & wants[:, y]]
+        if x == y:
+            for i in range(len(side_a)):
+                pairs.extend((side_a[i], other) for other in side_a[i + 1:])
+            continue
+        side_b = members[candidate & (county == y) & wants[:, x]]
+        pairs.extend(
+            zip(np.repeat(side_a, len(side_b)), np.tile(side_b, len(side_a)))
+        )
+    return counts, pairs
+
+
+def compute_level_matches(level, active_only=True):
+    """
+    All mutual matches of a level.
+
+    Returns a dict with:
+    - 'pairs':  list of (user_id, user_id) tuples, each unordered pair once,
+                between teachers that are both candidates (active)
+    - 'counts': {user_id: number of matches}, for every loaded teacher,
+                equal to find_matches(user, active_only).count()
+    """
+    arrays = load_level_arrays(level)
+    user_ids = arrays['user_ids']
+    counts = np.zeros(len(user_ids), dtype=np.int64)
+    pair_indexes = []
+
+    if is_secondary_level(level):
+        groups = {}
+        for t, fingerprint in enumerate(arrays['fingerprints']):
+            # No subjects means no secondary match at all
+            if fingerprint:
+                groups.setdefault(fingerprint, []).append(t)
+        member_groups = [np.array(members, dtype=np.int64) for members in groups.values()]
+    else:
+        member_groups = [np.arange(len(user_ids))]
+
+    for members in member_groups:
+        group_counts, group_pairs = _match_group(
+            members, arrays['county'], arrays['active'], arrays['wants'], active_only
+        )
+        counts[members] = group_counts
+        pair_indexes.extend(group_pairs)
+
+    return {
+        'pairs': [(int(user_ids[a]), int(user_ids[b])) for a, b in pair_indexes],
+        'counts': dict(zip(user_ids.tolist(), counts.tolist())),
+    }
+
+
+def matches_by_user(pairs):
+    """Turn a pair list into {user_id: [matched user ids]}."""
+    matches = {}
+    for a, b in pairs:
+        matches.setdefault(a, []).append(b)
+        matches.setdefault(b, []).append(a)
+    return matches
@@ -0,0 +1,97 @@
+"""
+Materialized match store.
+
+find_matches() joins five tables every time it runs. Its results are kept
+in MatchEdge instead and refreshed only for the teacher whose profile,
+preferences or subjects changed (see home.signals). Dashboard and admin
+lookups then become a single indexed read.
+
+Edges are directed: (user_a, user_b) means user_b is in find_matches(user_a).
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+
+from users.models import MyUser, PersonalProfile
+from .matching import find_matches, find_matches_many
+from .models import MatchEdge
+
+
+def refresh_user_matches(user_id):
+    """
+    Recompute every stored edge that involves the given teacher.
+    Returns the number of teachers the user now matches with.
+    """
+    user = MyUser.objects.select_related('profile__level').filter(pk=user_id).first()
+    if user is None:
+        return 0
+
+    # Who the user sees, and who sees the user. The second list may contain
+    # deactivated teachers because find_matches() does not filter the
+    # requesting user on is_active.
+    outgoing = list(find_matches(user).values_list('id', flat=True))
+    incoming = []
+    if user.is_active:
+        incoming = list(find_matches(user, active_only=False).values_list('id', flat=True))
+
+    level_id = user.profile.level_id if outgoing or incoming else None
+    edges = [
+        MatchEdge(user_a_id=user.id, user_b_id=match_id, level_id=level_id)
+        for match_id in outgoing
+    ]
+    edges.extend(
+        MatchEdge(user_a_id=match_id, user_b_id=user.id, level_id=level_id)
+        for match_id in incoming
+    )
+
+    with transaction.atomic():
+        MatchEdge.objects.filter(Q(user_a_id=user.id) | Q(user_b_id=user.id)).delete()
+        MatchEdge.objects.bulk_create(edges)
+
+    return len(outgoing)
+
+
+def rebuild_match_edges(stdout=None):
+    """
+    Rebuild the whole store from scratch. Used by the rebuild_match_edges
+    management command to recover from drift.
+    """
+    levels = dict(
+        PersonalProfile.objects.filter(level__isnull=False).values_list('user_id', 'level_id')
+    )
+    if stdout:
+        stdout.write(f"  matching {len(levels)} teachers...")
+
+    edges = [
+        MatchEdge(user_a_id=user_id, user_b_id=match_id, level_id=levels[user_id])
+        for user_id, match_ids in find_matches_many(levels).items()
+        for match_id in match_ids
+    ]
+
+    with transaction.atomic():
+        MatchEdge.objects.all().delete()
+        MatchEdge.objects.bulk_create(edges, batch_size=1000)
+
+    return len(levels), len(edges)
+
+
+def get_stored_matches(user):
+    """MyUser queryset of the teachers stored as matches for ``user``."""
+    return MyUser.objects.filter(
+        incoming_match_edges__user_a_id=user.id,
+        incoming_match_edges__kind='mutual',
+    ).select_related(
+        'profile__school__ward__constituency__county',
+        'profile__current_county',
+        'profile__level',
+        'swappreference__desired_county',
+    )
+
+
+def get_stored_match_counts(user_ids=None):
+    """Return {user_id: match_count} in a single grouped query."""
+    edges = MatchEdge.objects.filter(kind='mutual')
+    if user_ids is not None:
+        edges = edges.filter(user_a_id__in=list(user_ids))
+    return dict(
+        edges.values('user_a_id').annotate(total=Count('id')).values_list('user_a_id', 'total')
+    )
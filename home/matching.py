@@ -1,21 +1,37 @@
-from django.db.models import Q
-from users.models import MyUser
-from .models import MySubject
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, Value, When
+from users.models import MyUser, PersonalProfile
+from .models import SwapPreference
+from .subject_sets import subject_overlap_count
 
-def find_matches(user):
+# Points per signal in annotate_match_score(); a perfect match scores 100
+MATCH_SCORE_WEIGHTS = {
+    'desired_county': 25,      # per side: the other county is the desired one
+    'open_to_all_county': 15,  # per side: the other county is only in open_to_all
+    'constituency': 10,        # per side: desired constituency is the other's
+    'ward': 5,                 # per side: desired ward is the other's
+    'hardship': 5,             # per side: the other school suits is_hardship
+    'subjects': 10,            # share of the user's subjects the match teaches
+}
+
+
+def find_matches(user, active_only=True, ranked=False):
     """
     Finds matching teachers for a swap based on:
     1. Level (Primary vs Secondary)
     2. Location Preferences (Two-way match)
     3. Subject Preferences (Exact match for Secondary)
+
+    active_only=False also returns deactivated teachers; the match store
+    uses it to work out whose lists the user appears in.
+
+    ranked=True annotates each match with match_score (see
+    annotate_match_score) and orders best first, so slicing the result
+    gives the top matches in one query.
     """
     # Defensive checks
     if not hasattr(user, 'profile') or not user.profile:
         return MyUser.objects.none()
     
-    if not user.profile.school:
-        return MyUser.objects.none()
-    
     # Check teacher's level (NOT school level - teachers can have different level than their current school)
     if not user.profile.level:
         return MyUser.objects.none()
@@ -26,18 +42,13 @@ def find_matches(user):
         return MyUser.objects.none()
 
     # User's current details
-    user_school = user.profile.school
     user_level = user.profile.level  # IMPORTANT: Use teacher's level, not school's level!
     
-    # Check ward/constituency/county exist
-    if not user_school.ward:
+    # Current county is denormalized from school.ward.constituency.county
+    # and is empty whenever any link of that chain is missing
+    user_county = user.profile.current_county_id
+    if not user_county:
         return MyUser.objects.none()
-    if not user_school.ward.constituency:
-        return MyUser.objects.none()
-    if not user_school.ward.constituency.county:
-        return MyUser.objects.none()
-    
-    user_county = user_school.ward.constituency.county
     
     # User's preferences
     user_desired_county = user_prefs.desired_county
@@ -50,21 +61,20 @@ def find_matches(user):
     # 1. Base Filter: Active teachers, same level, with complete data
     potential_matches = MyUser.objects.filter(
         ~Q(id=user.id),
-        is_active=True,
         profile__isnull=False,
         profile__level=user_level,  # Match by TEACHER's level, not school level
-        profile__school__isnull=False,
-        profile__school__ward__isnull=False,
-        profile__school__ward__constituency__isnull=False,
-        profile__school__ward__constituency__county__isnull=False,
+        profile__current_county__isnull=False,
         swappreference__isnull=False
     ).select_related(
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference__desired_county',
         'profile__level'  # Select teacher's level
     ).prefetch_related(
         'swappreference__open_to_all'
     )
+    if active_only:
+        potential_matches = potential_matches.filter(is_active=True)
 
     # 2. Location Match (Two-Way)
     
@@ -83,7 +93,7 @@ def find_matches(user):
     if not my_target_counties:
         return MyUser.objects.none()
         
-    i_want_them = Q(profile__school__ward__constituency__county__id__in=my_target_counties)
+    i_want_them = Q(profile__current_county_id__in=my_target_counties)
     
     potential_matches = potential_matches.filter(they_want_me & i_want_them)
 
@@ -91,20 +101,188 @@ def find_matches(user):
     is_secondary = 'secondary' in user_level.name.lower() or 'high' in user_level.name.lower()
     
     if is_secondary:
-        # Get my subjects IDs
-        my_subject_ids = set(MySubject.objects.filter(user=user).values_list('subject__id', flat=True))
-        
-        if not my_subject_ids:
+        # Equal subject sets have equal fingerprints, so this is one indexed
+        # lookup instead of a MySubject query per candidate. Read it from the
+        # table: a cached user.profile can predate the latest subject change.
+        my_fingerprint = PersonalProfile.objects.filter(
+            user_id=user.id
+        ).values_list('subject_fingerprint', flat=True).first()
+
+        if not my_fingerprint:
             # Secondary teacher with no subjects - can't match
             return MyUser.objects.none()
-        
-        matches_with_correct_subjects = []
-        for match in potential_matches:
-            match_subject_ids = set(MySubject.objects.filter(user=match).values_list('subject__id', flat=True))
-            
-            if my_subject_ids == match_subject_ids:
-                matches_with_correct_subjects.append(match.id)
-                
-        potential_matches = potential_matches.filter(id__in=matches_with_correct_subjects)
-
-    return potential_matches.distinct()
+
+        potential_matches = potential_matches.filter(profile__subject_fingerprint=my_fingerprint)
+
+    potential_matches = potential_matches.distinct()
+    if ranked:
+        potential_matches = annotate_match_score(potential_matches, user).order_by('-match_score', 'id')
+    return potential_matches
+
+
+def _points(condition, points):
+    return Case(When(condition, then=Value(points)), default=Value(0), output_field=IntegerField())
+
+
+def annotate_match_score(queryset, user):
+    """
+    Annotate a MyUser queryset with match_score (0-100) against ``user``,
+    computed in the database from MATCH_SCORE_WEIGHTS:
+
+    - county: each side scores more when the other's county is their
+      desired_county than when it is only in open_to_all
+    - desired constituency and ward agreement, both ways
+    - is_hardship preference against the other teacher's school
+    - for secondary teachers, how many of the user's subjects they share
+    """
+    weights = MATCH_SCORE_WEIGHTS
+    profile = getattr(user, 'profile', None)
+    prefs = SwapPreference.objects.filter(user_id=user.id).first()
+    if not profile or not prefs:
+        return queryset.annotate(match_score=Value(0, output_field=IntegerField()))
+
+    my_county = profile.current_county_id
+    my_constituency = profile.current_constituency_id
+    my_school = profile.school
+    my_open_to_all = list(prefs.open_to_all.values_list('id', flat=True))
+
+    score = Value(0, output_field=IntegerField())
+
+    # They want to come to my county
+    if my_county:
+        they_listed_me = Exists(SwapPreference.open_to_all.through.objects.filter(
+            swappreference_id=OuterRef('swappreference__id'), counties_id=my_county
+        ))
+        score += Case(
+            When(swappreference__desired_county_id=my_county, then=Value(weights['desired_county'])),
+            When(they_listed_me, then=Value(weights['open_to_all_county'])),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    # I want to go to their county
+    whens = []
+    if prefs.desired_county_id:
+        whens.append(When(profile__current_county_id=prefs.desired_county_id, then=Value(weights['desired_county'])))
+    if my_open_to_all:
+        whens.append(When(profile__current_county_id__in=my_open_to_all, then=Value(weights['open_to_all_county'])))
+    if whens:
+        score += Case(*whens, default=Value(0), output_field=IntegerField())
+
+    # Constituency and ward agreement
+    if my_constituency:
+        score += _points(Q(swappreference__desired_constituency_id=my_constituency), weights['constituency'])
+    if prefs.desired_constituency_id:
+        score += _points(Q(profile__current_constituency_id=prefs.desired_constituency_id), weights['constituency'])
+    if my_school and my_school.ward_id:
+        score += _points(Q(swappreference__desired_ward_id=my_school.ward_id), weights['ward'])
+    if prefs.desired_ward_id:
+        score += _points(Q(profile__school__ward_id=prefs.desired_ward_id), weights['ward'])
+
+    # Hardship: 'Any' suits every school, 'Yes'/'No' must agree with is_hardship
+    if my_school:
+        suits_my_school = Q(swappreference__is_hardship='Any') | Q(
+            swappreference__is_hardship='Yes' if my_school.is_hardship else 'No'
+        )
+        score += _points(suits_my_school, weights['hardship'])
+    if prefs.is_hardship in ('Yes', 'No'):
+        score += _points(Q(profile__school__is_hardship=(prefs.is_hardship == 'Yes')), weights['hardship'])
+    else:
+        score += Value(weights['hardship'])
+
+    # Subjects
+    level = profile.level
+    is_secondary = level and ('secondary' in level.name.lower() or 'high' in level.name.lower())
+    if is_secondary:
+        my_bits = PersonalProfile.objects.filter(user_id=user.id).values_list('subject_bits', flat=True).first() or 0
+        subject_count = bin(my_bits).count('1')
+        if subject_count:
+            overlap = subject_overlap_count(my_bits)
+            score += Case(
+                *[
+                    When(Q(**{'match_subject_overlap': shared}), then=Value(round(weights['subjects'] * shared / subject_count)))
+                    for shared in range(1, subject_count + 1)
+                ],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            queryset = queryset.alias(match_subject_overlap=overlap)
+    else:
+        # Primary teachers are not matched on subjects
+        score += Value(weights['subjects'])
+
+    return queryset.annotate(match_score=score)
+
+
+def find_matches_many(users, active_only=True):
+    """
+    Batch version of find_matches().
+
+    Takes MyUser instances or ids and returns {user_id: [match ids]} for
+    each of them, with the same rules as find_matches(). Uses three queries
+    however many users are passed: one for their levels, one for every
+    complete teacher on those levels and one for their open_to_all counties.
+    """
+    user_ids = {getattr(user, 'id', user) for user in users}
+    results = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return results
+
+    level_ids = set(
+        PersonalProfile.objects.filter(
+            user_id__in=user_ids, level__isnull=False
+        ).values_list('level_id', flat=True)
+    )
+    if not level_ids:
+        return results
+
+    teachers = {}
+    for user_id, level_id, level_name, county_id, is_active, fingerprint, preference_id, desired_county_id in (
+        PersonalProfile.objects.filter(
+            level_id__in=level_ids,
+            current_county__isnull=False,
+            user__swappreference__isnull=False,
+        ).values_list(
+            'user_id',
+            'level_id',
+            'level__name',
+            'current_county_id',
+            'user__is_active',
+            'subject_fingerprint',
+            'user__swappreference__id',
+            'user__swappreference__desired_county_id',
+        )
+    ):
+        is_secondary = 'secondary' in level_name.lower() or 'high' in level_name.lower()
+        teachers[preference_id] = {
+            'id': user_id,
+            'county': county_id,
+            'active': is_active,
+            # Primary teachers match regardless of subjects
+            'group': (level_id, fingerprint if is_secondary else None),
+            'skip': is_secondary and not fingerprint,
+            'wants': {desired_county_id} if desired_county_id else set(),
+        }
+
+    for preference_id, county_id in SwapPreference.open_to_all.through.objects.filter(
+        swappreference_id__in=list(teachers)
+    ).values_list('swappreference_id', 'counties_id'):
+        teachers[preference_id]['wants'].add(county_id)
+
+    # Candidates bucketed by (level, fingerprint) and current county
+    buckets = {}
+    for teacher in teachers.values():
+        if teacher['skip'] or (active_only and not teacher['active']):
+            continue
+        buckets.setdefault((teacher['group'], teacher['county']), []).append(teacher)
+
+    for teacher in teachers.values():
+        if teacher['id'] not in user_ids or teacher['skip']:
+            continue
+        matches = set()
+        for county_id in teacher['wants']:
+            for candidate in buckets.get((teacher['group'], county_id), ()):
+                if candidate['id'] != teacher['id'] and teacher['county'] in candidate['wants']:
+                    matches.add(candidate['id'])
+        results[teacher['id']] = sorted(matches)
+
+    return results
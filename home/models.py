@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.urls import reverse
 from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
@@ -123,6 +124,13 @@ class Swaps(models.Model):
     status = models.BooleanField(default=True)
     archived = models.BooleanField(default=False)
     closed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pages of the swap listings, see home.listings
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
     def __str__(self):
         return f"{self.user}"
 
@@ -163,6 +171,72 @@ class SwapPreference(models.Model):
         verbose_name = "Swap Preference"
         verbose_name_plural = "Swap Preferences"
 
+class MatchEdge(models.Model):
+    """
+    Materialized result of find_matches().
+    A row (user_a, user_b) means user_b shows up in find_matches(user_a).
+    Rows are refreshed per teacher by home.match_store whenever their
+    profile, preferences or subjects change.
+    """
+    MATCH_KINDS = (
+        ('mutual', 'Mutual'),
+    )
+    user_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='match_edges')
+    user_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='incoming_match_edges')
+    level = models.ForeignKey(Level, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=MATCH_KINDS, default='mutual')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('user_a', 'user_b', 'kind')]
+        indexes = [
+            models.Index(fields=['user_a', 'kind']),
+            models.Index(fields=['level', 'kind']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_a} <-> {self.user_b} ({self.kind})"
+
+
+class TriangleSwap(models.Model):
+    """
+    Materialized three-way swap: teacher_a -> teacher_b -> teacher_c ->
+    teacher_a, where each teacher moves to the next one's county. Counties
+    and common subjects are stored as they were when the triangle was
+    found. Rows are refreshed per teacher by home.triangle_store.
+    """
+    teacher_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='triangles_as_a')
+    teacher_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='triangles_as_b')
+    teacher_c = models.ForeignKey(User, on_delete=models.CASCADE, related_name='triangles_as_c')
+    level = models.ForeignKey(Level, on_delete=models.CASCADE)
+    county_a = models.ForeignKey(Counties, on_delete=models.CASCADE, related_name='+')
+    county_b = models.ForeignKey(Counties, on_delete=models.CASCADE, related_name='+')
+    county_c = models.ForeignKey(Counties, on_delete=models.CASCADE, related_name='+')
+    common_subjects = models.ManyToManyField(Subject, blank=True, related_name='+')
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('teacher_a', 'teacher_b', 'teacher_c')]
+        indexes = [
+            models.Index(fields=['level', 'county_a']),
+        ]
+
+    def __str__(self):
+        return f"{self.teacher_a} -> {self.teacher_b} -> {self.teacher_c}"
+
+    def rotated_for(self, user):
+        """
+        [(teacher, county), ...] in cycle order, starting with ``user``.
+        """
+        members = [
+            (self.teacher_a, self.county_a),
+            (self.teacher_b, self.county_b),
+            (self.teacher_c, self.county_c),
+        ]
+        start = [self.teacher_a_id, self.teacher_b_id, self.teacher_c_id].index(user.id)
+        return members[start:] + members[:start]
+
+
 class FastSwap(models.Model):
     names = models.CharField(max_length=255)
     phone = models.CharField(max_length=255)
@@ -174,12 +248,121 @@ class FastSwap(models.Model):
     acceptable_county = models.ManyToManyField(Counties, related_name='acceptable_county')
     level = models.ForeignKey(Level, on_delete=models.CASCADE)
     subjects = models.ManyToManyField(Subject)
+    # Derived from subjects, see home.subject_sets
+    subject_fingerprint = models.CharField(max_length=40, blank=True, default='', db_index=True)
+    subject_bits = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pages of the FastSwap list, see home.pagination
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['level', '-created_at', '-id']),
+        ]
+
     def __str__(self):
         return self.names
 
 
+class FastSwapMatchCache(models.Model):
+    """
+    Stored result of the FastSwap matchers for one entry, so the detail
+    page doesn't rerun them on every view. Matched entities are kept as
+    [type, id] keys of home.fast_swap_graph. Rows are marked stale by
+    home.fast_swap_store when anything on the level changes and recomputed
+    on the next read.
+    """
+    fast_swap = models.OneToOneField(FastSwap, on_delete=models.CASCADE, related_name='match_cache')
+    mutual = models.JSONField(default=list, blank=True)
+    triangles = models.JSONField(default=list, blank=True)
+    is_stale = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Matches for {self.fast_swap}"
+
+
+class SwapSearchToken(models.Model):
+    """
+    One word a swap can be found by: from the poster's school, its ward,
+    constituency and county, the poster's level and subjects, or the
+    location the swap asks for. Kept in sync by home.search.
+    """
+    SOURCES = (
+        ('school', 'School'),
+        ('ward', 'Ward'),
+        ('constituency', 'Constituency'),
+        ('county', 'County'),
+        ('level', 'Level'),
+        ('subject', 'Subject'),
+        ('wanted', 'Wanted location'),
+    )
+    swap = models.ForeignKey(Swaps, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    source = models.CharField(max_length=20, choices=SOURCES)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = [('swap', 'token', 'source')]
+        indexes = [
+            models.Index(fields=['token', 'swap']),
+        ]
+
+    def __str__(self):
+        return f"{self.token} ({self.source}) -> swap {self.swap_id}"
+
+
+class ActivityFeedEntry(models.Model):
+    """
+    A recent public listing (an active swap or a FastSwap) with the fields
+    its preview card shows, copied in so the landing page, previews and
+    sitemap read the feed without joins. Kept in sync and trimmed by
+    home.activity_feed.
+    """
+    KINDS = (
+        ('swap', 'Swap'),
+        ('fastswap', 'FastSwap'),
+    )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    swap = models.OneToOneField(Swaps, on_delete=models.CASCADE, null=True, blank=True, related_name='feed_entry')
+    fast_swap = models.OneToOneField(FastSwap, on_delete=models.CASCADE, null=True, blank=True, related_name='feed_entry')
+    school_name = models.CharField(max_length=255)
+    level_name = models.CharField(max_length=255)
+    from_county = models.CharField(max_length=255)
+    to_county = models.CharField(max_length=255)
+    # When the listing was posted; the feed's order
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', '-created_at', '-id']),
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.school_name} ({self.from_county} -> {self.to_county})"
+
+    def get_absolute_url(self):
+        if self.kind == 'swap':
+            return reverse('home:swap_detail', args=[self.swap_id])
+        return reverse('home:fast_swap_detail', args=[self.fast_swap_id])
+
+
+class CacheVersion(models.Model):
+    """
+    Version stamp of a process-local cache, bumped on every change to the
+    data behind it so that all workers notice and reload (home.cache_versions).
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
 class Bookmark(models.Model):
     """
     Model to store user bookmarks/wishlist for swaps and fast swaps.
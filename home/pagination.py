@@ -0,0 +1,112 @@
+"""
+Keyset (cursor) pagination.
+
+OFFSET pagination gets slower the deeper the page, because the database
+still walks every skipped row. A keyset page instead continues from the
+sort key of the last row shown - WHERE (created_at, id) < (last_created,
+last_id) - which an index on the sort columns answers in the same time at
+any depth. The price is that pages are reached by "next" / "previous"
+links rather than by number.
+
+Cursors are opaque url-safe strings holding the direction and the sort
+values of the row to continue from. The last ordering field must be
+unique (normally the id) so every row has a distinct position. Ordering
+fields may also be annotations of the queryset, e.g. a computed score.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 24
+
+
+def _field_name(ordering):
+    return ordering.lstrip('-')
+
+
+def _encode(direction, values):
+    payload = json.dumps([direction, values], separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _to_python(model, name, value):
+    try:
+        return model._meta.get_field(name).to_python(value)
+    except FieldDoesNotExist:
+        # An annotation: JSON already holds its number or string
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f'Bad cursor value for {name}')
+        return value
+
+
+def _decode(cursor, model, ordering):
+    """
+    (direction, values) of a cursor, or None when it can't be read. Cursors
+    come from the query string, so anything that isn't a full set of
+    non-null sort values - None can't be compared in SQL - is rejected.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('next', 'previous') or not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        values = [_to_python(model, _field_name(order), value) for order, value in zip(ordering, values)]
+    except Exception:
+        return None
+    if any(value is None for value in values):
+        return None
+    return direction, values
+
+
+def _position(obj, ordering):
+    return [getattr(obj, _field_name(order)) for order in ordering]
+
+
+def _after(ordering, values):
+    """Q for rows that sort after ``values`` under ``ordering``."""
+    condition = Q()
+    for i in reversed(range(len(ordering))):
+        name = _field_name(ordering[i])
+        lookup = 'lt' if ordering[i].startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        if i < len(ordering) - 1:
+            step |= Q(**{name: values[i]}) & condition
+        condition = step
+    return condition
+
+
+def _flip(order):
+    return order[1:] if order.startswith('-') else f'-{order}'
+
+
+def keyset_page(queryset, ordering=('-created_at', '-id'), cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    One page of ``queryset`` in ``ordering``, starting at ``cursor``
+    (the first page when it is missing or invalid). One query.
+
+    Returns {'items': list, 'next_cursor', 'previous_cursor'}; a cursor
+    is None when there is no page in that direction.
+    """
+    ordering = tuple(ordering)
+    decoded = _decode(cursor, queryset.model, ordering) if cursor else None
+
+    if decoded and decoded[0] == 'previous':
+        flipped = tuple(_flip(order) for order in ordering)
+        rows = list(queryset.filter(_after(flipped, decoded[1])).order_by(*flipped)[:page_size + 1])
+        has_more = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        has_previous, has_next = has_more, True
+    else:
+        if decoded:
+            queryset = queryset.filter(_after(ordering, decoded[1]))
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        items = rows[:page_size]
+        has_next, has_previous = len(rows) > page_size, decoded is not None
+
+    return {
+        'items': items,
+        'next_cursor': _encode('next', _position(items[-1], ordering)) if items and has_next else None,
+        'previous_cursor': _encode('previous', _position(items[0], ordering)) if items and has_previous else None,
+    }
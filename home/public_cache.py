@@ -0,0 +1,103 @@
+"""
+Cached public pages.
+
+The landing page and the swap listings are mostly opened by anonymous
+visitors following shared links, and render the same for all of them. Their
+anonymous responses are cached per query string (cache_anonymous_page), and
+the parts of a page that don't depend on the viewer - swap cards, filter
+dropdowns - are template fragments cached with {% cache %}, so logged-in
+pages reuse them too.
+
+Every key carries the public cache version, a CacheVersion row shared by all
+workers (home.cache_versions) - the cache itself is per process. home.signals
+bumps the version when a Swaps, FastSwap, poster profile or location row
+changes, which retires every cached page and fragment in every worker at
+once; old entries expire after PUBLIC_CACHE_SECONDS.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .cache_versions import bump_version, stored_version
+
+PUBLIC_CACHE_SECONDS = 300
+
+VERSION_NAME = 'public_pages'
+
+# Query parameters added by share links that don't change the page
+TRACKING_PARAMETERS = ('fbclid', 'gclid', 'igshid')
+
+# {% csrf_token %} output is per visitor: cached pages hold a placeholder
+CSRF_PLACEHOLDER = '__public_cache_csrf_token__'
+_CSRF_INPUT = 'name="csrfmiddlewaretoken" value="'
+
+
+def public_cache_version():
+    """The shared version; one query, so every worker sees a bump at once."""
+    return stored_version(VERSION_NAME)
+
+
+def bump_public_cache():
+    """Retire every cached public page and fragment, in every worker."""
+    bump_version(VERSION_NAME)
+
+
+def public_cache_context():
+    """Template variables for the {% cache %} fragments of public pages."""
+    return {
+        'public_cache_version': public_cache_version(),
+        'public_cache_seconds': PUBLIC_CACHE_SECONDS,
+    }
+
+
+def page_cache_key(request, name):
+    """Key of a page for this query string, ignoring share-tracking parameters."""
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        if key not in TRACKING_PARAMETERS and not key.startswith('utm_')
+        for value in values
+    )
+    digest = hashlib.md5(urlencode(params).encode()).hexdigest()
+    return f'public_page:{public_cache_version()}:{name}:{digest}'
+
+
+def _strip_csrf(content):
+    start = content.find(_CSRF_INPUT)
+    while start != -1:
+        start += len(_CSRF_INPUT)
+        end = content.find('"', start)
+        content = content[:start] + CSRF_PLACEHOLDER + content[end:]
+        start = content.find(_CSRF_INPUT, start)
+    return content
+
+
+def cache_anonymous_page(view):
+    """
+    Serve anonymous GETs of ``view`` from the cache. Logged-in users,
+    visitors with pending messages and responses other than a plain 200
+    are never cached.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated or len(get_messages(request)):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request, view.__name__)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content.replace(CSRF_PLACEHOLDER, get_token(request)), content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not response.cookies:
+            content = _strip_csrf(response.content.decode(response.charset))
+            cache.set(key, (content, response['Content-Type']), PUBLIC_CACHE_SECONDS)
+        return response
+
+    return wrapper
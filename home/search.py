@@ -0,0 +1,168 @@
+"""
+Free-text search over swap listings.
+
+Each swap is indexed as SwapSearchToken rows, one per word of the
+poster's school name, ward, constituency, county, level and subjects and
+of the location the swap asks for, each weighted by where it came from.
+home.signals re-indexes the swaps affected by any change to those
+(index_swaps, reindex_users, reindex_matching); ``manage.py
+rebuild_search_index`` fills the table from scratch.
+
+Words are folded in Python - lowercased, accents dropped, split on
+anything that isn't a letter or digit - on the way in and on the way out,
+and the database only ever compares folded words with = and LIKE 'word%'.
+That keeps matching the same on SQLite and on MySQL whatever the
+collation. (istartswith, not startswith: on MySQL startswith is LIKE
+BINARY, which can't use the token index.)
+
+search_swaps() finds the active swaps where every query word is a prefix
+of some indexed word, ranked by the summed weight of the matching words
+(doubled when a word matches exactly), then newest first. It is one
+grouped query over the (token, swap) index per page, with keyset cursors
+(home.pagination) on the rank.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Sum, Value, When
+
+from .listings import swap_rows
+from .models import SwapSearchToken, Swaps
+from .pagination import keyset_page
+
+MIN_WORD_LENGTH = 2
+MAX_WORD_LENGTH = 64
+MAX_QUERY_WORDS = 8
+SEARCH_PAGE_SIZE = 20
+SEARCH_ORDERING = ('-search_rank', '-created_at', '-id')
+
+# SwapSearchToken.source -> weight
+WEIGHTS = {
+    'school': 8,
+    'subject': 5,
+    'ward': 4,
+    'constituency': 3,
+    'county': 3,
+    'level': 2,
+    'wanted': 1,
+}
+
+INDEX_BATCH_SIZE = 500
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    """The folded words of ``text``, in order, without repeats."""
+    decomposed = unicodedata.normalize('NFKD', str(text or ''))
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+    found = []
+    for word in _WORD.findall(folded):
+        word = word[:MAX_WORD_LENGTH]
+        if len(word) >= MIN_WORD_LENGTH and word not in found:
+            found.append(word)
+    return found
+
+
+def _sources(swap, subjects):
+    profile = getattr(swap.user, 'profile', None)
+    school = getattr(profile, 'school', None)
+    ward = school.ward if school else None
+    yield 'school', school.name if school else None
+    yield 'ward', ward.name if ward else None
+    yield 'constituency', ward.constituency.name if ward else None
+    yield 'county', ward.constituency.county.name if ward else None
+    yield 'level', profile.level.name if profile and profile.level else None
+    for subject in subjects:
+        yield 'subject', subject.name
+    for place in (swap.county, swap.constituency, swap.ward):
+        yield 'wanted', place.name if place else None
+
+
+def swap_tokens(swap, subjects):
+    """Unsaved SwapSearchToken rows for a swap and its poster's subjects."""
+    tokens = {}
+    for source, text in _sources(swap, subjects):
+        for word in words(text):
+            tokens.setdefault((word, source), SwapSearchToken(swap=swap, token=word, source=source, weight=WEIGHTS[source]))
+    return list(tokens.values())
+
+
+def index_swaps(swaps):
+    """(Re)build the tokens of ``swaps`` (a Swaps queryset), in batches."""
+    swaps = swaps.select_related(
+        'county', 'constituency', 'ward',
+        'user__profile__level',
+        'user__profile__school__ward__constituency__county',
+    ).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(swaps.filter(id__gt=last_id)[:INDEX_BATCH_SIZE])
+        if not batch:
+            return
+        tokens = []
+        for row in swap_rows(batch):
+            tokens.extend(swap_tokens(row['swap'], row['user_subjects']))
+        with transaction.atomic():
+            SwapSearchToken.objects.filter(swap__in=batch).delete()
+            SwapSearchToken.objects.bulk_create(tokens, batch_size=INDEX_BATCH_SIZE)
+        last_id = batch[-1].id
+
+
+def reindex_users(user_ids):
+    """Re-index the swaps of these posters (profile, school or subjects changed)."""
+    index_swaps(Swaps.objects.filter(user_id__in=list(user_ids)))
+
+
+def reindex_matching(condition):
+    """
+    Re-index the swaps matching a Q, e.g. after a ward is renamed:
+    reindex_matching(Q(ward=ward) | Q(user__profile__school__ward=ward)).
+    """
+    index_swaps(Swaps.objects.filter(condition))
+
+
+def search_swaps(query, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    """
+    One page of active swaps matching every word of ``query``. Returns
+    {'rows': [{'swap', 'user_school', 'user_subjects', 'rank'}],
+    'next_cursor', 'previous_cursor', 'words'}; no rows without a word
+    of MIN_WORD_LENGTH.
+    """
+    terms = words(query)[:MAX_QUERY_WORDS]
+    if not terms:
+        return {'rows': [], 'next_cursor': None, 'previous_cursor': None, 'words': []}
+
+    matches = Q()
+    for term in terms:
+        matches |= Q(search_tokens__token__istartswith=term)
+    # The filter narrows the joined tokens that the aggregates below see
+    swaps = Swaps.objects.filter(archived=False, status=True).filter(matches)
+
+    terms_matched = sum(
+        (Max(Case(When(search_tokens__token__istartswith=term, then=Value(1)), default=Value(0))) for term in terms),
+        Value(0),
+    )
+    swaps = swaps.annotate(
+        search_terms=terms_matched,
+        search_rank=Sum(Case(
+            When(search_tokens__token__in=terms, then=F('search_tokens__weight') * 2),
+            default=F('search_tokens__weight'),
+            output_field=IntegerField(),
+        )),
+    ).filter(search_terms=len(terms)).select_related(
+        'county', 'constituency', 'ward',
+        'user__profile__school__ward__constituency__county',
+    )
+
+    page = keyset_page(swaps, ordering=SEARCH_ORDERING, cursor=cursor, page_size=page_size)
+    rows = swap_rows(page['items'])
+    for row in rows:
+        row['rank'] = row['swap'].search_rank
+    return {
+        'rows': rows,
+        'next_cursor': page['next_cursor'],
+        'previous_cursor': page['previous_cursor'],
+        'words': terms,
+    }
@@ -0,0 +1,325 @@
+"""
+Signals that keep derived data in sync with the data it is computed from:
+the subject-set columns (home.subject_sets), the denormalized profile
+locations (home.locations) and the materialized match and triangle stores
+(home.match_store, home.triangle_store). Derived columns are synced first
+because the matchers read them. Changes to anything the public pages show
+also retire the cached pages (home.public_cache), and location or
+taxonomy changes reload the in-process copy of them (home.geo_cache).
+Swaps are re-indexed for search (home.search) whenever a word they can be
+found by may have changed, and new or changed listings are recorded in the
+recent-activity feed (home.activity_feed).
+"""
+from contextlib import contextmanager
+
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import MyUser, PersonalProfile
+from .activity_feed import rebuild_feed, record_fast_swap, record_swap, refresh_user
+from .fast_swap_store import mark_level_stale, mark_user_level_stale
+from .geo_cache import bump_geography_version
+from .locations import sync_profile_locations
+from .match_store import refresh_user_matches
+from .models import Constituencies, Counties, FastSwap, Level, MySubject, Schools, Subject, SwapPreference, Swaps, Wards
+from .public_cache import bump_public_cache
+from .search import index_swaps, reindex_matching, reindex_users
+from .subject_sets import (
+    clear_subject_bit_cache,
+    sync_all_subject_sets,
+    sync_fast_swap_subject_set,
+    sync_user_subject_set,
+)
+from .triangle_store import refresh_user_triangles
+
+M2M_ACTIONS = ('post_add', 'post_remove', 'post_clear')
+
+LOCATION_MODELS = (Counties, Constituencies, Wards)
+
+_bulk_load = {'depth': 0, 'changed': False}
+
+
+@contextmanager
+def bulk_location_load():
+    """
+    Bump the geography and public cache versions once, on exit, instead of
+    once per saved location, level or subject row. For commands that load
+    thousands of rows (populate_kenya_admin, load_subjects).
+    """
+    _bulk_load['depth'] += 1
+    try:
+        yield
+    finally:
+        _bulk_load['depth'] -= 1
+        if not _bulk_load['depth'] and _bulk_load['changed']:
+            _bulk_load['changed'] = False
+            bump_geography_version()
+            bump_public_cache()
+
+
+def _deferred_by_bulk_load():
+    if _bulk_load['depth']:
+        _bulk_load['changed'] = True
+    return bool(_bulk_load['depth'])
+
+
+def refresh_user_swaps(user_id, previous_level_id=None):
+    refresh_user_matches(user_id)
+    refresh_user_triangles(user_id)
+    mark_user_level_stale(user_id, previous_level_id)
+
+
+@receiver(pre_save, sender=PersonalProfile)
+def remember_level_before_profile_save(sender, instance, **kwargs):
+    # FastSwaps on the level a teacher leaves have to be recomputed too
+    instance._level_before_save = (
+        PersonalProfile.objects.filter(pk=instance.pk).values_list('level_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=PersonalProfile)
+def refresh_matches_on_profile_save(sender, instance, **kwargs):
+    # A full save writes back whatever subject columns the instance was
+    # loaded with, so recompute them every time.
+    sync_user_subject_set(instance.user_id)
+    refresh_user_swaps(instance.user_id, getattr(instance, '_level_before_save', None))
+
+
+@receiver(post_save, sender=SwapPreference)
+def refresh_matches_on_preference_save(sender, instance, **kwargs):
+    refresh_user_swaps(instance.user_id)
+
+
+@receiver(m2m_changed, sender=SwapPreference.open_to_all.through)
+def refresh_matches_on_open_to_all_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        refresh_user_swaps(instance.user_id)
+    elif pk_set:
+        # Counties.open_to_all.add(...) - instance is a county, pk_set holds preferences
+        for user_id in SwapPreference.objects.filter(pk__in=pk_set).values_list('user_id', flat=True):
+            refresh_user_swaps(user_id)
+
+
+@receiver(post_save, sender=MySubject)
+@receiver(post_delete, sender=MySubject)
+def refresh_matches_on_mysubject_change(sender, instance, **kwargs):
+    sync_user_subject_set(instance.user_id)
+    refresh_user_swaps(instance.user_id)
+
+
+@receiver(m2m_changed, sender=MySubject.subject.through)
+def refresh_matches_on_subject_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        sync_user_subject_set(instance.user_id)
+        refresh_user_swaps(instance.user_id)
+    elif pk_set:
+        for user_id in MySubject.objects.filter(pk__in=pk_set).values_list('user_id', flat=True).distinct():
+            sync_user_subject_set(user_id)
+            refresh_user_swaps(user_id)
+
+
+@receiver(post_save, sender=MyUser)
+def refresh_matches_on_user_save(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only; just (de)activation changes who matches.
+    if created or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    refresh_user_swaps(instance.id)
+
+
+@receiver(post_save, sender=FastSwap)
+def sync_subjects_on_fast_swap_save(sender, instance, **kwargs):
+    sync_fast_swap_subject_set(instance.pk)
+    mark_level_stale(instance.level_id)
+
+
+@receiver(post_delete, sender=FastSwap)
+def mark_matches_stale_on_fast_swap_delete(sender, instance, **kwargs):
+    mark_level_stale(instance.level_id)
+
+
+@receiver(m2m_changed, sender=FastSwap.subjects.through)
+def sync_subjects_on_fast_swap_subject_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        sync_fast_swap_subject_set(instance.pk)
+        mark_level_stale(instance.level_id)
+    elif pk_set:
+        for fast_swap_id in pk_set:
+            sync_fast_swap_subject_set(fast_swap_id)
+        for level_id in FastSwap.objects.filter(pk__in=pk_set).values_list('level_id', flat=True).distinct():
+            mark_level_stale(level_id)
+
+
+@receiver(m2m_changed, sender=FastSwap.acceptable_county.through)
+def mark_matches_stale_on_acceptable_county_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        mark_level_stale(instance.level_id)
+    elif pk_set:
+        for level_id in FastSwap.objects.filter(pk__in=pk_set).values_list('level_id', flat=True).distinct():
+            mark_level_stale(level_id)
+
+
+@receiver(post_save, sender=Subject)
+def clear_bits_on_subject_save(sender, **kwargs):
+    clear_subject_bit_cache()
+
+
+@receiver(post_delete, sender=Subject)
+def resync_subject_sets_on_subject_delete(sender, instance, **kwargs):
+    # Bit positions shift and the cascade removes m2m rows without signals
+    sync_all_subject_sets()
+
+
+def _sync_locations_and_swaps(profiles):
+    for user_id in sync_profile_locations(profiles):
+        refresh_user_swaps(user_id)
+
+
+@receiver(post_save, sender=Schools)
+def sync_locations_on_school_save(sender, instance, created, **kwargs):
+    if not created:
+        _sync_locations_and_swaps(PersonalProfile.objects.filter(school=instance))
+
+
+@receiver(post_save, sender=Wards)
+def sync_locations_on_ward_save(sender, instance, created, **kwargs):
+    if not created:
+        _sync_locations_and_swaps(PersonalProfile.objects.filter(school__ward=instance))
+
+
+@receiver(post_save, sender=Constituencies)
+def sync_locations_on_constituency_save(sender, instance, created, **kwargs):
+    if not created:
+        _sync_locations_and_swaps(PersonalProfile.objects.filter(school__ward__constituency=instance))
+
+
+@receiver(post_save, sender=Swaps)
+@receiver(post_delete, sender=Swaps)
+@receiver(post_save, sender=FastSwap)
+@receiver(post_delete, sender=FastSwap)
+@receiver(post_save, sender=PersonalProfile)
+@receiver(post_save, sender=Schools)
+@receiver(post_save, sender=Counties)
+@receiver(post_delete, sender=Counties)
+@receiver(post_save, sender=Constituencies)
+@receiver(post_delete, sender=Constituencies)
+@receiver(post_save, sender=Wards)
+@receiver(post_delete, sender=Wards)
+def bump_public_cache_on_save(sender, **kwargs):
+    if sender in LOCATION_MODELS and _deferred_by_bulk_load():
+        return
+    bump_public_cache()
+
+
+@receiver(m2m_changed, sender=FastSwap.subjects.through)
+@receiver(m2m_changed, sender=FastSwap.acceptable_county.through)
+@receiver(m2m_changed, sender=MySubject.subject.through)
+def bump_public_cache_on_m2m_change(sender, action, **kwargs):
+    if action in M2M_ACTIONS:
+        bump_public_cache()
+
+
+@receiver(post_save, sender=Counties)
+@receiver(post_delete, sender=Counties)
+@receiver(post_save, sender=Constituencies)
+@receiver(post_delete, sender=Constituencies)
+@receiver(post_save, sender=Wards)
+@receiver(post_delete, sender=Wards)
+@receiver(post_save, sender=Level)
+@receiver(post_delete, sender=Level)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def bump_geography_on_change(sender, **kwargs):
+    if not _deferred_by_bulk_load():
+        bump_geography_version()
+
+
+@receiver(post_save, sender=Swaps)
+def index_swap_on_save(sender, instance, **kwargs):
+    index_swaps(Swaps.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=PersonalProfile)
+@receiver(post_save, sender=MySubject)
+@receiver(post_delete, sender=MySubject)
+def reindex_swaps_on_poster_change(sender, instance, **kwargs):
+    reindex_users([instance.user_id])
+
+
+@receiver(m2m_changed, sender=MySubject.subject.through)
+def reindex_swaps_on_poster_subject_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        reindex_users([instance.user_id])
+    elif pk_set:
+        reindex_users(MySubject.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Schools)
+def reindex_swaps_on_school_save(sender, instance, created, **kwargs):
+    if not created:
+        reindex_matching(Q(user__profile__school=instance))
+
+
+@receiver(post_save, sender=Wards)
+def reindex_swaps_on_ward_save(sender, instance, created, **kwargs):
+    if not created:
+        reindex_matching(Q(ward=instance) | Q(user__profile__school__ward=instance))
+
+
+@receiver(post_save, sender=Constituencies)
+def reindex_swaps_on_constituency_save(sender, instance, created, **kwargs):
+    if not created:
+        reindex_matching(Q(constituency=instance) | Q(user__profile__school__ward__constituency=instance))
+
+
+@receiver(post_save, sender=Counties)
+def reindex_swaps_on_county_save(sender, instance, created, **kwargs):
+    if not created:
+        reindex_matching(Q(county=instance) | Q(user__profile__school__ward__constituency__county=instance))
+
+
+@receiver(post_save, sender=Level)
+def reindex_swaps_on_level_save(sender, instance, created, **kwargs):
+    if not created:
+        reindex_matching(Q(user__profile__level=instance))
+
+
+@receiver(post_save, sender=Subject)
+def reindex_swaps_on_subject_save(sender, instance, created, **kwargs):
+    if not created:
+        reindex_users(MySubject.objects.filter(subject=instance).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Swaps)
+def record_swap_in_feed(sender, instance, **kwargs):
+    record_swap(instance.pk)
+
+
+@receiver(post_save, sender=FastSwap)
+def record_fast_swap_in_feed(sender, instance, **kwargs):
+    record_fast_swap(instance.pk)
+
+
+@receiver(post_save, sender=PersonalProfile)
+def refresh_feed_on_profile_save(sender, instance, **kwargs):
+    refresh_user(instance.user_id)
+
+
+@receiver(post_save, sender=Schools)
+@receiver(post_save, sender=Counties)
+@receiver(post_save, sender=Level)
+def rebuild_feed_on_rename(sender, instance, created, **kwargs):
+    # Preview cards show school, county and level names
+    if not created:
+        rebuild_feed()
@@ -0,0 +1,181 @@
+"""
+Compact subject-set representation.
+
+Every teacher (PersonalProfile) and every FastSwap carries two derived
+columns describing its subject set:
+
+- subject_fingerprint: sha1 of the sorted subject ids ('' for no subjects).
+  Two sets are equal exactly when their fingerprints are equal, so the
+  "same subjects" rule for secondary matching becomes an indexed lookup.
+- subject_bits: a bitset with one bit per subject of the level. Shared
+  subjects are found with a bitwise AND in SQL.
+
+The columns are kept in sync by home.signals; `manage.py sync_subject_sets`
+rebuilds them for everyone.
+
+Bit positions are derived from the Subject table and cached per worker.
+Deleting a subject moves later bits, so the cache is keyed on the shared
+geography version (home.geo_cache), which every Subject save and delete
+bumps: other workers rebuild it within geo_cache.CHECK_SECONDS.
+"""
+import hashlib
+import logging
+
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+from . import geo_cache
+from .models import FastSwap, MySubject, Subject
+
+logger = logging.getLogger(__name__)
+
+# Bits available per level in a signed 64-bit column
+MAX_SUBJECT_BITS = 63
+
+_bit_positions = {}
+_built_at = {'version': None}
+_levels_over_limit = set()
+
+
+def clear_subject_bit_cache():
+    _bit_positions.clear()
+
+
+def subject_bit_positions():
+    """
+    Map subject id -> bit position. Positions are the subject's rank within
+    its level ordered by id, so adding subjects never moves existing bits.
+    Subjects past the first MAX_SUBJECT_BITS of a level map to None: they
+    count towards the fingerprint but not towards bitwise overlap.
+    """
+    version = geo_cache.geography_version()
+    if not _bit_positions or _built_at['version'] != version:
+        _bit_positions.clear()
+        _built_at['version'] = version
+        next_bit = {}
+        for subject_id, level_id in Subject.objects.order_by('id').values_list('id', 'level_id'):
+            bit = next_bit.get(level_id, 0)
+            next_bit[level_id] = bit + 1
+            _bit_positions[subject_id] = bit if bit < MAX_SUBJECT_BITS else None
+            if bit == MAX_SUBJECT_BITS and level_id not in _levels_over_limit:
+                _levels_over_limit.add(level_id)
+                logger.warning(
+                    "Level %s has more than %s subjects; the rest are left out of subject overlap scores",
+                    level_id, MAX_SUBJECT_BITS,
+                )
+    return _bit_positions
+
+
+def subject_fingerprint(subject_ids):
+    """Canonical fingerprint of a set of subject ids."""
+    subject_ids = sorted(set(subject_ids))
+    if not subject_ids:
+        return ''
+    return hashlib.sha1(','.join(str(s) for s in subject_ids).encode()).hexdigest()
+
+
+def subject_bitmask(subject_ids):
+    """Bitset of a set of subject ids."""
+    positions = subject_bit_positions()
+    if any(s not in positions for s in subject_ids):
+        # Subject added by another process since the cache was built
+        clear_subject_bit_cache()
+        positions = subject_bit_positions()
+    mask = 0
+    for subject_id in subject_ids:
+        bit = positions.get(subject_id)
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def get_user_subject_ids(user_id):
+    """All subject ids a teacher has across their MySubject rows."""
+    return set(
+        MySubject.subject.through.objects.filter(
+            mysubject__user_id=user_id
+        ).values_list('subject_id', flat=True)
+    )
+
+
+def sync_user_subject_set(user_id):
+    """Recompute the subject columns on a teacher's PersonalProfile."""
+    from users.models import PersonalProfile
+
+    subject_ids = get_user_subject_ids(user_id)
+    PersonalProfile.objects.filter(user_id=user_id).update(
+        subject_fingerprint=subject_fingerprint(subject_ids),
+        subject_bits=subject_bitmask(subject_ids),
+    )
+
+
+def sync_fast_swap_subject_set(fast_swap_id):
+    """Recompute the subject columns on a FastSwap."""
+    subject_ids = set(
+        FastSwap.subjects.through.objects.filter(
+            fastswap_id=fast_swap_id
+        ).values_list('subject_id', flat=True)
+    )
+    FastSwap.objects.filter(pk=fast_swap_id).update(
+        subject_fingerprint=subject_fingerprint(subject_ids),
+        subject_bits=subject_bitmask(subject_ids),
+    )
+
+
+def sync_all_subject_sets():
+    """
+    Rebuild the subject columns for every teacher and FastSwap.
+    Returns (profiles_updated, fast_swaps_updated).
+    """
+    from users.models import PersonalProfile
+
+    clear_subject_bit_cache()
+
+    subjects_by_user = {}
+    for user_id, subject_id in MySubject.subject.through.objects.values_list(
+        'mysubject__user_id', 'subject_id'
+    ):
+        subjects_by_user.setdefault(user_id, set()).add(subject_id)
+
+    profiles = list(PersonalProfile.objects.only('id', 'user_id', 'subject_fingerprint', 'subject_bits'))
+    for profile in profiles:
+        subject_ids = subjects_by_user.get(profile.user_id, set())
+        profile.subject_fingerprint = subject_fingerprint(subject_ids)
+        profile.subject_bits = subject_bitmask(subject_ids)
+    PersonalProfile.objects.bulk_update(profiles, ['subject_fingerprint', 'subject_bits'], batch_size=500)
+
+    subjects_by_fast_swap = {}
+    for fast_swap_id, subject_id in FastSwap.subjects.through.objects.values_list('fastswap_id', 'subject_id'):
+        subjects_by_fast_swap.setdefault(fast_swap_id, set()).add(subject_id)
+
+    fast_swaps = list(FastSwap.objects.only('id', 'subject_fingerprint', 'subject_bits'))
+    for fast_swap in fast_swaps:
+        subject_ids = subjects_by_fast_swap.get(fast_swap.id, set())
+        fast_swap.subject_fingerprint = subject_fingerprint(subject_ids)
+        fast_swap.subject_bits = subject_bitmask(subject_ids)
+    FastSwap.objects.bulk_update(fast_swaps, ['subject_fingerprint', 'subject_bits'], batch_size=500)
+
+    return len(profiles), len(fast_swaps)
+
+
+def filter_shared_subjects(queryset, mask, field='profile__subject_bits'):
+    """Keep rows whose subject bitset shares at least one bit with ``mask``."""
+    if not mask:
+        return queryset.none()
+    return queryset.alias(
+        shared_subject_bits=F(field).bitand(mask)
+    ).exclude(shared_subject_bits=0)
+
+
+def subject_overlap_count(mask, field='profile__subject_bits'):
+    """
+    SQL expression counting the subjects a row shares with ``mask``.
+    Built from shifts and ANDs so it runs on both SQLite and MySQL.
+    """
+    expression = Value(0)
+    bit = 0
+    while mask >> bit:
+        if (mask >> bit) & 1:
+            expression = expression + Coalesce(F(field), 0).bitrightshift(bit).bitand(1)
+        bit += 1
+    return expression
@@ -0,0 +1,208 @@
+"""
+Full recomputation of the match and triangle stores, in parallel.
+
+Work is split into partitions that never match each other: one per level,
+and on secondary levels one per subject fingerprint (only teachers with
+the same subjects match). The parent process loads every partition in a
+few queries; partitions are then computed from plain data - no database
+access - either in-process or on a process pool, merged, deduplicated and
+written in bulk.
+
+Partitions are merged in key order and every result list is sorted, so
+runs with 1 and N workers produce identical output.
+"""
+import multiprocessing
+import time
+
+from django.db import connections, transaction
+
+from users.models import PersonalProfile
+from .match_engine import is_secondary_level
+from .models import Level, MatchEdge, MySubject, SwapPreference, TriangleSwap
+from .triangle_store import store_triangles
+from .triangle_swap_utils import iter_triangle_ids
+
+
+def load_partitions(level_ids=None):
+    """
+    Every teacher with a level, a current county and swap preferences,
+    grouped into partitions. Three queries.
+
+    Returns a list sorted by key of {'key': (level_id, fingerprint),
+    'level_id', 'county': {user_id: county_id}, 'wants': {user_id: set of
+    county ids}, 'active': set of active user ids}. Primary partitions use
+    '' as fingerprint; secondary teachers without subjects are left out,
+    as in find_matches().
+    """
+    levels = Level.objects.all()
+    if level_ids is not None:
+        levels = levels.filter(id__in=level_ids)
+    secondary = {level.id: is_secondary_level(level) for level in levels}
+
+    rows = PersonalProfile.objects.filter(
+        level_id__in=list(secondary),
+        current_county__isnull=False,
+        user__swappreference__isnull=False,
+    ).values_list(
+        'user_id', 'level_id', 'current_county_id', 'user__is_active', 'subject_fingerprint',
+        'user__swappreference__id', 'user__swappreference__desired_county_id',
+    )
+    wanted = {}
+    teachers = []
+    for user_id, level_id, county_id, is_active, fingerprint, pref_id, desired in rows:
+        if secondary[level_id] and not fingerprint:
+            continue
+        wanted[pref_id] = {desired} if desired else set()
+        teachers.append((user_id, level_id, county_id, is_active, fingerprint if secondary[level_id] else '', pref_id))
+
+    for pref_id, county_id in SwapPreference.open_to_all.through.objects.filter(
+        swappreference__user__profile__level_id__in=list(secondary),
+    ).values_list('swappreference_id', 'counties_id'):
+        if pref_id in wanted:
+            wanted[pref_id].add(county_id)
+
+    partitions = {}
+    for user_id, level_id, county_id, is_active, fingerprint, pref_id in teachers:
+        key = (level_id, fingerprint)
+        partition = partitions.setdefault(key, {
+            'key': key, 'level_id': level_id, 'county': {}, 'wants': {}, 'active': set(),
+        })
+        partition['county'][user_id] = county_id
+        partition['wants'][user_id] = wanted[pref_id]
+        if is_active:
+            partition['active'].add(user_id)
+    return [partitions[key] for key in sorted(partitions)]
+
+
+def compute_partition(partition):
+    """
+    Pairs and triangles of one partition. Runs in worker processes, so it
+    only touches the data it is given.
+
+    Returns {'key', 'edges': sorted (user_a, user_b) directed match edges,
+    as stored in MatchEdge, 'triangles': sorted tuples of (user_id,
+    county_id) rotated to the smallest id, 'seconds'}.
+    """
+    started = time.perf_counter()
+    county = partition['county']
+    wants = partition['wants']
+    active = partition['active']
+
+    # Candidates are active; the teacher looking may not be (see find_matches)
+    active_by_county = {}
+    for user_id in active:
+        active_by_county.setdefault(county[user_id], []).append(user_id)
+    edges = []
+    for user_id, wanted in wants.items():
+        for county_id in wanted:
+            for other in active_by_county.get(county_id, ()):
+                if other != user_id and county[user_id] in wants[other]:
+                    edges.append((user_id, other))
+
+    group = {
+        'county': {user_id: county[user_id] for user_id in active},
+        'wants': {user_id: wants[user_id] for user_id in active},
+    }
+    triangles = []
+    for triangle in iter_triangle_ids({partition['key']: group}):
+        start = triangle.index(min(triangle))
+        triangle = triangle[start:] + triangle[:start]
+        triangles.append(tuple((user_id, county[user_id]) for user_id in triangle))
+
+    return {
+        'key': partition['key'],
+        'edges': sorted(set(edges)),
+        'triangles': sorted(set(triangles)),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def compute_swaps(workers=1, level_ids=None, progress=None):
+    """
+    Compute every partition, with a pool of ``workers`` processes when
+    more than one. ``progress(done, total, result, partition)`` is called
+    as partitions finish.
+
+    Returns {'partitions': [(key, teachers)], 'edges': [(level_id, user_a,
+    user_b)], 'triangles': [(level_id, members)]}, all in a fixed order.
+    """
+    partitions = load_partitions(level_ids)
+    by_key = {partition['key']: partition for partition in partitions}
+    results = {}
+
+    def collect(result):
+        results[result['key']] = result
+        if progress:
+            progress(len(results), len(partitions), result, by_key[result['key']])
+
+    if workers > 1 and len(partitions) > 1:
+        # Largest partitions first so the pool finishes evenly. Workers
+        # are forked and never use the database; close the parent's
+        # connections so no socket is shared with them.
+        connections.close_all()
+        queue = sorted(partitions, key=lambda p: len(p['county']), reverse=True)
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for result in pool.imap_unordered(compute_partition, queue):
+                collect(result)
+    else:
+        for partition in partitions:
+            collect(compute_partition(partition))
+
+    edges = []
+    triangles = []
+    seen_edges = set()
+    seen_triangles = set()
+    for partition in partitions:
+        result = results[partition['key']]
+        level_id = partition['level_id']
+        for edge in result['edges']:
+            if edge not in seen_edges:
+                seen_edges.add(edge)
+                edges.append((level_id,) + edge)
+        for members in result['triangles']:
+            key = frozenset(user_id for user_id, _ in members)
+            if key not in seen_triangles:
+                seen_triangles.add(key)
+                triangles.append((level_id, members))
+
+    return {
+        'partitions': [(partition['key'], len(partition['county'])) for partition in partitions],
+        'edges': edges,
+        'triangles': triangles,
+    }
+
+
+def write_swaps(result, level_ids=None):
+    """
+    Replace the stored MatchEdge and TriangleSwap rows of the computed
+    levels (all levels when ``level_ids`` is None) with ``result``.
+    """
+    subjects_by_user = {}
+    secondary_users = {members[0][0] for _, members in result['triangles']}
+    for user_id, subject_id in MySubject.subject.through.objects.filter(
+        mysubject__user_id__in=secondary_users,
+    ).values_list('mysubject__user_id', 'subject_id'):
+        subjects_by_user.setdefault(user_id, set()).add(subject_id)
+
+    secondary = {level.id for level in Level.objects.all() if is_secondary_level(level)}
+    triangles = [
+        (level_id, list(members), sorted(subjects_by_user.get(members[0][0], ())) if level_id in secondary else [])
+        for level_id, members in result['triangles']
+    ]
+    edges = [
+        MatchEdge(user_a_id=user_a, user_b_id=user_b, level_id=level_id)
+        for level_id, user_a, user_b in result['edges']
+    ]
+
+    with transaction.atomic():
+        stored_edges = MatchEdge.objects.all()
+        stored_triangles = TriangleSwap.objects.all()
+        if level_ids is not None:
+            stored_edges = stored_edges.filter(level_id__in=level_ids)
+            stored_triangles = stored_triangles.filter(level_id__in=level_ids)
+        stored_edges.delete()
+        stored_triangles.delete()
+        MatchEdge.objects.bulk_create(edges, batch_size=1000)
+        store_triangles(triangles)
+
+    return len(edges), len(triangles)
@@ -0,0 +1,17 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from home.geo_bundle import bundle_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def geography_script():
+    """
+    Loads static/js/geography.js (window.TSCGeography) pointed at the
+    geography bundle. Put it before the scripts that use it.
+    Usage in templates: {% load geography_tags %} {% geography_script %}
+    """
+    return format_html('<script src="{}" data-bundle="{}"></script>', static('js/geography.js'), bundle_url())
@@ -3,7 +3,7 @@ from users.models import MyUser, PersonalProfile
 from home.models import Level, Schools, Counties, Constituencies, Wards, SwapPreference, Subject, MySubject, Curriculum
 from home.matching import find_matches
 
-class MatchingLogicTests(TestCase):
+class MatchingTestBase(TestCase):
     def setUp(self):
         # Setup basic data
         self.curriculum = Curriculum.objects.create(name="CBC", description="Competency Based Curriculum")
@@ -50,6 +50,32 @@ class MatchingLogicTests(TestCase):
             
         return user
 
+    def build_primary_network(self):
+        """Several overlapping primary cycles across four counties."""
+        schools = {
+            self.county_nairobi: self.school_nairobi,
+            self.county_mombasa: self.school_mombasa,
+            self.county_kisumu: Schools.objects.create(name="Kisumu Pri", gender="Mixed", level=self.primary_level, boarding="Day", curriculum=self.curriculum, postal_code="40100", ward=self.ward_kisumu),
+            self.county_nakuru: Schools.objects.create(name="Nakuru Pri", gender="Mixed", level=self.primary_level, boarding="Day", curriculum=self.curriculum, postal_code="20100", ward=self.ward_nakuru),
+        }
+        specs = [
+            (self.county_nairobi, self.county_mombasa, []),
+            (self.county_nairobi, None, [self.county_kisumu, self.county_nakuru]),
+            (self.county_mombasa, self.county_kisumu, []),
+            (self.county_mombasa, self.county_nairobi, [self.county_nakuru]),
+            (self.county_kisumu, self.county_nairobi, []),
+            (self.county_kisumu, self.county_mombasa, [self.county_nairobi]),
+            (self.county_nakuru, self.county_nairobi, [self.county_mombasa]),
+            (self.county_nakuru, self.county_kisumu, []),
+            (self.county_nairobi, self.county_nairobi, []),
+        ]
+        return [
+            self.create_teacher(f'net{i}@test.com', self.primary_level, schools[current], desired_county=desired, open_to_all_counties=open_to)
+            for i, (current, desired, open_to) in enumerate(specs)
+        ]
+
+
+class MatchingLogicTests(MatchingTestBase):
     def test_primary_match_success(self):
         """
         Teacher A (Nairobi) wants Mombasa.
@@ -215,3 +241,1471 @@ class MatchingLogicTests(TestCase):
         
         # Should find NO triangles
         self.assertEqual(len(triangles), 0)
+
+
+class MatchStoreTests(MatchingTestBase):
+    def test_store_follows_preference_changes(self):
+        """
+        Stored matches are created when two teachers become compatible
+        and dropped again when one of them changes their preference.
+        """
+        from home.match_store import get_stored_matches
+
+        teacher_a = self.create_teacher('a_store@test.com', self.primary_level, self.school_nairobi, desired_county=self.county_mombasa)
+        teacher_b = self.create_teacher('b_store@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+
+        self.assertEqual(list(get_stored_matches(teacher_a)), [teacher_b])
+        self.assertEqual(list(get_stored_matches(teacher_b)), [teacher_a])
+
+        pref_b = teacher_b.swappreference
+        pref_b.desired_county = self.county_kisumu
+        pref_b.save()
+
+        self.assertEqual(list(get_stored_matches(teacher_a)), [])
+        self.assertEqual(list(get_stored_matches(teacher_b)), [])
+
+    def test_store_matches_find_matches_for_secondary(self):
+        """Subject changes refresh the store just like find_matches sees them."""
+        from home.match_store import get_stored_matches
+
+        teacher_c = self.create_teacher('c_store@test.com', self.secondary_level, self.school_kisumu_sec, desired_county=self.county_nakuru)
+        MySubject.objects.create(user=teacher_c).subject.set([self.math, self.chem])
+        teacher_d = self.create_teacher('d_store@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_kisumu)
+        mysub_d = MySubject.objects.create(user=teacher_d)
+        mysub_d.subject.set([self.math])
+
+        self.assertEqual(list(get_stored_matches(teacher_c)), list(find_matches(teacher_c)))
+        self.assertNotIn(teacher_d, get_stored_matches(teacher_c))
+
+        mysub_d.subject.add(self.chem)
+
+        self.assertIn(teacher_d, get_stored_matches(teacher_c))
+        self.assertEqual(list(get_stored_matches(teacher_c)), list(find_matches(teacher_c)))
+
+
+    def test_rebuild_reproduces_incremental_store(self):
+        from home.match_store import get_stored_matches, rebuild_match_edges
+        from home.models import MatchEdge
+
+        teacher_a = self.create_teacher('a_rebuild@test.com', self.primary_level, self.school_nairobi, desired_county=self.county_mombasa)
+        teacher_b = self.create_teacher('b_rebuild@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        edges_before = set(MatchEdge.objects.values_list('user_a_id', 'user_b_id', 'level_id'))
+
+        rebuild_match_edges()
+
+        self.assertEqual(set(MatchEdge.objects.values_list('user_a_id', 'user_b_id', 'level_id')), edges_before)
+        self.assertEqual(list(get_stored_matches(teacher_a)), [teacher_b])
+
+class SubjectSetTests(MatchingTestBase):
+    def test_fingerprint_tracks_subject_changes(self):
+        """Stored fingerprints and bitsets follow MySubject edits."""
+        from home.subject_sets import subject_bitmask, subject_fingerprint
+
+        teacher = self.create_teacher('fp@test.com', self.secondary_level, self.school_kisumu_sec)
+        mysub = MySubject.objects.create(user=teacher)
+        mysub.subject.set([self.chem, self.math])
+
+        profile = PersonalProfile.objects.get(user=teacher)
+        self.assertEqual(profile.subject_fingerprint, subject_fingerprint([self.math.id, self.chem.id]))
+        self.assertEqual(profile.subject_bits, 0b011)
+
+        mysub.subject.remove(self.chem)
+        profile.refresh_from_db()
+        self.assertEqual(profile.subject_fingerprint, subject_fingerprint([self.math.id]))
+        self.assertEqual(profile.subject_bits, subject_bitmask([self.math.id]))
+
+        mysub.subject.clear()
+        profile.refresh_from_db()
+        self.assertEqual(profile.subject_fingerprint, '')
+        self.assertEqual(profile.subject_bits, 0)
+
+    def test_shared_subject_filter_and_overlap(self):
+        """Bitset filters agree with the set intersection they replace."""
+        from home.subject_sets import filter_shared_subjects, subject_bitmask, subject_overlap_count
+
+        teacher_c = self.create_teacher('c_bits@test.com', self.secondary_level, self.school_kisumu_sec)
+        MySubject.objects.create(user=teacher_c).subject.set([self.math, self.chem])
+        teacher_d = self.create_teacher('d_bits@test.com', self.secondary_level, self.school_nakuru_sec)
+        MySubject.objects.create(user=teacher_d).subject.set([self.eng])
+
+        users = MyUser.objects.filter(id__in=[teacher_c.id, teacher_d.id])
+        mask = subject_bitmask([self.chem.id, self.eng.id])
+        self.assertEqual(set(filter_shared_subjects(users, mask)), {teacher_c, teacher_d})
+        self.assertEqual(list(filter_shared_subjects(users, subject_bitmask([self.math.id]))), [teacher_c])
+
+        overlaps = dict(users.annotate(
+            overlap=subject_overlap_count(subject_bitmask([self.math.id, self.chem.id, self.eng.id]))
+        ).values_list('id', 'overlap'))
+        self.assertEqual(overlaps, {teacher_c.id: 2, teacher_d.id: 1})
+
+    def test_sync_all_subject_sets_repairs_drift(self):
+        from home.subject_sets import subject_fingerprint, sync_all_subject_sets
+
+        teacher = self.create_teacher('drift@test.com', self.secondary_level, self.school_kisumu_sec)
+        MySubject.objects.create(user=teacher).subject.set([self.eng])
+        PersonalProfile.objects.filter(user=teacher).update(subject_fingerprint='', subject_bits=0)
+
+        sync_all_subject_sets()
+
+        profile = PersonalProfile.objects.get(user=teacher)
+        self.assertEqual(profile.subject_fingerprint, subject_fingerprint([self.eng.id]))
+        self.assertNotEqual(profile.subject_bits, 0)
+
+    def test_bits_follow_a_subject_deleted_in_another_worker(self):
+        from django.db import connection
+        from django.db.models import F
+        from home import geo_cache
+        from home.models import CacheVersion
+        from home.subject_sets import clear_subject_bit_cache, subject_bitmask
+
+        latin = Subject.objects.create(name="Latin", level=self.secondary_level)
+        greek = Subject.objects.create(name="Greek", level=self.secondary_level)
+        self.addCleanup(clear_subject_bit_cache)
+        self.assertEqual(subject_bitmask([greek.id]), 1 << 4)
+
+        # Another worker deletes Latin: here only the shared version changes
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Subject._meta.db_table} WHERE id = %s', [latin.id])
+        CacheVersion.objects.filter(name=geo_cache.VERSION_NAME).update(version=F('version') + 1)
+        geo_cache._loaded['checked_at'] -= geo_cache.CHECK_SECONDS
+        self.assertEqual(subject_bitmask([greek.id]), 1 << 3)
+
+    def test_subjects_past_the_bit_limit_are_cached_without_a_bit(self):
+        from home.subject_sets import MAX_SUBJECT_BITS, clear_subject_bit_cache, subject_bitmask
+
+        Subject.objects.bulk_create([
+            Subject(name=f'Elective {i}', level=self.secondary_level) for i in range(MAX_SUBJECT_BITS)
+        ])
+        overflow = Subject.objects.filter(level=self.secondary_level).order_by('id').last()
+        clear_subject_bit_cache()
+        self.addCleanup(clear_subject_bit_cache)
+        with self.assertLogs('home.subject_sets', 'WARNING'):
+            mask = subject_bitmask([self.math.id, overflow.id])
+        self.assertEqual(mask, subject_bitmask([self.math.id]))
+        # No reload of the Subject table for a subject that has no bit
+        with self.assertNumQueries(0):
+            subject_bitmask([overflow.id])
+
+
+class MatchEngineTests(MatchingTestBase):
+    def test_engine_agrees_with_find_matches(self):
+        """Counts and pairs from the vectorized engine equal find_matches()."""
+        from home.match_engine import compute_level_matches, matches_by_user
+
+        a = self.create_teacher('a_np@test.com', self.primary_level, self.school_nairobi, desired_county=self.county_mombasa)
+        b = self.create_teacher('b_np@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        c = self.create_teacher('c_np@test.com', self.primary_level, self.school_mombasa, open_to_all_counties=[self.county_nairobi, self.county_mombasa])
+        d = self.create_teacher('d_np@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_mombasa)
+        d.is_active = False
+        d.save()
+
+        e = self.create_teacher('e_np@test.com', self.secondary_level, self.school_kisumu_sec, desired_county=self.county_nakuru)
+        MySubject.objects.create(user=e).subject.set([self.math, self.chem])
+        f = self.create_teacher('f_np@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_kisumu)
+        MySubject.objects.create(user=f).subject.set([self.math, self.chem])
+        g = self.create_teacher('g_np@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_kisumu)
+        MySubject.objects.create(user=g).subject.set([self.math])
+
+        for level in (self.primary_level, self.secondary_level):
+            result = compute_level_matches(level)
+            matches = matches_by_user(result['pairs'])
+            for user in MyUser.objects.filter(profile__level=level):
+                expected = set(find_matches(user).values_list('id', flat=True))
+                self.assertEqual(result['counts'].get(user.id, 0), len(expected), user.email)
+                if user.is_active:
+                    self.assertEqual(set(matches.get(user.id, [])), expected, user.email)
+
+        # Inactive teachers still see their matches but are nobody's candidate
+        self.assertEqual(compute_level_matches(self.primary_level)['counts'][d.id], 1)
+        secondary_pairs = compute_level_matches(self.secondary_level)['pairs']
+        self.assertEqual([tuple(sorted(pair)) for pair in secondary_pairs], [(e.id, f.id)])
+
+
+class FindMatchesManyTests(MatchingTestBase):
+    def test_parity_with_find_matches(self):
+        """find_matches_many() returns exactly what find_matches() does, per user."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from home.matching import find_matches_many
+
+        self.create_teacher('a_many@test.com', self.primary_level, self.school_nairobi, desired_county=self.county_mombasa)
+        self.create_teacher('b_many@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        self.create_teacher('x_many@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_kisumu)
+        self.create_teacher('y_many@test.com', self.primary_level, self.school_nairobi, open_to_all_counties=[self.county_mombasa, self.county_kisumu])
+        inactive = self.create_teacher('z_many@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        inactive.is_active = False
+        inactive.save()
+        self.create_teacher('nopref_many@test.com', self.primary_level, self.school_nairobi)
+
+        for email, school, county, subjects in [
+            ('c_many@test.com', self.school_kisumu_sec, self.county_nakuru, [self.math, self.chem]),
+            ('d_many@test.com', self.school_nakuru_sec, self.county_kisumu, [self.math, self.chem]),
+            ('e_many@test.com', self.school_nakuru_sec, self.county_kisumu, [self.math]),
+            ('f_many@test.com', self.school_nakuru_sec, self.county_kisumu, [self.math, self.eng]),
+            ('g_many@test.com', self.school_kisumu_sec, self.county_nakuru, []),
+        ]:
+            teacher = self.create_teacher(email, self.secondary_level, school, desired_county=county)
+            if subjects:
+                MySubject.objects.create(user=teacher).subject.set(subjects)
+
+        users = list(MyUser.objects.all())
+        with CaptureQueriesContext(connection) as queries:
+            results = find_matches_many(users)
+        self.assertEqual(len(queries), 3)
+
+        self.assertEqual(set(results), {user.id for user in users})
+        for user in users:
+            expected = sorted(find_matches(user).values_list('id', flat=True))
+            self.assertEqual(results[user.id], expected, user.email)
+        self.assertTrue(any(results.values()))
+
+        for user in users:
+            expected = sorted(find_matches(user, active_only=False).values_list('id', flat=True))
+            self.assertEqual(find_matches_many([user], active_only=False)[user.id], expected, user.email)
+
+
+class ProfileLocationTests(MatchingTestBase):
+    def test_profile_location_follows_school_and_ward(self):
+        teacher = self.create_teacher('loc@test.com', self.primary_level, self.school_nairobi)
+        profile = PersonalProfile.objects.get(user=teacher)
+        self.assertEqual(profile.current_county, self.county_nairobi)
+        self.assertEqual(profile.current_constituency, self.const_nairobi)
+
+        profile.school = self.school_mombasa
+        profile.save(update_fields=['school'])
+        profile.refresh_from_db()
+        self.assertEqual(profile.current_county, self.county_mombasa)
+
+        # Moving the school's ward to another county updates its teachers
+        self.ward_mombasa.constituency = self.const_kisumu
+        self.ward_mombasa.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.current_county, self.county_kisumu)
+        self.assertEqual(profile.current_constituency, self.const_kisumu)
+
+    def test_ward_move_refreshes_matches(self):
+        from home.match_store import get_stored_matches
+
+        teacher_a = self.create_teacher('a_loc@test.com', self.primary_level, self.school_nairobi, desired_county=self.county_kisumu)
+        teacher_b = self.create_teacher('b_loc@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        self.assertEqual(list(get_stored_matches(teacher_a)), [])
+
+        self.ward_mombasa.constituency = self.const_kisumu
+        self.ward_mombasa.save()
+
+        self.assertEqual(list(get_stored_matches(teacher_a)), [teacher_b])
+        self.assertEqual(list(find_matches(teacher_a)), [teacher_b])
+
+    def test_drift_check_and_backfill(self):
+        from home.locations import location_drift, sync_profile_locations
+
+        teacher = self.create_teacher('drift_loc@test.com', self.primary_level, self.school_nairobi)
+        no_school = self.create_teacher('noschool_loc@test.com', self.primary_level, None)
+        self.assertFalse(location_drift().exists())
+
+        PersonalProfile.objects.filter(user=teacher).update(current_county=None, current_constituency=None)
+        PersonalProfile.objects.filter(user=no_school).update(current_county=self.county_kisumu)
+        self.assertEqual(
+            set(location_drift().values_list('user_id', flat=True)), {teacher.id, no_school.id}
+        )
+
+        self.assertEqual(set(sync_profile_locations()), {teacher.id, no_school.id})
+        self.assertFalse(location_drift().exists())
+        self.assertEqual(PersonalProfile.objects.get(user=teacher).current_county, self.county_nairobi)
+        self.assertIsNone(PersonalProfile.objects.get(user=no_school).current_county)
+
+    def test_backfill_command_refreshes_triangles(self):
+        import io
+
+        from django.core.management import call_command
+        from home.models import TriangleSwap
+        from home.triangle_store import rebuild_triangle_swaps
+
+        def stored():
+            return set(TriangleSwap.objects.values_list(
+                'teacher_a_id', 'county_a_id', 'teacher_b_id', 'county_b_id', 'teacher_c_id', 'county_c_id',
+            ))
+
+        teacher = self.build_primary_network()[0]
+        PersonalProfile.objects.filter(user=teacher).update(current_county=self.county_nakuru)
+        rebuild_triangle_swaps()
+
+        call_command('sync_profile_locations', stdout=io.StringIO())
+        backfilled = stored()
+        rebuild_triangle_swaps()
+        self.assertEqual(backfilled, stored())
+
+
+class RankedMatchTests(MatchingTestBase):
+    def test_ranked_matches_best_first(self):
+        """A desired-county match outranks an open_to_all one, in one query."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from home.matching import MATCH_SCORE_WEIGHTS
+
+        school_nairobi_2 = Schools.objects.create(name="Nairobi Pri 2", gender="Mixed", level=self.primary_level, boarding="Day", curriculum=self.curriculum, postal_code="00100", ward=self.ward_nairobi)
+        teacher_a = self.create_teacher('a_rank@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        listed = self.create_teacher('listed_rank@test.com', self.primary_level, school_nairobi_2, open_to_all_counties=[self.county_mombasa])
+        desired = self.create_teacher('desired_rank@test.com', self.primary_level, self.school_nairobi, desired_county=self.county_mombasa)
+
+        pref = desired.swappreference
+        pref.desired_constituency = self.const_mombasa
+        pref.desired_ward = self.ward_mombasa
+        pref.save()
+
+        ranked = find_matches(teacher_a, ranked=True)
+        with CaptureQueriesContext(connection) as queries:
+            top = list(ranked[:5])
+        self.assertEqual(len(queries), 2)  # matches plus the open_to_all prefetch
+        self.assertEqual(top, [desired, listed])
+        self.assertEqual(set(top), set(find_matches(teacher_a)))
+
+        weights = MATCH_SCORE_WEIGHTS
+        base = 2 * weights['desired_county'] + 2 * weights['hardship'] + weights['subjects']
+        self.assertEqual(top[0].match_score, base + weights['constituency'] + weights['ward'])
+        self.assertEqual(
+            top[1].match_score,
+            base - weights['desired_county'] + weights['open_to_all_county'],
+        )
+
+    def test_secondary_subject_overlap_scores(self):
+        from home.matching import annotate_match_score
+
+        teacher_c = self.create_teacher('c_rank@test.com', self.secondary_level, self.school_kisumu_sec, desired_county=self.county_nakuru)
+        MySubject.objects.create(user=teacher_c).subject.set([self.math, self.chem])
+        teacher_d = self.create_teacher('d_rank@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_kisumu)
+        MySubject.objects.create(user=teacher_d).subject.set([self.math])
+
+        scores = dict(
+            annotate_match_score(MyUser.objects.filter(id=teacher_d.id), teacher_c).values_list('id', 'match_score')
+        )
+        # Desired county both ways, hardship 'Any' both ways, half the subjects
+        self.assertEqual(scores[teacher_d.id], 25 + 25 + 5 + 5 + 5)
+
+
+class RootedTriangleTests(MatchingTestBase):
+    def test_rooted_search_equals_filtered_full_enumeration(self):
+        from home.triangle_swap_utils import find_triangle_swaps_primary, find_triangles_for_user
+
+        teachers = self.build_primary_network()
+        queryset = MyUser.objects.filter(profile__level=self.primary_level)
+        all_triangles = find_triangle_swaps_primary(queryset)
+        self.assertTrue(all_triangles)
+
+        for teacher in teachers:
+            expected = {
+                frozenset(t.id for t in triangle) for triangle in all_triangles
+                if teacher.id in [t.id for t in triangle]
+            }
+            rooted = find_triangles_for_user(teacher, queryset)
+            self.assertEqual({frozenset(t.id for t in triangle) for triangle in rooted}, expected, teacher.email)
+            self.assertEqual(len(rooted), len(expected))
+            self.assertTrue(all(a.id == teacher.id for a, b, c in rooted))
+            # The default candidate set is the user's level
+            self.assertEqual(find_triangles_for_user(teacher), rooted)
+
+    def test_rooted_search_secondary_needs_same_subjects(self):
+        from home.triangle_swap_utils import find_triangles_for_user
+
+        school_mombasa_sec = Schools.objects.create(name="Mombasa High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="80100", ward=self.ward_mombasa)
+        teacher_a = self.create_teacher('a_root@test.com', self.secondary_level, self.school_kisumu_sec, desired_county=self.county_nakuru)
+        MySubject.objects.create(user=teacher_a).subject.set([self.math, self.chem])
+        teacher_b = self.create_teacher('b_root@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_mombasa)
+        mysub_b = MySubject.objects.create(user=teacher_b)
+        mysub_b.subject.set([self.math])
+        teacher_c = self.create_teacher('c_root@test.com', self.secondary_level, school_mombasa_sec, desired_county=self.county_kisumu)
+        MySubject.objects.create(user=teacher_c).subject.set([self.math, self.chem])
+
+        self.assertEqual(find_triangles_for_user(teacher_a), [])
+
+        mysub_b.subject.add(self.chem)
+        self.assertEqual(find_triangles_for_user(teacher_a), [(teacher_a, teacher_b, teacher_c)])
+        self.assertEqual(find_triangles_for_user(teacher_c), [(teacher_c, teacher_a, teacher_b)])
+
+
+class TriangleEngineTests(MatchingTestBase):
+    def assertSameTriangles(self, triangles, expected):
+        found = [frozenset(t.id for t in triangle) for triangle in triangles]
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), {frozenset(t.id for t in triangle) for triangle in expected})
+
+    def test_engine_matches_reference_primary(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from home.triangle_swap_utils import find_triangle_swaps_primary, find_triangle_swaps_primary_reference, wants_county
+
+        self.build_primary_network()
+        queryset = MyUser.objects.filter(profile__level=self.primary_level).select_related('profile__current_county')
+        expected = find_triangle_swaps_primary_reference(queryset)
+        self.assertTrue(expected)
+
+        with CaptureQueriesContext(connection) as queries:
+            triangles = find_triangle_swaps_primary(queryset.all())
+        # Candidates, their open_to_all rows, then the instances
+        self.assertEqual(len(queries), 3)
+        self.assertSameTriangles(triangles, expected)
+        for a, b, c in triangles:
+            self.assertTrue(wants_county(a, b.profile.current_county))
+            self.assertTrue(wants_county(b, c.profile.current_county))
+            self.assertTrue(wants_county(c, a.profile.current_county))
+
+    def test_engine_matches_reference_secondary(self):
+        from home.triangle_swap_utils import find_triangle_swaps_secondary, find_triangle_swaps_secondary_reference
+
+        school_mombasa_sec = Schools.objects.create(name="Mombasa High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="80100", ward=self.ward_mombasa)
+        for prefix, subjects in [('x', [self.math, self.chem]), ('y', [self.math]), ('z', [])]:
+            for school, county in [
+                (self.school_kisumu_sec, self.county_nakuru),
+                (self.school_nakuru_sec, self.county_mombasa),
+                (school_mombasa_sec, self.county_kisumu),
+            ]:
+                teacher = self.create_teacher(f'{prefix}{school.id}_eng@test.com', self.secondary_level, school, desired_county=county)
+                if subjects:
+                    MySubject.objects.create(user=teacher).subject.set(subjects)
+        # A lone teacher whose subjects match nobody's cycle
+        odd = self.create_teacher('odd_eng@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_mombasa)
+        MySubject.objects.create(user=odd).subject.set([self.eng])
+
+        queryset = MyUser.objects.filter(profile__level=self.secondary_level)
+        expected = find_triangle_swaps_secondary_reference(queryset)
+        # The subject-less 'z' teachers match no one
+        self.assertEqual(len(expected), 2)
+        self.assertSameTriangles(find_triangle_swaps_secondary(queryset), expected)
+
+
+class TriangleStoreTests(MatchingTestBase):
+    def stored_sets(self):
+        from home.models import TriangleSwap
+        return {
+            frozenset((t.teacher_a_id, t.teacher_b_id, t.teacher_c_id))
+            for t in TriangleSwap.objects.all()
+        }
+
+    def expected_sets(self):
+        from home.triangle_swap_utils import find_triangle_swaps_primary
+        queryset = MyUser.objects.filter(is_active=True, profile__level=self.primary_level)
+        return {frozenset(t.id for t in triangle) for triangle in find_triangle_swaps_primary(queryset)}
+
+    def test_a_triangle_stored_concurrently_is_kept(self):
+        from home.models import TriangleSwap
+        from home.triangle_store import store_triangles
+
+        a, b, c = (
+            self.create_teacher(f'race{i}@test.com', self.secondary_level, school)
+            for i, school in enumerate([self.school_kisumu_sec, self.school_nakuru_sec, self.school_mombasa])
+        )
+        triangle = (self.secondary_level.id, [(a.id, self.county_kisumu.id), (b.id, self.county_nakuru.id), (c.id, self.county_mombasa.id)], [self.math.id])
+        store_triangles([triangle])
+        # The other member's save got there first
+        rows = store_triangles([triangle])
+        self.assertEqual(TriangleSwap.objects.count(), 1)
+        self.assertEqual(rows[0].pk, TriangleSwap.objects.get().pk)
+        self.assertEqual(list(TriangleSwap.objects.get().common_subjects.all()), [self.math])
+
+    def test_signals_keep_store_equal_to_full_search(self):
+        from home.models import TriangleSwap
+        from home.triangle_store import rebuild_triangle_swaps
+
+        self.build_primary_network()
+        expected = self.expected_sets()
+        self.assertTrue(expected)
+        self.assertEqual(self.stored_sets(), expected)
+        self.assertEqual(TriangleSwap.objects.count(), len(expected))
+
+        self.assertEqual(rebuild_triangle_swaps(), len(expected))
+        self.assertEqual(self.stored_sets(), expected)
+
+    def test_preference_change_only_touches_that_teachers_triangles(self):
+        from home.models import TriangleSwap
+
+        teachers = self.build_primary_network()
+        mover = teachers[2]
+        untouched = set(
+            TriangleSwap.objects.exclude(teacher_a=mover).exclude(teacher_b=mover).exclude(teacher_c=mover)
+            .values_list('id', 'computed_at')
+        )
+
+        pref = mover.swappreference
+        pref.desired_county = self.county_nakuru
+        pref.save()
+
+        self.assertEqual(self.stored_sets(), self.expected_sets())
+        remaining = set(TriangleSwap.objects.values_list('id', 'computed_at'))
+        self.assertTrue(untouched <= remaining)
+
+        mover.is_active = False
+        mover.save(update_fields=['is_active'])
+        self.assertEqual(self.stored_sets(), self.expected_sets())
+        self.assertFalse(TriangleSwap.objects.filter(teacher_b=mover).exists())
+
+    def test_stored_reads_rotate_to_user_and_keep_subjects(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from home.triangle_store import get_stored_triangles
+
+        school_mombasa_sec = Schools.objects.create(name="Mombasa High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="80100", ward=self.ward_mombasa)
+        teachers = []
+        for school, county in [
+            (self.school_kisumu_sec, self.county_nakuru),
+            (self.school_nakuru_sec, self.county_mombasa),
+            (school_mombasa_sec, self.county_kisumu),
+        ]:
+            teacher = self.create_teacher(f'store{school.id}@test.com', self.secondary_level, school, desired_county=county)
+            MySubject.objects.create(user=teacher).subject.set([self.math, self.chem])
+            teachers.append(teacher)
+
+        for teacher in teachers:
+            with CaptureQueriesContext(connection) as queries:
+                triangles = list(get_stored_triangles(teacher))
+            # Triangles with participants and counties, then their subjects
+            self.assertEqual(len(queries), 2)
+            self.assertEqual(len(triangles), 1)
+            members = triangles[0].rotated_for(teacher)
+            self.assertEqual(members[0][0], teacher)
+            self.assertEqual(members[0][1], teacher.profile.current_county)
+            self.assertEqual(
+                {subject.name for subject in triangles[0].common_subjects.all()},
+                {self.math.name, self.chem.name},
+            )
+
+        MySubject.objects.filter(user=teachers[1]).first().subject.set([self.math])
+        self.assertEqual(list(get_stored_triangles(teachers[0])), [])
+
+
+class CycleFinderTests(MatchingTestBase):
+    def test_short_cycles_agree_with_pairs_and_triangles(self):
+        from home.cycle_finder import find_cycles_for_level, find_cycles_for_user
+        from home.triangle_swap_utils import find_triangle_swaps_primary, wants_county
+
+        teachers = self.build_primary_network()
+        result = find_cycles_for_level(self.primary_level, max_length=4)
+        self.assertTrue(result['complete'])
+        cycles = result['cycles']
+        self.assertEqual(len(cycles), len(set(cycles)))
+
+        by_id = {teacher.id: teacher for teacher in teachers}
+        for cycle in cycles:
+            self.assertEqual(cycle[0], min(cycle))
+            for i, user_id in enumerate(cycle):
+                following = by_id[cycle[(i + 1) % len(cycle)]]
+                self.assertTrue(wants_county(by_id[user_id], following.profile.current_county))
+        self.assertTrue(any(len(cycle) == 4 for cycle in cycles))
+
+        pairs = {frozenset(cycle) for cycle in cycles if len(cycle) == 2}
+        expected_pairs = {
+            frozenset((teacher.id, match.id))
+            for teacher in teachers for match in find_matches(teacher)
+            if match.profile.current_county_id != teacher.profile.current_county_id
+        }
+        self.assertEqual(pairs, expected_pairs)
+
+        queryset = MyUser.objects.filter(profile__level=self.primary_level)
+        triangles = {frozenset(cycle) for cycle in cycles if len(cycle) == 3}
+        # A "triangle" visiting a county twice is a pair plus a teacher who
+        # stays put; rotations never repeat a county
+        expected_triangles = {
+            frozenset(t.id for t in triangle) for triangle in find_triangle_swaps_primary(queryset)
+            if len({t.profile.current_county_id for t in triangle}) == 3
+        }
+        self.assertTrue(expected_triangles)
+        self.assertEqual(triangles, expected_triangles)
+
+        for teacher in teachers:
+            mine = find_cycles_for_user(teacher, max_length=4)['cycles']
+            self.assertTrue(all(cycle[0] == teacher.id for cycle in mine))
+            self.assertEqual(
+                {cycle[cycle.index(min(cycle)):] + cycle[:cycle.index(min(cycle))] for cycle in mine},
+                {cycle for cycle in cycles if teacher.id in cycle},
+            )
+            self.assertEqual(len(mine), len([cycle for cycle in cycles if teacher.id in cycle]))
+
+    def test_secondary_rotation_needs_same_subjects(self):
+        from home.cycle_finder import find_cycles_for_level, find_cycles_for_user
+
+        school_mombasa_sec = Schools.objects.create(name="Mombasa High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="80100", ward=self.ward_mombasa)
+        school_nairobi_sec = Schools.objects.create(name="Nairobi High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="00100", ward=self.ward_nairobi)
+        teachers = []
+        for school, county in [
+            (school_nairobi_sec, self.county_mombasa),
+            (school_mombasa_sec, self.county_kisumu),
+            (self.school_kisumu_sec, self.county_nakuru),
+            (self.school_nakuru_sec, self.county_nairobi),
+        ]:
+            teacher = self.create_teacher(f'ring{school.id}@test.com', self.secondary_level, school, desired_county=county)
+            MySubject.objects.create(user=teacher).subject.set([self.math, self.chem])
+            teachers.append(teacher)
+
+        self.assertEqual(find_cycles_for_level(self.secondary_level, max_length=3)['cycles'], [])
+        result = find_cycles_for_level(self.secondary_level, max_length=5)
+        self.assertEqual(result['cycles'], [tuple(teacher.id for teacher in teachers)])
+        rotated = find_cycles_for_user(teachers[2], max_length=5)['cycles']
+        self.assertEqual(rotated, [tuple(teacher.id for teacher in teachers[2:] + teachers[:2])])
+
+        MySubject.objects.get(user=teachers[1]).subject.set([self.math])
+        self.assertEqual(find_cycles_for_level(self.secondary_level, max_length=5)['cycles'], [])
+        self.assertEqual(find_cycles_for_user(teachers[2], max_length=5)['cycles'], [])
+
+    def test_limit_marks_search_incomplete(self):
+        from home.cycle_finder import find_cycles_for_level
+
+        self.build_primary_network()
+        result = find_cycles_for_level(self.primary_level, max_length=5, limit=1)
+        self.assertEqual(len(result['cycles']), 1)
+        self.assertFalse(result['complete'])
+        # Shortest rotations come first
+        self.assertEqual(len(result['cycles'][0]), 2)
+
+
+class ClearingTests(MatchingTestBase):
+    def test_clearing_picks_disjoint_valid_rotations(self):
+        from home.clearing import clear_level
+        from home.triangle_swap_utils import wants_county
+
+        teachers = self.build_primary_network()
+        by_id = {teacher.id: teacher for teacher in teachers}
+        result = clear_level(self.primary_level, max_length=3)
+        self.assertTrue(result['complete'])
+
+        moved = [user_id for rotation in result['cycles'] for user_id in rotation]
+        self.assertEqual(len(moved), len(set(moved)))
+        for rotation in result['cycles']:
+            for i, user_id in enumerate(rotation):
+                following = by_id[rotation[(i + 1) % len(rotation)]]
+                self.assertTrue(wants_county(by_id[user_id], following.profile.current_county))
+
+        self.assertEqual(result['relocated'], len(moved))
+        self.assertEqual(sorted(moved + result['unmatched']), sorted(by_id))
+        self.assertLessEqual(result['relocated'], result['upper_bound'])
+        self.assertEqual(sum(result['by_length'].values()), len(result['cycles']))
+        # net8 wants the county it is already in and can't be relocated
+        self.assertIn(teachers[8].id, result['unmatched'])
+
+    def test_longer_rotations_relocate_more(self):
+        from home.clearing import clear_level
+
+        school_kisumu = Schools.objects.create(name="Kisumu Pri", gender="Mixed", level=self.primary_level, boarding="Day", curriculum=self.curriculum, postal_code="40100", ward=self.ward_kisumu)
+        school_nakuru = Schools.objects.create(name="Nakuru Pri", gender="Mixed", level=self.primary_level, boarding="Day", curriculum=self.curriculum, postal_code="20100", ward=self.ward_nakuru)
+        for school, county in [
+            (self.school_nairobi, self.county_mombasa),
+            (self.school_mombasa, self.county_kisumu),
+            (school_kisumu, self.county_nakuru),
+            (school_nakuru, self.county_nairobi),
+        ]:
+            self.create_teacher(f'clear{school.id}@test.com', self.primary_level, school, desired_county=county)
+
+        self.assertEqual(clear_level(self.primary_level, max_length=3)['relocated'], 0)
+        result = clear_level(self.primary_level, max_length=4)
+        self.assertEqual(result['relocated'], 4)
+        self.assertEqual(result['by_length'], {4: 1})
+        self.assertEqual(result['unmatched'], [])
+
+
+class ComputeSwapsTests(MatchingTestBase):
+    def test_bulk_compute_matches_incremental_stores(self):
+        from home.models import MatchEdge, TriangleSwap
+        from home.swap_compute import compute_swaps, write_swaps
+
+        teachers = self.build_primary_network()
+        teachers[3].is_active = False
+        teachers[3].save(update_fields=['is_active'])
+        school_mombasa_sec = Schools.objects.create(name="Mombasa High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="80100", ward=self.ward_mombasa)
+        for prefix, subjects in [('x', [self.math, self.chem]), ('y', [self.math])]:
+            for school, county in [
+                (self.school_kisumu_sec, self.county_nakuru),
+                (self.school_nakuru_sec, self.county_mombasa),
+                (school_mombasa_sec, self.county_kisumu),
+            ]:
+                teacher = self.create_teacher(f'{prefix}{school.id}_cs@test.com', self.secondary_level, school, desired_county=county)
+                MySubject.objects.create(user=teacher).subject.set(subjects)
+
+        # Stores maintained by signals, one teacher at a time
+        expected_edges = set(MatchEdge.objects.values_list('level_id', 'user_a_id', 'user_b_id'))
+        expected_triangles = {
+            (frozenset((t.teacher_a_id, t.teacher_b_id, t.teacher_c_id)), frozenset(s.id for s in t.common_subjects.all()))
+            for t in TriangleSwap.objects.prefetch_related('common_subjects')
+        }
+        self.assertTrue(expected_edges)
+        # Primary triangles plus one per secondary subject group
+        self.assertEqual(len([t for t in expected_triangles if t[1]]), 2)
+
+        result = compute_swaps()
+        # primary + two secondary subject groups
+        self.assertEqual(len(result['partitions']), 3)
+        self.assertEqual(set(result['edges']), expected_edges)
+
+        MatchEdge.objects.all().delete()
+        TriangleSwap.objects.all().delete()
+        self.assertEqual(write_swaps(result), (len(expected_edges), len(expected_triangles)))
+        self.assertEqual(set(MatchEdge.objects.values_list('level_id', 'user_a_id', 'user_b_id')), expected_edges)
+        self.assertEqual({
+            (frozenset((t.teacher_a_id, t.teacher_b_id, t.teacher_c_id)), frozenset(s.id for s in t.common_subjects.all()))
+            for t in TriangleSwap.objects.prefetch_related('common_subjects')
+        }, expected_triangles)
+
+    def test_secondary_teachers_without_subjects_are_left_out_on_every_path(self):
+        from home.models import TriangleSwap
+        from home.swap_compute import compute_swaps, write_swaps
+        from home.triangle_store import rebuild_triangle_swaps
+
+        school_mombasa_sec = Schools.objects.create(name="Mombasa High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="80100", ward=self.ward_mombasa)
+        # A subject-less triangle, and one with subjects
+        for prefix, subjects in [('none', []), ('math', [self.math])]:
+            for school, county in [
+                (self.school_kisumu_sec, self.county_nakuru),
+                (self.school_nakuru_sec, self.county_mombasa),
+                (school_mombasa_sec, self.county_kisumu),
+            ]:
+                teacher = self.create_teacher(f'{prefix}{school.id}_ns@test.com', self.secondary_level, school, desired_county=county)
+                if subjects:
+                    MySubject.objects.create(user=teacher).subject.set(subjects)
+
+        def stored():
+            return {frozenset((t.teacher_a_id, t.teacher_b_id, t.teacher_c_id)) for t in TriangleSwap.objects.all()}
+
+        incremental = stored()
+        self.assertEqual(len(incremental), 1)
+        rebuild_triangle_swaps()
+        self.assertEqual(stored(), incremental)
+        write_swaps(compute_swaps())
+        self.assertEqual(stored(), incremental)
+
+    def test_pool_output_equals_single_process(self):
+        from home.swap_compute import compute_swaps
+
+        self.build_primary_network()
+        school_mombasa_sec = Schools.objects.create(name="Mombasa High", gender="Mixed", level=self.secondary_level, boarding="Boarding", curriculum=self.curriculum, postal_code="80100", ward=self.ward_mombasa)
+        for subjects in ([self.math], [self.chem], [self.eng]):
+            for school, county in [(self.school_kisumu_sec, self.county_mombasa), (school_mombasa_sec, self.county_kisumu)]:
+                teacher = self.create_teacher(f'{subjects[0].id}_{school.id}_pool@test.com', self.secondary_level, school, desired_county=county)
+                MySubject.objects.create(user=teacher).subject.set(subjects)
+
+        progress = []
+        single = compute_swaps(workers=1)
+        pooled = compute_swaps(workers=3, progress=lambda done, total, result, partition: progress.append((done, total)))
+        self.assertEqual(pooled, single)
+        self.assertEqual(len(single['partitions']), 4)
+        self.assertEqual(sorted(progress), [(i, 4) for i in range(1, 5)])
+
+
+class FastSwapGraphTests(MatchingTestBase):
+    def create_fast_swap(self, names, level, county, most_preferred=None, acceptable=(), subjects=()):
+        from home.models import FastSwap
+
+        fs = FastSwap.objects.create(names=names, phone='0700000000', level=level, current_county=county, most_preferred=most_preferred)
+        fs.acceptable_county.set(acceptable)
+        if subjects:
+            fs.subjects.set(subjects)
+        return fs
+
+    def test_mixed_pairs_and_triangles(self):
+        from home.fast_swap_utils import find_mutual_matches_for_fast_swap, find_triangle_matches_for_fast_swap
+
+        fs = self.create_fast_swap('A', self.primary_level, self.county_nairobi, most_preferred=self.county_mombasa)
+        teacher = self.create_teacher('fsb@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        other = self.create_fast_swap('B', self.primary_level, self.county_mombasa, acceptable=[self.county_kisumu, self.county_nairobi])
+        closing = self.create_fast_swap('C', self.primary_level, self.county_kisumu, most_preferred=self.county_nairobi)
+        inactive = self.create_teacher('fsoff@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        inactive.is_active = False
+        inactive.save(update_fields=['is_active'])
+
+        matches = find_mutual_matches_for_fast_swap(fs)
+        self.assertEqual(matches['users'], [teacher])
+        self.assertEqual(matches['fast_swaps'], [other])
+
+        triangles = find_triangle_matches_for_fast_swap(fs)
+        self.assertEqual(
+            [(t['entity_b']['type'], t['entity_b']['obj'], t['entity_c']['type'], t['entity_c']['obj']) for t in triangles],
+            [('fastswap', other, 'fastswap', closing)],
+        )
+
+    def test_secondary_needs_same_subjects_and_graph_is_reused(self):
+        from home.fast_swap_graph import FAST_SWAP, USER, build_fast_swap_graph, match_fast_swaps
+
+        fs = self.create_fast_swap('A', self.secondary_level, self.county_kisumu, most_preferred=self.county_nakuru, subjects=[self.math, self.chem])
+        same = self.create_teacher('same@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_kisumu)
+        MySubject.objects.create(user=same).subject.set([self.math, self.chem])
+        different = self.create_teacher('diff@test.com', self.secondary_level, self.school_nakuru_sec, desired_county=self.county_kisumu)
+        MySubject.objects.create(user=different).subject.set([self.math])
+        no_subjects = self.create_fast_swap('B', self.secondary_level, self.county_nakuru, most_preferred=self.county_kisumu)
+        twin = self.create_fast_swap('C', self.secondary_level, self.county_nakuru, most_preferred=self.county_kisumu, subjects=[self.chem, self.math])
+
+        with self.assertNumQueries(4):
+            graph = build_fast_swap_graph(self.secondary_level)
+        with self.assertNumQueries(0):
+            matches = match_fast_swaps(self.secondary_level, graph=graph)
+        self.assertEqual(matches[fs.id]['mutual'], [(FAST_SWAP, twin.id), (USER, same.id)])
+        self.assertEqual(matches[no_subjects.id], {'mutual': [], 'triangles': []})
+        self.assertEqual(matches[twin.id]['mutual'], [(FAST_SWAP, fs.id)])
+
+
+class FastSwapStoreTests(MatchingTestBase):
+    def test_reads_are_stored_until_the_level_changes(self):
+        from home.fast_swap_store import get_fast_swap_matches
+        from home.models import FastSwap, FastSwapMatchCache
+
+        fs = FastSwap.objects.create(names='A', phone='0700000000', level=self.primary_level, current_county=self.county_nairobi, most_preferred=self.county_mombasa)
+        first = self.create_teacher('store1@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+
+        self.assertEqual(get_fast_swap_matches(fs)['users'], [first])
+        cache = FastSwapMatchCache.objects.get(fast_swap=fs)
+        self.assertFalse(cache.is_stale)
+
+        # Another level doesn't touch the row
+        self.create_teacher('store_sec@test.com', self.secondary_level, self.school_kisumu_sec, desired_county=self.county_nairobi)
+        self.assertFalse(FastSwapMatchCache.objects.get(fast_swap=fs).is_stale)
+        matches = get_fast_swap_matches(fs)
+        self.assertEqual(matches['computed_at'], cache.computed_at)
+
+        second = self.create_teacher('store2@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        self.assertTrue(FastSwapMatchCache.objects.get(fast_swap=fs).is_stale)
+        self.assertEqual(get_fast_swap_matches(fs)['users'], [first, second])
+
+        # Leaving the level marks the old level stale as well as the new one
+        get_fast_swap_matches(fs)
+        first.profile.level = self.secondary_level
+        first.profile.save()
+        self.assertTrue(FastSwapMatchCache.objects.get(fast_swap=fs).is_stale)
+        self.assertEqual(get_fast_swap_matches(fs)['users'], [second])
+
+        # A teacher who leaves the level is dropped even from a fresh row
+        second.profile.level = self.secondary_level
+        second.profile.save()
+        FastSwapMatchCache.objects.filter(fast_swap=fs).update(is_stale=False)
+        self.assertEqual(get_fast_swap_matches(fs)['users'], [])
+
+    def test_concurrent_first_views_both_store_the_row(self):
+        from home.fast_swap_graph import match_fast_swaps
+        from home.fast_swap_store import write_fast_swap_matches
+        from home.models import FastSwap, FastSwapMatchCache
+
+        fs = FastSwap.objects.create(names='A', phone='0700000000', level=self.primary_level, current_county=self.county_nairobi, most_preferred=self.county_mombasa)
+        teacher = self.create_teacher('race@test.com', self.primary_level, self.school_mombasa, desired_county=self.county_nairobi)
+        # Both requests computed before either wrote
+        first = match_fast_swaps(self.primary_level, [fs.id])
+        second = match_fast_swaps(self.primary_level, [fs.id])
+        write_fast_swap_matches(first)
+        FastSwapMatchCache.objects.filter(fast_swap=fs).update(is_stale=True)
+        write_fast_swap_matches(second)
+
+        row = FastSwapMatchCache.objects.get(fast_swap=fs)
+        self.assertFalse(row.is_stale)
+        self.assertEqual(row.mutual, [['user', teacher.id]])
+
+    def test_fast_swap_changes_mark_the_level_stale(self):
+        from home.fast_swap_store import get_fast_swap_matches
+        from home.models import FastSwap, FastSwapMatchCache
+
+        fs = FastSwap.objects.create(names='A', phone='0700000000', level=self.primary_level, current_county=self.county_nairobi, most_preferred=self.county_mombasa)
+        other = FastSwap.objects.create(names='B', phone='0700000001', level=self.primary_level, current_county=self.county_mombasa)
+        self.assertEqual(get_fast_swap_matches(fs)['fast_swaps'], [])
+
+        other.acceptable_county.add(self.county_nairobi)
+        self.assertTrue(FastSwapMatchCache.objects.get(fast_swap=fs).is_stale)
+        self.assertEqual(get_fast_swap_matches(fs)['fast_swaps'], [other])
+
+        other.delete()
+        self.assertEqual(get_fast_swap_matches(fs)['fast_swaps'], [])
+
+
+class FastSwapImportTests(MatchingTestBase):
+    def read(self, text):
+        import io
+        from home.fast_swap_import import iter_rows
+
+        return iter_rows(io.BytesIO(text.encode()), 'upload.csv')
+
+    def test_import_writes_entries_and_reports_bad_rows(self):
+        from home.fast_swap_import import import_fast_swaps
+        from home.models import FastSwap
+        from home.subject_sets import subject_fingerprint
+
+        sheet = (
+            'Name,Phone,Level,Current County,School,Most Preferred,Acceptable Counties,Subjects\n'
+            'Jane Doe,0711000001,Secondary,kisumu,Kisumu High,Nakuru,"Nairobi; Mombasa","Mathematics, Chemistry"\n'
+            'John Roe,0711000002,primary,Nairobi,,Mombasa,,\n'
+            'Bad County,0711000003,Primary,Atlantis,,,,\n'
+            'No Phone,,Primary,Nairobi,,,,\n'
+            'Wrong School,0711000004,Primary,Mombasa,Kisumu High,,,\n'
+            'Jane Again,0711000001,Secondary,Nakuru,,,,\n'
+        )
+        result = import_fast_swaps(self.read(sheet), dry_run=True)
+        self.assertEqual((result['rows'], result['valid'], result['created']), (6, 2, 0))
+        self.assertFalse(FastSwap.objects.exists())
+
+        result = import_fast_swaps(self.read(sheet), chunk_size=1)
+        self.assertEqual((result['rows'], result['created']), (6, 2))
+        self.assertEqual([error['line'] for error in result['errors']], [4, 5, 6, 7])
+        self.assertIn("Unknown county 'Atlantis'", result['errors'][0]['errors'])
+        self.assertIn('phone is required', result['errors'][1]['errors'])
+
+        jane = FastSwap.objects.get(phone='0711000001')
+        self.assertEqual(jane.level, self.secondary_level)
+        self.assertEqual((jane.current_county, jane.school, jane.current_ward), (self.county_kisumu, self.school_kisumu_sec, self.ward_kisumu))
+        self.assertEqual(set(jane.acceptable_county.all()), {self.county_nairobi, self.county_mombasa})
+        self.assertEqual(jane.subject_fingerprint, subject_fingerprint([self.math.id, self.chem.id]))
+
+        # Importing the same sheet again only finds duplicates
+        self.assertEqual(import_fast_swaps(self.read(sheet))['created'], 0)
+
+    def test_import_marks_stored_matches_stale(self):
+        from home.fast_swap_import import import_fast_swaps
+        from home.fast_swap_store import get_fast_swap_matches
+        from home.models import FastSwap
+
+        fs = FastSwap.objects.create(names='A', phone='0700000000', level=self.primary_level, current_county=self.county_nairobi, most_preferred=self.county_mombasa)
+        self.assertEqual(get_fast_swap_matches(fs)['fast_swaps'], [])
+
+        import_fast_swaps(self.read('names,phone,level,county,most_preferred\nB,0711000009,Primary,Mombasa,Nairobi\n'))
+        self.assertEqual([match.names for match in get_fast_swap_matches(fs)['fast_swaps']], ['B'])
+
+
+class KeysetPaginationTests(MatchingTestBase):
+    def test_pages_walk_both_ways_through_ties(self):
+        from django.utils import timezone
+        from home.models import FastSwap
+        from home.pagination import keyset_page
+
+        for i in range(7):
+            FastSwap.objects.create(names=f'FS {i}', phone=f'07000000{i:02d}', level=self.primary_level, current_county=self.county_nairobi)
+        # Ties on created_at are broken by id
+        FastSwap.objects.filter(id__in=list(FastSwap.objects.order_by('id').values_list('id', flat=True)[2:5])).update(created_at=timezone.now())
+        expected = list(FastSwap.objects.order_by('-created_at', '-id'))
+
+        pages = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page = keyset_page(FastSwap.objects.all(), cursor=cursor, page_size=3)
+            pages.append(page)
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual([fs for page in pages for fs in page['items']], expected)
+        self.assertEqual([len(page['items']) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]['previous_cursor'])
+
+        back = keyset_page(FastSwap.objects.all(), cursor=pages[2]['previous_cursor'], page_size=3)
+        self.assertEqual(back['items'], pages[1]['items'])
+        back = keyset_page(FastSwap.objects.all(), cursor=back['previous_cursor'], page_size=3)
+        self.assertEqual(back['items'], pages[0]['items'])
+        self.assertIsNone(back['previous_cursor'])
+
+        # A damaged cursor falls back to the first page
+        self.assertEqual(keyset_page(FastSwap.objects.all(), cursor='not-a-cursor', page_size=3)['items'], pages[0]['items'])
+
+    def test_tampered_cursors_fall_back_to_the_first_page(self):
+        import base64
+        import json
+
+        from home.models import FastSwap
+        from home.pagination import keyset_page
+
+        FastSwap.objects.create(names='FS', phone='0700000000', level=self.primary_level, current_county=self.county_nairobi)
+
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+        first = keyset_page(FastSwap.objects.all())['items']
+        for payload in (['next', [None, None]], ['previous', ['2024-01-01T00:00:00', None]], ['next', {'a': 1}], ['next', [1, [2]]]):
+            self.assertEqual(keyset_page(FastSwap.objects.all(), cursor=cursor(payload))['items'], first)
+        # Annotated sort values too
+        self.assertEqual(self.client.get('/api/search/', {'q': 'nairobi', 'cursor': cursor(['next', [None, None, None]])}).status_code, 200)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'nairobi', 'cursor': cursor(['next', [{}, '2024-01-01T00:00:00', 1]])}).status_code, 200)
+        self.assertEqual(self.client.get('/api/swaps/', {'cursor': cursor(['next', [None, None]])}).status_code, 200)
+
+
+class SwapListingTests(MatchingTestBase):
+    def setUp(self):
+        super().setUp()
+        from home.models import Swaps
+
+        self.primary_level.name = 'Primary School'
+        self.primary_level.save()
+        self.viewer = self.create_teacher('viewer@test.com', self.primary_level, self.school_nairobi, desired_county=self.county_mombasa)
+        for i in range(7):
+            poster = self.create_teacher(f'poster{i}@test.com', self.primary_level, self.school_mombasa)
+            Swaps.objects.create(user=poster, gender='Any', boarding='Any', county=self.county_nairobi if i % 2 else self.county_kisumu)
+        Swaps.objects.create(user=self.viewer, gender='Any', boarding='Any', county=self.county_mombasa)
+
+    def test_pages_take_constant_queries_and_cover_every_swap(self):
+        from home.listings import get_listing_page, get_viewer, read_filters
+
+        viewer = get_viewer(self.viewer)
+        filters = read_filters({})
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(2):
+                page = get_listing_page('primary', viewer, filters, cursor=cursor, page_size=3)
+            seen.extend(row['swap'].id for row in page['rows'])
+            # Posters in Mombasa wanting the viewer's Nairobi match both ways
+            for row in page['rows']:
+                self.assertEqual(row['is_perfect_match'], row['swap'].county_id == self.county_nairobi.id)
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_sql_scores_equal_python_scores(self):
+        import random
+        from django.contrib.auth.models import AnonymousUser
+        from home.listings import (
+            SCORERS, _poster_subjects, _row_scores, annotate_scores, get_listing_page, get_viewer,
+            listing_queryset, read_filters,
+        )
+        from home.models import Swaps
+
+        rng = random.Random(18)
+        self.secondary_level.name = 'Secondary/High School'
+        self.secondary_level.save()
+        const_kisumu_east = Constituencies.objects.create(name="Kisumu East", county=self.county_kisumu)
+        ward_kisumu_east = Wards.objects.create(name="Kajulu", constituency=const_kisumu_east)
+        ward_kisumu_north = Wards.objects.create(name="Kolwa", constituency=self.const_kisumu)
+        schools = {
+            self.primary_level: [
+                self.school_nairobi,
+                self.school_mombasa,
+                Schools.objects.create(name="Kisumu Pri", gender="Mixed", level=self.primary_level, boarding="Day", curriculum=self.curriculum, postal_code="40100", ward=ward_kisumu_east),
+                None,
+            ],
+            self.secondary_level: [
+                self.school_kisumu_sec,
+                self.school_nakuru_sec,
+                Schools.objects.create(name="Kolwa High", gender="Mixed", level=self.secondary_level, boarding="Day", curriculum=self.curriculum, postal_code="40100", ward=ward_kisumu_north),
+                None,
+            ],
+        }
+        subjects = [self.math, self.chem, self.eng, Subject.objects.create(name="Biology", level=self.secondary_level)]
+        wants = [
+            (self.county_kisumu, self.const_kisumu, self.ward_kisumu),
+            (self.county_kisumu, self.const_kisumu, ward_kisumu_north),
+            (self.county_kisumu, const_kisumu_east, ward_kisumu_east),
+            (self.county_kisumu, None, None),
+            (self.county_nakuru, self.const_nakuru, self.ward_nakuru),
+            (self.county_nairobi, self.const_nairobi, self.ward_nairobi),
+            (self.county_nairobi, None, None),
+        ]
+
+        def teacher(email, level, desired):
+            user = self.create_teacher(email, level, rng.choice(schools[level]), desired_county=desired[0])
+            SwapPreference.objects.filter(user=user).update(desired_constituency=desired[1], desired_ward=desired[2])
+            mine = MySubject.objects.create(user=user)
+            mine.subject.set(rng.sample(subjects, rng.randint(0, 3)))
+            return user
+
+        for i in range(30):
+            level = rng.choice([self.primary_level, self.secondary_level])
+            poster = teacher(f'mixed{i}@test.com', level, rng.choice(wants))
+            Swaps.objects.create(user=poster, gender='Any', boarding='Any', county=rng.choice(wants)[0])
+            swap = Swaps.objects.create(user=poster, gender='Any', boarding='Any', county=None)
+            Swaps.objects.filter(id=swap.id).update(**dict(zip(('county', 'constituency', 'ward'), rng.choice(wants))))
+
+        viewers = [AnonymousUser(), self.viewer] + [
+            teacher(f'reader{i}@test.com', self.secondary_level, desired) for i, desired in enumerate(wants)
+        ]
+        filters = read_filters({})
+        for user in viewers:
+            viewer = get_viewer(user)
+            for kind, score in SCORERS.items():
+                swaps = list(annotate_scores(listing_queryset(kind, viewer, filters), kind, viewer))
+                self.assertTrue(swaps)
+                poster_subjects = _poster_subjects({swap.user_id for swap in swaps})
+                for swap in swaps:
+                    school = getattr(getattr(swap.user, 'profile', None), 'school', None)
+                    found = poster_subjects.get(swap.user_id, [])
+                    expected = score(swap, school, found, viewer)
+                    actual = _row_scores(kind, swap, found, viewer)
+                    expected['common_subjects'] = sorted(expected['common_subjects'])
+                    actual['common_subjects'] = sorted(actual['common_subjects'])
+                    self.assertEqual(actual, expected, (kind, user, swap.id))
+
+                # Best first across pages, not just within one
+                ranked, cursor = [], None
+                while True:
+                    page = get_listing_page(kind, viewer, filters, cursor=cursor, page_size=10)
+                    ranked.extend(row['match_score'] for row in page['rows'])
+                    cursor = page['next_cursor']
+                    if not cursor:
+                        break
+                self.assertEqual(ranked, sorted((swap.match_score for swap in swaps), reverse=True))
+
+    def test_json_endpoint_pages_with_filters(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get('/api/swaps/', {'level': 'primary', 'county': self.county_nairobi.id})
+        data = response.json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual({row['match_label'] for row in data['results']}, {'Perfect Match'})
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(self.client.get('/api/swaps/', {'level': 'nursery'}).status_code, 400)
+
+
+class PublicCacheTests(MatchingTestBase):
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_anonymous_pages_are_cached_per_query_string(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from home.public_cache import cache_anonymous_page
+
+        renders = []
+
+        @cache_anonymous_page
+        def page(request):
+            renders.append(request.GET.urlencode())
+            return HttpResponse('<input type="hidden" name="csrfmiddlewaretoken" value="token-of-first-visitor">')
+
+        def get(query, user=None):
+            request = RequestFactory().get('/swaps/', query)
+            request.user = user or AnonymousUser()
+            return page(request)
+
+        get({'county': 1})
+        cached = get({'county': '1', 'utm_source': 'whatsapp', 'fbclid': 'abc'})
+        self.assertEqual(len(renders), 1)
+        # Each visitor gets their own CSRF token, never the first visitor's
+        self.assertNotIn('token-of-first-visitor', cached.content.decode())
+        self.assertIn('name="csrfmiddlewaretoken" value="', cached.content.decode())
+
+        get({'county': 2})
+        get({'county': 1}, user=self.create_teacher('cached@test.com', self.primary_level, self.school_nairobi))
+        self.assertEqual(len(renders), 3)
+
+    def test_listing_changes_retire_cached_pages(self):
+        from home.models import Swaps
+        from home.public_cache import public_cache_version
+
+        version = public_cache_version()
+        teacher = self.create_teacher('poster@test.com', self.primary_level, self.school_nairobi)
+        self.assertGreater(public_cache_version(), version)
+
+        version = public_cache_version()
+        swap = Swaps.objects.create(user=teacher, gender='Any', boarding='Any', county=self.county_mombasa)
+        self.assertGreater(public_cache_version(), version)
+        version = public_cache_version()
+        swap.delete()
+        self.assertGreater(public_cache_version(), version)
+
+    def test_a_bump_in_one_worker_retires_pages_in_every_worker(self):
+        from unittest import mock
+
+        from django.contrib.auth.models import AnonymousUser
+        from django.core.cache.backends.locmem import LocMemCache
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from home.public_cache import bump_public_cache, cache_anonymous_page, public_cache_version
+
+        renders = []
+
+        @cache_anonymous_page
+        def page(request):
+            renders.append(1)
+            return HttpResponse('swaps')
+
+        def get():
+            request = RequestFactory().get('/swaps/')
+            request.user = AnonymousUser()
+            return page(request)
+
+        get()
+        get()
+        self.assertEqual(len(renders), 1)
+        version = public_cache_version()
+
+        # Another worker, with its own local cache, records a change
+        with mock.patch('home.public_cache.cache', LocMemCache('other-worker', {})):
+            bump_public_cache()
+        self.assertGreater(public_cache_version(), version)
+        get()
+        self.assertEqual(len(renders), 2)
+
+
+class ConditionalGetTests(MatchingTestBase):
+    def test_location_api_answers_304_until_wards_change(self):
+        Wards.objects.create(name="Karura", constituency=self.const_nairobi)
+        first = self.client.get('/api/wards/', {'constituency': self.const_nairobi.id})
+        self.assertEqual(len(first.json()), 2)
+        self.assertIn('max-age=86400', first['Cache-Control'])
+
+        again = self.client.get('/api/wards/', {'constituency': self.const_nairobi.id}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        # Another constituency has its own validator
+        other = self.client.get('/api/wards/', {'constituency': self.const_mombasa.id}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(other.status_code, 200)
+
+        Wards.objects.create(name="Kitisuru", constituency=self.const_nairobi)
+        changed = self.client.get('/api/wards/', {'constituency': self.const_nairobi.id}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()), 3)
+
+    def test_listing_etag_follows_swaps_and_viewer(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+        from home.conditional import swap_list_etag
+        from home.models import Bookmark, Swaps
+
+        poster = self.create_teacher('poster@test.com', self.primary_level, self.school_nairobi)
+        viewer = self.create_teacher('viewer@test.com', self.primary_level, self.school_mombasa)
+
+        def etag(user, query=None):
+            request = RequestFactory().get('/swaps/', query or {})
+            request.user = user
+            return swap_list_etag(request)
+
+        anonymous = etag(AnonymousUser())
+        self.assertEqual(etag(AnonymousUser()), anonymous)
+        self.assertNotEqual(etag(AnonymousUser(), {'county': self.county_nairobi.id}), anonymous)
+        self.assertNotEqual(etag(viewer), anonymous)
+
+        swap = Swaps.objects.create(user=poster, gender='Any', boarding='Any', county=self.county_mombasa)
+        self.assertNotEqual(etag(AnonymousUser()), anonymous)
+
+        before = etag(viewer)
+        Bookmark.objects.create(user=viewer, swap=swap, bookmark_type='swap')
+        self.assertNotEqual(etag(viewer), before)
+
+    def test_listing_etag_follows_poster_changes_made_in_another_worker(self):
+        from unittest import mock
+
+        from django.contrib.auth.models import AnonymousUser
+        from django.core.cache.backends.locmem import LocMemCache
+        from django.test import RequestFactory
+        from home.conditional import swap_list_etag
+        from home.models import Swaps
+
+        poster = self.create_teacher('poster@test.com', self.primary_level, self.school_nairobi)
+        Swaps.objects.create(user=poster, gender='Any', boarding='Any', county=self.county_mombasa)
+        request = RequestFactory().get('/swaps/')
+        request.user = AnonymousUser()
+        before = swap_list_etag(request)
+
+        # Only the poster's school changes, in a worker with its own local cache
+        with mock.patch('home.public_cache.cache', LocMemCache('other-worker', {})):
+            poster.profile.school = self.school_mombasa
+            poster.profile.save()
+        self.assertNotEqual(swap_list_etag(request), before)
+
+
+class GeoCacheTests(MatchingTestBase):
+    def test_lookups_come_from_memory_until_a_location_changes(self):
+        from home import geo_cache
+
+        self.assertEqual([c['name'] for c in geo_cache.counties()], ['Kisumu', 'Mombasa', 'Nairobi', 'Nakuru'])
+        with self.assertNumQueries(0):
+            self.assertEqual(geo_cache.wards(str(self.const_nairobi.id)), [{'id': self.ward_nairobi.id, 'name': 'Westlands'}])
+            self.assertEqual(geo_cache.constituencies(self.county_nairobi), [{'id': self.const_nairobi.id, 'name': 'Westlands'}])
+            self.assertEqual([s['name'] for s in geo_cache.subjects(self.secondary_level.id)], ['Chemistry', 'English', 'Mathematics'])
+            self.assertEqual(geo_cache.wards(None), [])
+
+        # The worker that saves a change drops its copy at once
+        Wards.objects.create(name="Karura", constituency=self.const_nairobi)
+        self.assertEqual([w['name'] for w in geo_cache.wards(self.const_nairobi.id)], ['Karura', 'Westlands'])
+
+    def test_other_workers_reload_on_a_new_version(self):
+        from django.db.models import F
+        from home import geo_cache
+        from home.models import CacheVersion
+
+        geo_cache.counties()
+        # Another worker adds a county: only the version in the database changes here
+        Counties.objects.bulk_create([Counties(name="Embu")])
+        CacheVersion.objects.filter(name=geo_cache.VERSION_NAME).update(version=F('version') + 1)
+        self.assertNotIn('Embu', [c['name'] for c in geo_cache.counties()])
+
+        geo_cache._loaded['checked_at'] -= geo_cache.CHECK_SECONDS
+        self.assertIn('Embu', [c['name'] for c in geo_cache.counties()])
+
+    def test_bulk_loads_bump_the_versions_once(self):
+        from home.cache_versions import stored_version
+        from home.geo_cache import VERSION_NAME
+        from home.public_cache import public_cache_version
+        from home.signals import bulk_location_load
+
+        geography, public = stored_version(VERSION_NAME), public_cache_version()
+        with bulk_location_load():
+            county = Counties.objects.create(name="Embu")
+            constituency = Constituencies.objects.create(name="Manyatta", county=county)
+            Wards.objects.create(name="Ruguru", constituency=constituency)
+            Subject.objects.create(name="Latin", level=self.secondary_level)
+            self.assertEqual((stored_version(VERSION_NAME), public_cache_version()), (geography, public))
+        self.assertEqual((stored_version(VERSION_NAME), public_cache_version()), (geography + 1, public + 1))
+
+
+class GeoBundleTests(MatchingTestBase):
+    def test_bundle_resolves_every_cascade(self):
+        import json
+        from home.geo_bundle import build_bundle
+
+        bundle = json.loads(json.dumps(build_bundle()))
+        self.assertEqual(bundle['counties'][0], [self.county_kisumu.id, 'Kisumu'])
+        self.assertEqual(bundle['constituencies'][str(self.county_nairobi.id)], [[self.const_nairobi.id, 'Westlands']])
+        self.assertEqual(bundle['wards'][str(self.const_mombasa.id)], [[self.ward_mombasa.id, 'Nyali']])
+        self.assertIn([self.secondary_level.id, 'Secondary', 'SEC'], bundle['levels'])
+        self.assertEqual([name for _, name in bundle['subjects'][str(self.secondary_level.id)]], ['Chemistry', 'English', 'Mathematics'])
+
+    def test_command_writes_the_bundle_and_pages_fall_back_to_the_api_until_it_is_collected(self):
+        import io
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from django.test import override_settings
+        from home.geo_bundle import BUNDLE_PATH, bundle_content, bundle_url
+
+        with tempfile.TemporaryDirectory() as root, override_settings(GEO_BUNDLE_ROOT=root):
+            call_command('build_geo_bundle', no_collectstatic=True, stdout=io.StringIO())
+            with open(os.path.join(root, BUNDLE_PATH), 'rb') as written:
+                self.assertEqual(written.read(), bundle_content())
+
+        url = bundle_url()
+        self.assertTrue(url.startswith('/api/geography/?v='))
+        response = self.client.get(url)
+        self.assertEqual(response.content, bundle_content())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # A new ward changes the bundle
+        Wards.objects.create(name="Karura", constituency=self.const_nairobi)
+        self.assertIn('Karura', self.client.get(bundle_url()).content.decode())
+
+
+class FacetCountTests(MatchingTestBase):
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_counts_come_from_one_query_and_follow_writes(self):
+        from unittest import mock
+
+        from django.core.cache.backends.locmem import LocMemCache
+        from home.facets import facet_counts, option_counts
+        from home.models import FastSwap, Swaps
+
+        primary = self.create_teacher('p@test.com', self.primary_level, self.school_nairobi)
+        secondary = self.create_teacher('s@test.com', self.secondary_level, self.school_kisumu_sec)
+        Swaps.objects.create(user=primary, gender='Any', boarding='Any', county=self.county_mombasa, constituency=self.const_mombasa, ward=self.ward_mombasa)
+        Swaps.objects.create(user=secondary, gender='Any', boarding='Any', county=self.county_mombasa)
+        Swaps.objects.create(user=secondary, gender='Any', boarding='Any', county=self.county_mombasa, archived=True)
+        Swaps.objects.create(user=secondary, gender='Any', boarding='Any', county=self.county_nakuru, status=False)
+        FastSwap.objects.create(names='A', phone='0700000000', level=self.primary_level, current_county=self.county_nairobi, current_ward=self.ward_nairobi)
+
+        # The shared version lookup, then the counts
+        with self.assertNumQueries(2):
+            counts = facet_counts()
+        with self.assertNumQueries(1):
+            facet_counts()
+        self.assertEqual(counts['swaps']['county'][self.county_mombasa.id], {'total': 2, 'levels': {self.primary_level.id: 1, self.secondary_level.id: 1}})
+        self.assertEqual(counts['swaps']['ward'], {self.ward_mombasa.id: {'total': 1, 'levels': {self.primary_level.id: 1}}})
+        self.assertNotIn(self.county_nakuru.id, counts['swaps']['county'])
+        self.assertEqual(option_counts('fast_swaps')['ward'], {self.ward_nairobi.id: 1})
+        self.assertEqual(option_counts('swaps', [self.secondary_level.id])['county'], {self.county_mombasa.id: 1})
+
+        # A new swap is counted on the next request, even one made in another worker
+        with mock.patch('home.public_cache.cache', LocMemCache('other-worker', {})):
+            Swaps.objects.create(user=primary, gender='Any', boarding='Any', county=self.county_nakuru)
+        self.assertEqual(option_counts('swaps')['county'][self.county_nakuru.id], 1)
+
+        response = self.client.get('/api/facets/')
+        self.assertEqual(response.json()['swaps']['county'][str(self.county_mombasa.id)]['total'], 2)
+        self.assertEqual(self.client.get('/api/facets/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+    def test_fast_swap_list_total_follows_new_entries(self):
+        from django.test import override_settings
+        from home.models import FastSwap
+
+        static_storage = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': static_storage},
+        }
+        FastSwap.objects.create(names='A', phone='0700000000', level=self.primary_level, current_county=self.county_nairobi)
+        with override_settings(STATICFILES_STORAGE=static_storage, STORAGES=storages):
+            self.assertEqual(self.client.get('/fast-swap/list/').context['total_count'], 1)
+            FastSwap.objects.create(names='B', phone='0700000001', level=self.primary_level, current_county=self.county_nairobi)
+            self.assertEqual(self.client.get('/fast-swap/list/').context['total_count'], 2)
+
+
+class SwapSearchTests(MatchingTestBase):
+    def test_words_are_folded_the_same_way_for_index_and_query(self):
+        from home.search import words
+
+        self.assertEqual(words("St. Mary's  Girls — Nyalí, NYALI"), ['st', 'mary', 'girls', 'nyali'])
+        self.assertEqual(words('a'), [])
+
+    def test_search_ranks_prefix_matches_and_pages_by_cursor(self):
+        from home.models import Swaps
+        from home.search import search_swaps
+
+        kisumu = self.create_teacher('kisumu@test.com', self.secondary_level, self.school_kisumu_sec)
+        MySubject.objects.create(user=kisumu).subject.set([self.chem, self.math])
+        nakuru = self.create_teacher('nakuru@test.com', self.secondary_level, self.school_nakuru_sec)
+        MySubject.objects.create(user=nakuru).subject.set([self.eng])
+        # Teaches at Kisumu High vs. merely wants to move to Kisumu
+        at_kisumu = Swaps.objects.create(user=kisumu, gender='Any', boarding='Any', county=self.county_mombasa)
+        to_kisumu = Swaps.objects.create(user=nakuru, gender='Any', boarding='Any', county=self.county_kisumu)
+        Swaps.objects.create(user=kisumu, gender='Any', boarding='Any', county=self.county_kisumu, archived=True)
+
+        with self.assertNumQueries(2):
+            page = search_swaps('KISU', page_size=1)
+        self.assertEqual([row['swap'] for row in page['rows']], [at_kisumu])
+        page = search_swaps('kisu', cursor=page['next_cursor'], page_size=1)
+        self.assertEqual([row['swap'] for row in page['rows']], [to_kisumu])
+        self.assertIsNone(page['next_cursor'])
+        self.assertEqual([row['swap'] for row in search_swaps('kisu', cursor=page['previous_cursor'], page_size=1)['rows']], [at_kisumu])
+
+        # Every word has to match something
+        self.assertEqual([row['swap'] for row in search_swaps('chem high')['rows']], [at_kisumu])
+        self.assertEqual(search_swaps('chem nakuru')['rows'], [])
+
+        # A renamed school is found by its new name
+        self.school_nakuru_sec.name = 'Menengai High'
+        self.school_nakuru_sec.save()
+        self.assertEqual([row['swap'] for row in search_swaps('menen')['rows']], [to_kisumu])
+
+        response = self.client.get('/api/search/', {'q': 'mathematics'})
+        self.assertEqual([result['id'] for result in response.json()['results']], [at_kisumu.id])
+
+
+class ActivityFeedTests(MatchingTestBase):
+    def test_feed_follows_swaps_and_serves_the_landing_page(self):
+        from unittest import mock
+
+        from home import activity_feed
+        from home.activity_feed import recent
+        from home.models import Swaps
+
+        kisumu = self.create_teacher('kisumu@test.com', self.secondary_level, self.school_kisumu_sec)
+        nakuru = self.create_teacher('nakuru@test.com', self.secondary_level, self.school_nakuru_sec)
+        older = Swaps.objects.create(user=kisumu, gender='Any', boarding='Any', county=self.county_mombasa)
+        newer = Swaps.objects.create(user=nakuru, gender='Any', boarding='Any')
+
+        with self.assertNumQueries(1):
+            entries = recent(3, kind='swap')
+        self.assertEqual([entry.swap_id for entry in entries], [newer.id, older.id])
+        self.assertEqual(
+            (entries[1].school_name, entries[1].from_county, entries[1].to_county),
+            (self.school_kisumu_sec.name, self.county_kisumu.name, self.county_mombasa.name),
+        )
+        self.assertEqual(entries[0].to_county, 'Any County')
+
+        # Archived swaps leave the feed; renames are copied in
+        newer.archived = True
+        newer.save()
+        self.school_kisumu_sec.name = 'Kisumu Boys'
+        self.school_kisumu_sec.save()
+        self.assertEqual([(entry.swap_id, entry.school_name) for entry in recent(3, kind='swap')], [(older.id, 'Kisumu Boys')])
+
+        # Each kind keeps only its FEED_SIZE newest entries
+        with mock.patch.object(activity_feed, 'FEED_SIZE', 1):
+            newest = Swaps.objects.create(user=nakuru, gender='Any', boarding='Any')
+        self.assertEqual([entry.swap_id for entry in recent(3, kind='swap')], [newest.id])
+
+        response = self.client.get('/api/activity/', {'kind': 'swap'})
+        self.assertEqual([result['url'] for result in response.json()['results']], [f'/swaps/{newest.id}/'])
+        self.assertEqual(self.client.get('/api/activity/', {'kind': 'other'}).status_code, 400)
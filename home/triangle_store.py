@@ -0,0 +1,179 @@
+"""
+Materialized triangle-swap store.
+
+Triangles only change when one of their three teachers changes, so the
+store is refreshed per teacher (see home.signals): every stored triangle
+touching the teacher is dropped - that covers the county bucket they were
+in - and the triangles through the teacher's current county bucket are
+searched again with find_triangles_for_user(). Triangles between other
+teachers are left alone.
+
+Each set of three teachers is stored once, rotated so that teacher_a has
+the smallest id. `manage.py rebuild_triangle_swaps` rebuilds everything.
+"""
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from users.models import MyUser
+from .models import Level, MySubject, TriangleSwap
+from .triangle_swap_utils import find_triangles_for_user, iter_triangle_ids, load_triangle_buckets
+
+
+def _is_secondary(level):
+    name = level.name.lower()
+    return 'secondary' in name or 'high' in name
+
+
+def _level_teachers(level):
+    """Candidate teachers of a level, as find_triangles_for_user() defaults to."""
+    return MyUser.objects.filter(
+        is_active=True,
+        profile__level=level,
+        swappreference__isnull=False,
+    )
+
+
+def _canonical(members):
+    """Rotate [(user_id, county_id), ...] so the smallest user id is first."""
+    start = members.index(min(members))
+    return members[start:] + members[:start]
+
+
+def store_triangles(triangles):
+    """
+    Bulk-create TriangleSwap rows from (level_id, members, subject_ids)
+    tuples, with their common subjects. Triangles already stored - by a
+    concurrent save of another member - are kept as they are.
+    """
+    rows = TriangleSwap.objects.bulk_create([
+        TriangleSwap(
+            teacher_a_id=members[0][0], county_a_id=members[0][1],
+            teacher_b_id=members[1][0], county_b_id=members[1][1],
+            teacher_c_id=members[2][0], county_c_id=members[2][1],
+            level_id=level_id,
+        )
+        for level_id, members, _ in triangles
+    ], batch_size=1000, ignore_conflicts=True)
+    if not rows:
+        return rows
+    # Ids aren't returned when conflicts are ignored (nor ever on MySQL):
+    # look them up by the unique participant triple
+    ids = {
+        (a, b, c): pk
+        for a, b, c, pk in TriangleSwap.objects.filter(
+            teacher_a_id__in={row.teacher_a_id for row in rows}
+        ).values_list('teacher_a_id', 'teacher_b_id', 'teacher_c_id', 'id')
+    }
+    for row in rows:
+        row.pk = ids.get((row.teacher_a_id, row.teacher_b_id, row.teacher_c_id))
+    TriangleSwap.common_subjects.through.objects.bulk_create([
+        TriangleSwap.common_subjects.through(triangleswap_id=row.pk, subject_id=subject_id)
+        for row, (_, _, subject_ids) in zip(rows, triangles)
+        if row.pk is not None
+        for subject_id in subject_ids
+    ], batch_size=1000, ignore_conflicts=True)
+    return rows
+
+
+def refresh_user_triangles(user_id):
+    """
+    Recompute the stored triangles that include the given teacher.
+    Returns the number of triangles the teacher is now part of.
+    """
+    user = MyUser.objects.select_related('profile__level').filter(pk=user_id).first()
+    profile = getattr(user, 'profile', None) if user else None
+
+    triangles = []
+    if profile and profile.level_id:
+        secondary = _is_secondary(profile.level)
+        teachers = _level_teachers(profile.level).select_related('profile')
+        subject_ids = []
+        if secondary:
+            # Every teacher in a secondary triangle has the same subject set
+            subject_ids = sorted(set(
+                MySubject.subject.through.objects.filter(
+                    mysubject__user_id=user_id
+                ).values_list('subject_id', flat=True)
+            ))
+        for teacher_a, teacher_b, teacher_c in find_triangles_for_user(user, teachers, secondary=secondary):
+            members = _canonical([
+                (teacher.id, teacher.profile.current_county_id)
+                for teacher in (teacher_a, teacher_b, teacher_c)
+            ])
+            triangles.append((profile.level_id, members, subject_ids))
+
+    with transaction.atomic():
+        TriangleSwap.objects.filter(
+            Q(teacher_a_id=user_id) | Q(teacher_b_id=user_id) | Q(teacher_c_id=user_id)
+        ).delete()
+        store_triangles(triangles)
+
+    return len(triangles)
+
+
+def rebuild_triangle_swaps(stdout=None):
+    """
+    Rebuild the whole store from scratch, one level at a time. Used by the
+    rebuild_triangle_swaps management command to recover from drift.
+    """
+    subjects_by_user = {}
+    for user_id, subject_id in MySubject.subject.through.objects.values_list(
+        'mysubject__user_id', 'subject_id'
+    ):
+        subjects_by_user.setdefault(user_id, set()).add(subject_id)
+
+    triangles = []
+    for level in Level.objects.order_by('id'):
+        secondary = _is_secondary(level)
+        groups = load_triangle_buckets(_level_teachers(level), secondary=secondary)
+        found = 0
+        for group_key, group in groups.items():
+            county = group['county']
+            for triangle in iter_triangle_ids({group_key: group}):
+                subject_ids = sorted(subjects_by_user.get(triangle[0], ())) if secondary else []
+                triangles.append((level.id, [(t, county[t]) for t in triangle], subject_ids))
+                found += 1
+        if stdout:
+            stdout.write(f"  {level.name}: {found} triangles")
+
+    with transaction.atomic():
+        TriangleSwap.objects.all().delete()
+        store_triangles(triangles)
+
+    return len(triangles)
+
+
+def get_stored_triangles(user):
+    """
+    TriangleSwap queryset of the stored triangles that include ``user``,
+    with participants, profiles and counties loaded.
+    """
+    return TriangleSwap.objects.filter(
+        Q(teacher_a_id=user.id) | Q(teacher_b_id=user.id) | Q(teacher_c_id=user.id)
+    ).select_related(
+        'teacher_a__profile',
+        'teacher_b__profile',
+        'teacher_c__profile',
+        'county_a',
+        'county_b',
+        'county_c',
+    ).prefetch_related('common_subjects').order_by('id')
+
+
+def get_triangles_computed_at(user):
+    """When the oldest stored triangle of ``user`` was computed, or None."""
+    return TriangleSwap.objects.filter(
+        Q(teacher_a_id=user.id) | Q(teacher_b_id=user.id) | Q(teacher_c_id=user.id)
+    ).aggregate(oldest=Min('computed_at'))['oldest']
+
+
+def get_stored_triangle_counts(user_ids=None):
+    """Return {user_id: triangle_count}, one grouped query per position."""
+    counts = {}
+    for field in ('teacher_a_id', 'teacher_b_id', 'teacher_c_id'):
+        triangles = TriangleSwap.objects.all()
+        if user_ids is not None:
+            triangles = triangles.filter(**{f'{field}__in': list(user_ids)})
+        for user_id, total in triangles.values(field).annotate(total=Count('id')).values_list(field, 'total'):
+            counts[user_id] = counts.get(user_id, 0) + total
+    return counts
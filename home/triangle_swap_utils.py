@@ -10,21 +10,16 @@ This creates a circular match where all three get their desired locations.
 """
 
 from django.db.models import Q
-from home.models import Level, MySubject
+from home.models import Level, MySubject, SwapPreference
 
 
 def get_current_county(user):
     """Get the current county where a teacher is teaching."""
-    if not hasattr(user, 'profile') or not user.profile:
-        return None
-    
-    if not user.profile.school or not user.profile.school.ward:
-        return None
-    
-    try:
-        return user.profile.school.ward.constituency.county
-    except:
+    profile = getattr(user, 'profile', None)
+    if not profile:
         return None
+    # Denormalized from profile.school.ward.constituency.county
+    return profile.current_county
 
 
 def wants_county(user, target_county):
@@ -59,18 +54,25 @@ def get_user_subjects(user):
     return set()
 
 
+def get_subject_fingerprint(user):
+    """Get the stored subject-set fingerprint for a user ('' if none)."""
+    profile = getattr(user, 'profile', None)
+    if not profile:
+        return ''
+    return profile.subject_fingerprint
+
+
 def have_same_subjects(user1, user2):
     """Check if two users have exactly the same set of subjects."""
-    subjects1 = get_user_subjects(user1)
-    subjects2 = get_user_subjects(user2)
-    return subjects1 == subjects2
+    return get_subject_fingerprint(user1) == get_subject_fingerprint(user2)
 
 
 
-def find_triangle_swaps_primary(teachers_queryset):
+def find_triangle_swaps_primary_reference(teachers_queryset):
     """
-    Find triangle swaps for PRIMARY level teachers.
-    Only checks location matching (no subject requirement).
+    Reference implementation of find_triangle_swaps_primary(): walks
+    A -> B -> C over model instances and queries preferences per teacher.
+    Kept for parity tests and benchmark_triangles.
     
     Returns list of tuples: [(teacher_a, teacher_b, teacher_c), ...]
     """
@@ -158,12 +160,13 @@ def find_triangle_swaps_primary(teachers_queryset):
     return triangle_swaps
 
 
-def find_triangle_swaps_secondary(teachers_queryset):
+def find_triangle_swaps_secondary_reference(teachers_queryset):
     """
-    Find triangle swaps for SECONDARY level teachers.
-    Find triangle swaps for SECONDARY level teachers.
+    Reference implementation of find_triangle_swaps_secondary(), see
+    find_triangle_swaps_primary_reference().
     Checks BOTH location AND subject matching.
-    All three teachers must have exactly the same subjects.
+    All three teachers must have exactly the same subjects; teachers
+    without subjects are left out, as in find_matches().
     
     Returns list of tuples: [(teacher_a, teacher_b, teacher_c), ...]
     """
@@ -185,6 +188,10 @@ def find_triangle_swaps_secondary(teachers_queryset):
         if not county_a:
             continue
         
+        # Same subjects means no subjects for all three: no match
+        if not get_subject_fingerprint(teacher_a):
+            continue
+        
         # What county does Teacher A want?
         pref_a = teacher_a.swappreference
         if not pref_a:
@@ -256,6 +263,212 @@ def find_triangle_swaps_secondary(teachers_queryset):
     return triangle_swaps
 
 
+def load_triangle_buckets(teachers_queryset, secondary=False):
+    """
+    Load the candidates of ``teachers_queryset`` into plain data, in two
+    queries. Returns {group: {'county': {user_id: county_id},
+    'wants': {user_id: set of county ids}}}, where group is the subject
+    fingerprint for secondary searches and None otherwise. Secondary
+    teachers without subjects are left out, as in find_matches().
+    """
+    rows = teachers_queryset.order_by().prefetch_related(None).filter(
+        profile__current_county__isnull=False,
+        swappreference__isnull=False,
+    )
+    teachers = list(rows.values_list(
+        'id', 'swappreference__id', 'swappreference__desired_county_id',
+        'profile__current_county_id', 'profile__subject_fingerprint',
+    ).distinct())
+    wanted = {pref_id: ({desired} if desired else set()) for _, pref_id, desired, _, _ in teachers}
+    for pref_id, county_id in SwapPreference.open_to_all.through.objects.filter(
+        swappreference__user__in=rows.values('id')
+    ).values_list('swappreference_id', 'counties_id'):
+        wanted[pref_id].add(county_id)
+
+    groups = {}
+    for user_id, pref_id, _, county_id, fingerprint in teachers:
+        if secondary and not fingerprint:
+            continue
+        group = groups.setdefault(fingerprint if secondary else None, {'county': {}, 'wants': {}})
+        group['county'][user_id] = county_id
+        group['wants'][user_id] = wanted[pref_id]
+    return groups
+
+
+def iter_triangle_ids(groups):
+    """
+    Lazily yield (a, b, c) user id triples with A -> B -> C -> A, one per
+    set of three teachers.
+
+    Within each group, teachers are indexed by (current county, wanted
+    county). 3-cycles x -> y -> z -> x are enumerated on the county
+    "wants" graph (at most 47 nodes), and teacher triples are expanded
+    from the matching index entries only. A triple is emitted from its
+    smallest id; when the reverse cycle is also valid, only the
+    orientation with b < c is kept.
+    """
+    for group in groups.values():
+        county = group['county']
+        wants = group['wants']
+
+        # (x, y) -> teachers in county x who want county y
+        index = {}
+        for user_id, wanted in wants.items():
+            for target in wanted:
+                index.setdefault((county[user_id], target), []).append(user_id)
+        successors = {}
+        for x, y in index:
+            successors.setdefault(x, set()).add(y)
+
+        for x, ys in successors.items():
+            for y in ys:
+                for z in successors.get(y, ()):
+                    if x not in successors.get(z, ()):
+                        continue
+                    for a in index[(x, y)]:
+                        for b in index[(y, z)]:
+                            if b <= a:
+                                continue
+                            for c in index[(z, x)]:
+                                if c <= a or c == b:
+                                    continue
+                                reverse_valid = (
+                                    z in wants[a] and y in wants[c] and x in wants[b]
+                                )
+                                if reverse_valid and c < b:
+                                    continue
+                                yield a, b, c
+
+
+def iter_triangle_swaps(teachers_queryset, secondary=False):
+    """
+    Lazily yield (teacher_a, teacher_b, teacher_c) model instances for every
+    triangle among ``teachers_queryset``. Instances come from the queryset,
+    so its select_related/prefetch_related apply.
+    """
+    by_id = None
+    for a, b, c in iter_triangle_ids(load_triangle_buckets(teachers_queryset, secondary)):
+        if by_id is None:
+            by_id = {teacher.id: teacher for teacher in teachers_queryset}
+        yield by_id[a], by_id[b], by_id[c]
+
+
+def find_triangle_swaps_primary(teachers_queryset):
+    """
+    Find triangle swaps for PRIMARY level teachers.
+    Only checks location matching (no subject requirement).
+    
+    Returns list of tuples: [(teacher_a, teacher_b, teacher_c), ...]
+    """
+    return list(iter_triangle_swaps(teachers_queryset))
+
+
+def find_triangle_swaps_secondary(teachers_queryset):
+    """
+    Find triangle swaps for SECONDARY level teachers.
+    Checks BOTH location AND subject matching.
+    All three teachers must have exactly the same subjects.
+    
+    Returns list of tuples: [(teacher_a, teacher_b, teacher_c), ...]
+    """
+    return list(iter_triangle_swaps(teachers_queryset, secondary=True))
+
+
+def _wanted_counties(teachers):
+    """
+    {swappreference id: set of wanted county ids} for rows of
+    (user id, swappreference id, desired county id).
+    """
+    wanted = {pref_id: ({desired} if desired else set()) for _, pref_id, desired in teachers}
+    for pref_id, county_id in SwapPreference.open_to_all.through.objects.filter(
+        swappreference_id__in=list(wanted)
+    ).values_list('swappreference_id', 'counties_id'):
+        wanted[pref_id].add(county_id)
+    return wanted
+
+
+def find_triangles_for_user(user, teachers=None, secondary=None):
+    """
+    Find the triangle swaps that include ``user``, without enumerating the
+    whole level.
+
+    ``teachers`` is the candidate queryset (the same one the full
+    find_triangle_swaps_* search would be given); by default every active
+    teacher on the user's level with swap preferences. ``secondary``
+    defaults to the user's level and requires equal subject sets.
+
+    The search is rooted at the user (A): B must teach in a county A wants,
+    C must want A's county, and B must want C's county. Only B and C
+    candidates are loaded, bucketed by county, so the cost follows the
+    user's neighbourhood rather than the level size.
+
+    Returns [(user, teacher_b, teacher_c), ...] with A -> B -> C -> A, one
+    entry per set of three teachers.
+    """
+    from users.models import MyUser
+
+    profile = getattr(user, 'profile', None)
+    if not profile or not profile.current_county_id:
+        return []
+    my_county = profile.current_county_id
+
+    if teachers is None:
+        teachers = MyUser.objects.filter(
+            is_active=True,
+            profile__level=profile.level,
+            swappreference__isnull=False,
+        )
+    if secondary is None:
+        level_name = profile.level.name.lower() if profile.level else ''
+        secondary = 'secondary' in level_name or 'high' in level_name
+
+    rows = teachers.order_by().prefetch_related(None).filter(
+        profile__current_county__isnull=False,
+    )
+    me = rows.filter(id=user.id).values_list(
+        'id', 'swappreference__id', 'swappreference__desired_county_id', 'profile__subject_fingerprint'
+    ).first()
+    if not me or (secondary and not me[3]):
+        # Secondary teachers without subjects match no one (find_matches)
+        return []
+    my_wants = _wanted_counties([me[:3]])[me[1]]
+    if not my_wants:
+        return []
+
+    candidates = rows.exclude(id=user.id)
+    if secondary:
+        candidates = candidates.filter(profile__subject_fingerprint=me[3])
+
+    # B: teachers in a county I want, with the counties they want
+    teachers_b = list(candidates.filter(
+        profile__current_county_id__in=my_wants
+    ).values_list('id', 'swappreference__id', 'swappreference__desired_county_id').distinct())
+    wanted_by_b = _wanted_counties(teachers_b)
+
+    # C: teachers who want my county, bucketed by where they teach
+    teachers_c_by_county = {}
+    for c_id, c_county in candidates.filter(
+        Q(swappreference__desired_county_id=my_county) | Q(swappreference__open_to_all=my_county)
+    ).values_list('id', 'profile__current_county_id').distinct():
+        teachers_c_by_county.setdefault(c_county, []).append(c_id)
 
+    triangle_ids = set()
+    for b_id, b_pref_id, _ in teachers_b:
+        for county_id in wanted_by_b[b_pref_id]:
+            for c_id in teachers_c_by_county.get(county_id, ()):
+                if c_id != b_id:
+                    triangle_ids.add((b_id, c_id))
 
+    # B -> C and C -> B can both close a cycle; keep one per set of teachers
+    seen = set()
+    unique_ids = []
+    for b_id, c_id in sorted(triangle_ids):
+        key = frozenset((b_id, c_id))
+        if key not in seen:
+            seen.add(key)
+            unique_ids.append((b_id, c_id))
 
+    involved = {teacher_id for pair in unique_ids for teacher_id in pair} | {user.id}
+    by_id = {teacher.id: teacher for teacher in teachers.filter(id__in=involved)}
+    me_obj = by_id.get(user.id, user)
+    return [(me_obj, by_id[b_id], by_id[c_id]) for b_id, c_id in unique_ids]
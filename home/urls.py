@@ -2,7 +2,7 @@ from django.urls import path
 from django.contrib.auth.decorators import login_required
 
 from . import views, views_schools
-from .api_views import ConstituencyAPIView, WardAPIView
+from .api_views import ActivityFeedAPIView, ConstituencyAPIView, FacetCountsAPIView, GeographyBundleAPIView, SwapListingAPIView, SwapSearchAPIView, WardAPIView
 from .error_views import error_page
 
 app_name = 'home'
@@ -33,6 +33,11 @@ urlpatterns = [
     # API endpoints
     path("api/constituencies/", ConstituencyAPIView.as_view(), name="api_constituencies"),
     path("api/wards/", WardAPIView.as_view(), name="api_wards"),
+    path("api/geography/", GeographyBundleAPIView.as_view(), name="geography_bundle"),
+    path("api/swaps/", SwapListingAPIView.as_view(), name="api_swaps"),
+    path("api/facets/", FacetCountsAPIView.as_view(), name="api_facets"),
+    path("api/search/", SwapSearchAPIView.as_view(), name="api_search"),
+    path("api/activity/", ActivityFeedAPIView.as_view(), name="api_activity"),
     
     # Swap preferences
     
@@ -41,6 +46,7 @@ urlpatterns = [
     
     # FastSwap management
     path("fast-swap/add/", login_required(views.add_fast_swap), name="add_fast_swap"),
+    path("fast-swap/import/", login_required(views.import_fast_swaps), name="import_fast_swaps"),
     path("fast-swap/list/", views.fast_swap_list, name="fast_swap_list"),
     path("fast-swap/<int:fastswap_id>/", views.fast_swap_detail, name="fast_swap_detail"),
     
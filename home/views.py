@@ -1,53 +1,34 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import (HttpResponseRedirect, get_object_or_404,
                               redirect, render)
-from django.urls import reverse
+from django.views.decorators.http import condition
 
-from .forms import (FastSwapForm, MySubjectForm, SchoolForm, SwapForm,
-                    SwapPreferenceForm)
-from .models import (Bookmark, Constituencies, Counties, FastSwap, Level, MySubject,
+from . import activity_feed, facets, geo_cache
+from .conditional import fast_swap_list_etag, swap_list_etag
+from .forms import (FastSwapForm, FastSwapImportForm, MySubjectForm,
+                    SchoolForm, SwapForm, SwapPreferenceForm)
+from .models import (Bookmark, FastSwap, Level, MySubject,
                      Schools, Subject, SwapPreference, SwapRequests, Swaps,
                      User, Wards)
+from .public_cache import cache_anonymous_page, public_cache_context, public_cache_version
 
+# How long the FastSwap list keeps a filter's total count
+FAST_SWAP_COUNT_CACHE_SECONDS = 300
 
+
+@cache_anonymous_page
 def landing_page(request):
     """
     Landing page where teachers can discover and start swap requests.
-    Shows 3 recent swap listings as preview.
+    Shows the 3 newest active swap listings as preview, read from the
+    recent-activity feed (home.activity_feed). Anonymous responses are
+    cached (home.public_cache).
     """
-    # Fetch 3 most recent swaps for preview (simple query)
-    recent_swaps = Swaps.objects.select_related(
-        'user',
-        'county'
-    ).order_by('-created_at')[:3]
-    
-    # Prepare swap data for display
-    swaps_preview = []
-    for swap in recent_swaps:
-        profile = getattr(swap.user, 'profile', None)
-        school = getattr(profile, 'school', None) if profile else None
-        level = getattr(profile, 'level', None) if profile else None
-        school_ward = getattr(school, 'ward', None) if school else None
-        school_county_name = 'N/A'
-        if school_ward:
-            const = getattr(school_ward, 'constituency', None)
-            if const:
-                county = getattr(const, 'county', None)
-                if county:
-                    school_county_name = county.name
-        
-        swap_data = {
-            'id': swap.id,
-            'school_name': school.name if school else 'N/A',
-            'current_county': school_county_name,
-            'target_county': swap.county.name if swap.county else 'Any County',
-            'level': level.name if level else 'N/A',
-            'created_at': swap.created_at,
-        }
-        swaps_preview.append(swap_data)
-    
+    swaps_preview = activity_feed.recent(3, kind='swap')
+
     return render(request, "home/landing.html", {
         'swaps_preview': swaps_preview,
     })
@@ -64,7 +45,7 @@ def create_school(request):
         return redirect('home:home')
 
     # Get all counties for the template
-    counties = Counties.objects.all().order_by('name')
+    counties = geo_cache.counties()
     
     # Get selected values from POST/GET data for form repopulation
     selected_county = request.POST.get('county')
@@ -96,22 +77,8 @@ def create_school(request):
         form = SchoolForm()
     
     # Get constituencies and wards based on selected values for form repopulation
-    constituencies = Constituencies.objects.none()
-    wards = Wards.objects.none()
-    
-    if selected_county:
-        try:
-            county_id = int(selected_county)
-            constituencies = Constituencies.objects.filter(county_id=county_id).order_by('name')
-            
-            if selected_constituency:
-                try:
-                    constituency_id = int(selected_constituency)
-                    wards = Wards.objects.filter(constituency_id=constituency_id).order_by('name')
-                except (ValueError, TypeError):
-                    pass
-        except (ValueError, TypeError):
-            pass
+    constituencies = geo_cache.constituencies(selected_county)
+    wards = geo_cache.wards(selected_constituency) if constituencies else []
     
     # Convert selected values to integers for the template
     selected_county_id = int(selected_county) if selected_county and selected_county.isdigit() else None
@@ -218,7 +185,7 @@ def create_mysubject(request):
         return redirect('home:create_mysubject')
 
     # Get all available levels for the level selection dropdown
-    levels = Level.objects.all().order_by('name')
+    levels = geo_cache.levels()
     
     return render(
         request,
@@ -275,216 +242,76 @@ def create_swap(request):
     )
 
 
-def all_swaps(request):
+def _swap_listing_context(request, kind):
     """
-    Public page listing recent active swaps from all users.
-    Excludes archived and inactive swaps.
+    Context shared by the swap listing pages: one keyset page of
+    home.listings rows plus the filter dropdowns and setup state.
     """
-    # Check if user has swap preferences
-    has_swap_preferences = False
-    if request.user.is_authenticated:
-        from home.models import SwapPreference
-        has_swap_preferences = SwapPreference.objects.filter(user=request.user).exists()
-    
-    # Get filter parameters
-    selected_county = request.GET.get('county')
-    selected_constituency = request.GET.get('constituency')
-    selected_ward = request.GET.get('ward')
-    
-    # Debug print
-    print(f"DEBUG - Filters - County: {selected_county}, Constituency: {selected_constituency}, Ward: {selected_ward}")
-    
-    # Start with base query - exclude archived, inactive, and current user's swaps
-    swaps = Swaps.objects.filter(
-        archived=False,  # Exclude archived swaps
-        status=True,     # Only include active swaps
-    )
-    
-    # Exclude swaps created by the current user if they're logged in
-    if request.user.is_authenticated:
-        swaps = swaps.exclude(user=request.user)
-    
-    # Apply filters if provided
-    if selected_county and selected_county.isdigit():
-        print(f"DEBUG - Filtering by county_id: {selected_county}")
-        swaps = swaps.filter(county_id=selected_county)
-    
-    if selected_constituency and selected_constituency.isdigit():
-        print(f"DEBUG - Filtering by constituency_id: {selected_constituency}")
-        swaps = swaps.filter(constituency_id=selected_constituency)
-    
-    if selected_ward and selected_ward.isdigit():
-        print(f"DEBUG - Filtering by ward_id: {selected_ward}")
-        swaps = swaps.filter(ward_id=selected_ward)
-    
-    # Order and limit results
-    from django.db.models import Prefetch
-
-    # First get all the swaps with related data
-    swaps = swaps.select_related(
-        "county", 
-        "constituency", 
-        "ward",
-        "user__profile__school"  # Get the user's school
-    ).order_by("-created_at")[:50]
-    
-    # Prefetch the subjects for all users in one query
-    from django.db.models import Prefetch
-
-    from home.models import MySubject  # MySubject is defined in the home app
-
-    # Get all user IDs from the swaps
-    user_ids = [swap.user_id for swap in swaps]
-    
-    # Create a dictionary mapping user_id to their subjects
-    user_subjects = {}
-    # Prefetch the many-to-many relationship
-    for mysubject in MySubject.objects.filter(user_id__in=user_ids).prefetch_related('subject'):
-        if mysubject.user_id not in user_subjects:
-            user_subjects[mysubject.user_id] = []
-        # Get all subjects for this MySubject instance
-        user_subjects[mysubject.user_id].extend(list(mysubject.subject.all()))
-    
-    # Get all counties for the filter dropdown
-    counties = Counties.objects.all().order_by('name')
-    
-    # Get selected county and its constituencies if a county is selected
-    selected_county_obj = None
-    # Initialize as empty querysets instead of empty lists
-    constituencies = Constituencies.objects.none()
-    wards = Wards.objects.none()
-    
-    if selected_county and selected_county.isdigit():
-        selected_county_obj = Counties.objects.filter(id=selected_county).first()
-        if selected_county_obj:
-            constituencies = Constituencies.objects.filter(county=selected_county_obj).order_by('name')
-    
-    # Get selected constituency and its wards if a constituency is selected
-    selected_constituency_obj = None
-    if selected_constituency and selected_constituency.isdigit():
-        selected_constituency_obj = Constituencies.objects.filter(id=selected_constituency).first()
-        if selected_constituency_obj:
-            wards = Wards.objects.filter(constituency=selected_constituency_obj).order_by('name')
-    
-    context = {
-        'swaps': swaps,
-        'counties': counties,
-        'constituencies': constituencies,
-        'wards': wards,
-        'selected_county': int(selected_county) if selected_county and selected_county.isdigit() else '',
-        'selected_constituency': int(selected_constituency) if selected_constituency and selected_constituency.isdigit() else '',
-        'selected_ward': int(selected_ward) if selected_ward and selected_ward.isdigit() else '',
-        'has_swap_preferences': has_swap_preferences,
-        'user': request.user if request.user.is_authenticated else None,
-    }
-    # Get current user's profile, school, and swap preferences if logged in
-    current_user = request.user
-    current_user_profile = getattr(current_user, 'profile', None) if current_user.is_authenticated else None
-    current_user_school = getattr(current_user_profile, 'school', None) if current_user_profile else None
-    
-    # Get current user's swap preferences
-    current_user_prefs = None
-    if current_user.is_authenticated:
-        current_user_prefs = getattr(current_user, 'swappreference', None)
-    
-    # Get current user's subjects if logged in
-    current_user_subjects = set()
-    if current_user.is_authenticated:
-        current_user_subjects = set(MySubject.objects.filter(user=current_user).values_list('subject__name', flat=True))
-    
-    # Prepare the swaps data with match scoring
-    swaps_data = []
-    for swap in swaps:
-        user_profile = getattr(swap.user, 'profile', None)
-        school = getattr(user_profile, 'school', None)
-        
-        # Get swap poster's subjects
-        poster_subjects = set(subj.name for subj in user_subjects.get(swap.user_id, []))
-        
-        # Calculate match score (0-100)
-        match_score = 0
-        common_subjects = set()
-        
-        # 1. Subject match (50 points max)
-        if current_user.is_authenticated and poster_subjects:
-            common_subjects = current_user_subjects.intersection(poster_subjects)
-            if common_subjects:
-                match_score += 50  # Max 50 points for subject match
-        
-        # 2. Location match (50 points max)
-        location_score = 0
-        is_near_perfect_match = False
-        
-        if current_user_prefs and swap.county and swap.constituency and swap.ward:
-            # County match (20 points)
-            if current_user_prefs.desired_county and current_user_prefs.desired_county == swap.county:
-                location_score += 20
-                # Constituency match (20 points)
-                if (current_user_prefs.desired_constituency and 
-                    current_user_prefs.desired_constituency == swap.constituency):
-                    location_score += 20
-                    # Ward match (10 points) - only if it matches
-                    if (current_user_prefs.desired_ward and 
-                        current_user_prefs.desired_ward == swap.ward):
-                        location_score += 10
-                    # Check for near perfect match (county and constituency match, but not ward)
-                    elif (current_user_prefs.desired_ward and 
-                          current_user_prefs.desired_ward != swap.ward and
-                          common_subjects):
-                        is_near_perfect_match = True
-            
-            match_score += location_score
-        
-        swaps_data.append({
-            'swap': swap,
-            'user_school': school,
-            'user_subjects': user_subjects.get(swap.user_id, []),
-            'match_score': match_score,
-            'is_perfect_match': match_score == 100,  # 100% match
-            'is_near_perfect_match': is_near_perfect_match,
-            'common_subjects': list(common_subjects)[:3]  # Show up to 3 common subjects
-        })
-    
-    # Sort by match score (highest first)
-    swaps_data.sort(key=lambda x: x['match_score'], reverse=True)
-    
-    context = {
-        "swaps_data": swaps_data,  # Use the enriched data
-        "title": "All Swaps",
-        "counties": counties,
-        "constituencies": constituencies,
-        "wards": wards,
-        "selected_county": selected_county,
-        "selected_constituency": selected_constituency,
-        "selected_ward": selected_ward,
-    }
-    
-    # Convert querysets to lists for template rendering and get counts
-    constituencies_list = list(constituencies)
-    wards_list = list(wards)
-    
-    print("DEBUG - Context:", {
-        'selected_county': selected_county,
-        'selected_constituency': selected_constituency,
-        'selected_ward': selected_ward,
-        'constituencies_count': len(constituencies_list),
-        'wards_count': len(wards_list),
-        'swaps_count': len(swaps_data) if isinstance(swaps_data, list) else swaps_data.count()
-    })
-    
+    from .listings import filter_options, get_listing_page, get_viewer, read_filters
+
+    viewer = get_viewer(request.user)
+    filters = read_filters(request.GET)
+    page = get_listing_page(kind, viewer, filters, cursor=request.GET.get('cursor'))
+
+    # Filters to keep in the page links
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+
     context = {
-        "swaps_data": swaps_data,  # Use the enriched data
-        "title": "All Swaps",
-        "counties": counties,
-        "constituencies": constituencies_list,  # Use the list version
-        "wards": wards_list,  # Use the list version
-        "selected_county": selected_county,
-        "selected_constituency": selected_constituency,
-        "selected_ward": selected_ward,
-        "has_swap_preferences": has_swap_preferences,
+        "swaps_data": page['rows'],
+        "next_cursor": page['next_cursor'],
+        "previous_cursor": page['previous_cursor'],
+        "filter_query": filter_query.urlencode(),
+        "selected_county": request.GET.get('county'),
+        "selected_constituency": request.GET.get('constituency'),
+        "selected_ward": request.GET.get('ward'),
+        "has_swap_preferences": viewer['prefs'] is not None,
         "user": request.user if request.user.is_authenticated else None,
     }
-    
+    context.update(filter_options(filters, kind))
+    context.update(public_cache_context())
+
+    if request.user.is_authenticated:
+        context["bookmarked_ids"] = list(Bookmark.objects.filter(
+            user=request.user,
+            bookmark_type='swap'
+        ).values_list('swap_id', flat=True))
+    else:
+        context["bookmarked_ids"] = []
+    return context, viewer
+
+
+def _setup_state(request, viewer, needs_subjects=False):
+    """What a teacher still has to set up before scores mean anything."""
+    missing_items = []
+    has_level = bool(viewer['profile'] and viewer['profile'].level_id)
+    has_subjects = bool(viewer['subject_ids'])
+    if request.user.is_authenticated:
+        if not has_level:
+            missing_items.append('level')
+        if viewer['prefs'] is None:
+            missing_items.append('swap_preference')
+        if needs_subjects and not has_subjects:
+            missing_items.append('subjects')
+    return {
+        "has_level": has_level,
+        "has_subjects": has_subjects,
+        "missing_items": missing_items,
+        "show_setup_modal": len(missing_items) > 0,
+    }
+
+
+@condition(etag_func=swap_list_etag)
+@cache_anonymous_page
+def all_swaps(request):
+    """
+    Public page listing recent active swaps from all users.
+    Excludes archived and inactive swaps. Anonymous responses are cached
+    (home.public_cache) and reloads of an unchanged listing get a 304
+    (home.conditional).
+    """
+    context, viewer = _swap_listing_context(request, 'all')
+    context["title"] = "All Swaps"
     return render(request, "home/all_swaps.html", context)
 
 
@@ -493,228 +320,20 @@ def primary_swaps(request):
     Page listing swaps from users whose PersonalProfile level is 'Primary School'.
     Includes matching score calculation for logged-in users.
     
-    Matching Logic:
+    Matching Logic (see home.listings.score_primary):
     - Perfect Match: Creator's school location = my desired location AND 
                      Creator's target = my current school location (mutual swap)
     - Excellent Match: County matches both ways, constituency may differ
     - Good Match: At least county matches one direction
     - Normal: No significant location match
     """
-    # Check if user has swap preferences and profile setup
-    has_swap_preferences = False
-    has_level = False
-    current_user_prefs = None
-    current_user_school = None
-    current_user_school_county = None
-    current_user_school_constituency = None
-    current_user_school_ward = None
-    show_setup_modal = False
-    missing_items = []
-    
-    if request.user.is_authenticated:
-        has_swap_preferences = SwapPreference.objects.filter(user=request.user).exists()
-        current_user_prefs = getattr(request.user, 'swappreference', None)
-        current_user_profile = getattr(request.user, 'profile', None)
-        
-        # Check if user has set their level
-        if current_user_profile and current_user_profile.level:
-            has_level = True
-        else:
-            missing_items.append('level')
-        
-        # Check if user has swap preferences
-        if not has_swap_preferences:
-            missing_items.append('swap_preference')
-        
-        if current_user_profile:
-            current_user_school = current_user_profile.school
-            if current_user_school and current_user_school.ward:
-                current_user_school_ward = current_user_school.ward
-                current_user_school_constituency = current_user_school.ward.constituency
-                current_user_school_county = current_user_school.ward.constituency.county
-        
-        # Show modal if any required items are missing
-        show_setup_modal = len(missing_items) > 0
-    
-    # Get filter parameters
-    selected_county = request.GET.get('county')
-    selected_constituency = request.GET.get('constituency')
-    selected_ward = request.GET.get('ward')
-    
-    # Start with base query - filter by Primary School level
-    swaps = Swaps.objects.filter(
-        archived=False,
-        status=True,
-        user__profile__level__name="Primary School"  # Filter by Primary School level
-    )
-    
-    # Exclude swaps created by the current user if they're logged in
-    if request.user.is_authenticated:
-        swaps = swaps.exclude(user=request.user)
-    
-    # Apply location filters if provided
-    if selected_county and selected_county.isdigit():
-        swaps = swaps.filter(county_id=selected_county)
-    
-    if selected_constituency and selected_constituency.isdigit():
-        swaps = swaps.filter(constituency_id=selected_constituency)
-    
-    if selected_ward and selected_ward.isdigit():
-        swaps = swaps.filter(ward_id=selected_ward)
-    
-    # Get swaps with related data including full school location chain
-    swaps = swaps.select_related(
-        "county", 
-        "constituency", 
-        "ward",
-        "user__profile__school__ward__constituency__county"
-    ).order_by("-created_at")[:50]
-    
-    # Get user subjects
-    user_ids = [swap.user_id for swap in swaps]
-    user_subjects = {}
-    for mysubject in MySubject.objects.filter(user_id__in=user_ids).prefetch_related('subject'):
-        if mysubject.user_id not in user_subjects:
-            user_subjects[mysubject.user_id] = []
-        user_subjects[mysubject.user_id].extend(list(mysubject.subject.all()))
-    
-    # Get all counties for the filter dropdown
-    counties = Counties.objects.all().order_by('name')
-    
-    # Get constituencies and wards based on selection
-    constituencies = Constituencies.objects.none()
-    wards = Wards.objects.none()
-    
-    if selected_county and selected_county.isdigit():
-        selected_county_obj = Counties.objects.filter(id=selected_county).first()
-        if selected_county_obj:
-            constituencies = Constituencies.objects.filter(county=selected_county_obj).order_by('name')
-    
-    if selected_constituency and selected_constituency.isdigit():
-        selected_constituency_obj = Constituencies.objects.filter(id=selected_constituency).first()
-        if selected_constituency_obj:
-            wards = Wards.objects.filter(constituency=selected_constituency_obj).order_by('name')
-    
-    # Prepare swaps data with matching scores
-    swaps_data = []
-    for swap in swaps:
-        user_profile = getattr(swap.user, 'profile', None)
-        school = getattr(user_profile, 'school', None)
-        
-        # Get creator's school location
-        creator_school_county = None
-        creator_school_constituency = None
-        creator_school_ward = None
-        if school and school.ward:
-            creator_school_ward = school.ward
-            creator_school_constituency = school.ward.constituency
-            creator_school_county = school.ward.constituency.county
-        
-        # Calculate match score
-        match_score = 0
-        match_label = "Normal"
-        
-        if request.user.is_authenticated and current_user_prefs and current_user_school_county:
-            # Check Direction 1: Creator's school location matches my desired location
-            # (Where the creator IS = Where I WANT to go)
-            dir1_county_match = (creator_school_county and 
-                                current_user_prefs.desired_county and 
-                                creator_school_county.id == current_user_prefs.desired_county.id)
-            dir1_constituency_match = (creator_school_constituency and 
-                                       current_user_prefs.desired_constituency and 
-                                       creator_school_constituency.id == current_user_prefs.desired_constituency.id)
-            dir1_ward_match = (creator_school_ward and 
-                              current_user_prefs.desired_ward and 
-                              creator_school_ward.id == current_user_prefs.desired_ward.id)
-            
-            # Check Direction 2: Creator's target location matches my current school location
-            # (Where the creator WANTS to go = Where I AM)
-            dir2_county_match = (swap.county and 
-                                current_user_school_county and 
-                                swap.county.id == current_user_school_county.id)
-            dir2_constituency_match = (swap.constituency and 
-                                       current_user_school_constituency and 
-                                       swap.constituency.id == current_user_school_constituency.id)
-            dir2_ward_match = (swap.ward and 
-                              current_user_school_ward and 
-                              swap.ward.id == current_user_school_ward.id)
-            
-            # Calculate score based on matching levels
-            # Perfect Match: Both directions match at county level or better
-            if dir1_county_match and dir2_county_match:
-                if dir1_ward_match and dir2_ward_match:
-                    match_score = 100
-                    match_label = "Perfect Match"
-                elif dir1_constituency_match and dir2_constituency_match:
-                    match_score = 95
-                    match_label = "Perfect Match"
-                elif dir1_county_match and dir2_county_match:
-                    match_score = 90
-                    match_label = "Perfect Match"
-            # Excellent Match: One direction fully matches, other partially
-            elif (dir1_county_match and dir2_constituency_match) or (dir1_constituency_match and dir2_county_match):
-                match_score = 80
-                match_label = "Excellent Match"
-            elif dir1_county_match or dir2_county_match:
-                # Good Match: At least one direction has county match
-                if dir1_constituency_match or dir2_constituency_match:
-                    match_score = 70
-                    match_label = "Good Match"
-                elif dir1_county_match and not dir2_county_match:
-                    match_score = 60
-                    match_label = "Good Match"
-                elif dir2_county_match and not dir1_county_match:
-                    match_score = 55
-                    match_label = "Good Match"
-                else:
-                    match_score = 50
-                    match_label = "Good Match"
-            else:
-                match_score = 0
-                match_label = "Normal"
-        
-        swaps_data.append({
-            'swap': swap,
-            'user_school': school,
-            'user_subjects': user_subjects.get(swap.user_id, []),
-            'match_score': match_score,
-            'match_label': match_label,
-            'is_perfect_match': match_label == "Perfect Match",
-            'is_excellent_match': match_label == "Excellent Match",
-            'is_good_match': match_label == "Good Match",
-            'common_subjects': []
-        })
-    
-    # Sort by match score (highest first)
-    swaps_data.sort(key=lambda x: x['match_score'], reverse=True)
-    
-    # Get bookmarked swap IDs for the current user (use list for template compatibility)
-    bookmarked_ids = []
-    if request.user.is_authenticated:
-        bookmarked_ids = list(Bookmark.objects.filter(
-            user=request.user,
-            bookmark_type='swap'
-        ).values_list('swap_id', flat=True))
-    
-    context = {
-        "swaps_data": swaps_data,
+    context, viewer = _swap_listing_context(request, 'primary')
+    context.update(_setup_state(request, viewer))
+    context.update({
         "title": "Primary School Swaps",
         "page_subtitle": "Browse swap requests from Primary School teachers",
-        "counties": counties,
-        "constituencies": list(constituencies),
-        "wards": list(wards),
-        "selected_county": selected_county,
-        "selected_constituency": selected_constituency,
-        "selected_ward": selected_ward,
-        "has_swap_preferences": has_swap_preferences,
-        "has_level": has_level,
-        "show_setup_modal": show_setup_modal,
-        "missing_items": missing_items,
-        "user": request.user if request.user.is_authenticated else None,
         "level_filter": "primary",
-        "bookmarked_ids": bookmarked_ids,
-    }
-    
+    })
     return render(request, "home/level_swaps.html", context)
 
 
@@ -723,260 +342,19 @@ def secondary_swaps(request):
     Page listing swaps from users whose PersonalProfile level is 'Secondary/High School'.
     Includes matching score calculation based on BOTH location AND subjects.
     
-    Matching Logic (requires both location AND subject match):
+    Matching Logic (see home.listings.score_secondary):
     - Perfect Match: Location matches both ways AND subjects match
     - Excellent Match: Location matches well AND some subjects match
     - Good Match: Either location or subjects match well
     - Normal: No significant match
     """
-    # Check if user has swap preferences, profile setup, and subjects
-    has_swap_preferences = False
-    has_level = False
-    has_subjects = False
-    current_user_prefs = None
-    current_user_school = None
-    current_user_school_county = None
-    current_user_school_constituency = None
-    current_user_school_ward = None
-    current_user_subjects = set()
-    show_setup_modal = False
-    missing_items = []
-    
-    if request.user.is_authenticated:
-        has_swap_preferences = SwapPreference.objects.filter(user=request.user).exists()
-        current_user_prefs = getattr(request.user, 'swappreference', None)
-        current_user_profile = getattr(request.user, 'profile', None)
-        
-        # Check if user has set their level
-        if current_user_profile and current_user_profile.level:
-            has_level = True
-        else:
-            missing_items.append('level')
-        
-        # Check if user has swap preferences
-        if not has_swap_preferences:
-            missing_items.append('swap_preference')
-        
-        if current_user_profile:
-            current_user_school = current_user_profile.school
-            if current_user_school and current_user_school.ward:
-                current_user_school_ward = current_user_school.ward
-                current_user_school_constituency = current_user_school.ward.constituency
-                current_user_school_county = current_user_school.ward.constituency.county
-        
-        # Get current user's subjects
-        current_user_subjects = set(
-            MySubject.objects.filter(user=request.user).values_list('subject__id', flat=True)
-        )
-        
-        # Check if user has subjects (required for secondary)
-        if len(current_user_subjects) > 0:
-            has_subjects = True
-        else:
-            missing_items.append('subjects')
-        
-        # Show modal if any required items are missing
-        show_setup_modal = len(missing_items) > 0
-    
-    # Get filter parameters
-    selected_county = request.GET.get('county')
-    selected_constituency = request.GET.get('constituency')
-    selected_ward = request.GET.get('ward')
-    
-    # Start with base query - filter by Secondary/High School level
-    swaps = Swaps.objects.filter(
-        archived=False,
-        status=True,
-        user__profile__level__name="Secondary/High School"  # Filter by Secondary/High School level
-    )
-    
-    # Exclude swaps created by the current user if they're logged in
-    if request.user.is_authenticated:
-        swaps = swaps.exclude(user=request.user)
-    
-    # Apply location filters if provided
-    if selected_county and selected_county.isdigit():
-        swaps = swaps.filter(county_id=selected_county)
-    
-    if selected_constituency and selected_constituency.isdigit():
-        swaps = swaps.filter(constituency_id=selected_constituency)
-    
-    if selected_ward and selected_ward.isdigit():
-        swaps = swaps.filter(ward_id=selected_ward)
-    
-    # Get swaps with related data including full school location chain
-    swaps = swaps.select_related(
-        "county", 
-        "constituency", 
-        "ward",
-        "user__profile__school__ward__constituency__county"
-    ).order_by("-created_at")[:50]
-    
-    # Get user subjects for all swap creators
-    user_ids = [swap.user_id for swap in swaps]
-    user_subjects = {}
-    user_subject_ids = {}  # For matching calculation
-    for mysubject in MySubject.objects.filter(user_id__in=user_ids).prefetch_related('subject'):
-        if mysubject.user_id not in user_subjects:
-            user_subjects[mysubject.user_id] = []
-            user_subject_ids[mysubject.user_id] = set()
-        subjects_list = list(mysubject.subject.all())
-        user_subjects[mysubject.user_id].extend(subjects_list)
-        user_subject_ids[mysubject.user_id].update(s.id for s in subjects_list)
-    
-    # Get all counties for the filter dropdown
-    counties = Counties.objects.all().order_by('name')
-    
-    # Get constituencies and wards based on selection
-    constituencies = Constituencies.objects.none()
-    wards = Wards.objects.none()
-    
-    if selected_county and selected_county.isdigit():
-        selected_county_obj = Counties.objects.filter(id=selected_county).first()
-        if selected_county_obj:
-            constituencies = Constituencies.objects.filter(county=selected_county_obj).order_by('name')
-    
-    if selected_constituency and selected_constituency.isdigit():
-        selected_constituency_obj = Constituencies.objects.filter(id=selected_constituency).first()
-        if selected_constituency_obj:
-            wards = Wards.objects.filter(constituency=selected_constituency_obj).order_by('name')
-    
-    # Prepare swaps data with matching scores
-    swaps_data = []
-    for swap in swaps:
-        user_profile = getattr(swap.user, 'profile', None)
-        school = getattr(user_profile, 'school', None)
-        
-        # Get creator's school location
-        creator_school_county = None
-        creator_school_constituency = None
-        creator_school_ward = None
-        if school and school.ward:
-            creator_school_ward = school.ward
-            creator_school_constituency = school.ward.constituency
-            creator_school_county = school.ward.constituency.county
-        
-        # Get creator's subjects
-        creator_subject_ids = user_subject_ids.get(swap.user_id, set())
-        
-        # Calculate match score
-        match_score = 0
-        match_label = "Normal"
-        location_score = 0
-        subject_score = 0
-        common_subjects = []
-        
-        if request.user.is_authenticated:
-            # === SUBJECT MATCHING ===
-            if current_user_subjects and creator_subject_ids:
-                common_subject_ids = current_user_subjects.intersection(creator_subject_ids)
-                if common_subject_ids:
-                    # Get common subject names for display
-                    common_subjects = [s.name for s in user_subjects.get(swap.user_id, []) 
-                                       if s.id in common_subject_ids][:3]
-                    
-                    # Calculate subject match percentage
-                    total_subjects = len(current_user_subjects.union(creator_subject_ids))
-                    match_percentage = len(common_subject_ids) / total_subjects if total_subjects > 0 else 0
-                    
-                    if match_percentage >= 0.5:  # 50%+ subjects match
-                        subject_score = 50
-                    elif match_percentage >= 0.25:  # 25%+ subjects match
-                        subject_score = 35
-                    elif len(common_subject_ids) >= 1:  # At least 1 subject matches
-                        subject_score = 20
-            
-            # === LOCATION MATCHING ===
-            if current_user_prefs and current_user_school_county:
-                # Direction 1: Creator's school location matches my desired location
-                dir1_county_match = (creator_school_county and 
-                                    current_user_prefs.desired_county and 
-                                    creator_school_county.id == current_user_prefs.desired_county.id)
-                dir1_constituency_match = (creator_school_constituency and 
-                                           current_user_prefs.desired_constituency and 
-                                           creator_school_constituency.id == current_user_prefs.desired_constituency.id)
-                
-                # Direction 2: Creator's target matches my current school location
-                dir2_county_match = (swap.county and 
-                                    current_user_school_county and 
-                                    swap.county.id == current_user_school_county.id)
-                dir2_constituency_match = (swap.constituency and 
-                                           current_user_school_constituency and 
-                                           swap.constituency.id == current_user_school_constituency.id)
-                
-                # Calculate location score
-                if dir1_county_match and dir2_county_match:
-                    if dir1_constituency_match and dir2_constituency_match:
-                        location_score = 50  # Full mutual match
-                    else:
-                        location_score = 45  # County mutual match
-                elif dir1_county_match or dir2_county_match:
-                    if dir1_constituency_match or dir2_constituency_match:
-                        location_score = 35
-                    else:
-                        location_score = 25
-            
-            # === COMBINED SCORE (Location + Subjects both required for secondary) ===
-            match_score = location_score + subject_score
-            
-            # Determine match label based on combined score
-            # Perfect Match: Both location AND subjects match well
-            if location_score >= 45 and subject_score >= 35:
-                match_label = "Perfect Match"
-            elif location_score >= 35 and subject_score >= 20:
-                match_label = "Excellent Match"
-            elif (location_score >= 25 and subject_score >= 20) or (location_score >= 35 and subject_score > 0):
-                match_label = "Good Match"
-            elif subject_score > 0 or location_score > 0:
-                match_label = "Normal"
-            else:
-                match_label = "Normal"
-                match_score = 0
-        
-        swaps_data.append({
-            'swap': swap,
-            'user_school': school,
-            'user_subjects': user_subjects.get(swap.user_id, []),
-            'match_score': match_score,
-            'match_label': match_label,
-            'is_perfect_match': match_label == "Perfect Match",
-            'is_excellent_match': match_label == "Excellent Match",
-            'is_good_match': match_label == "Good Match",
-            'common_subjects': common_subjects,
-            'has_subject_match': len(common_subjects) > 0,
-        })
-    
-    # Sort by match score (highest first)
-    swaps_data.sort(key=lambda x: x['match_score'], reverse=True)
-    
-    # Get bookmarked swap IDs for the current user (use list for template compatibility)
-    bookmarked_ids = []
-    if request.user.is_authenticated:
-        bookmarked_ids = list(Bookmark.objects.filter(
-            user=request.user,
-            bookmark_type='swap'
-        ).values_list('swap_id', flat=True))
-    
-    context = {
-        "swaps_data": swaps_data,
+    context, viewer = _swap_listing_context(request, 'secondary')
+    context.update(_setup_state(request, viewer, needs_subjects=True))
+    context.update({
         "title": "Secondary/High School Swaps",
         "page_subtitle": "Browse swap requests from Secondary/High School teachers",
-        "counties": counties,
-        "constituencies": list(constituencies),
-        "wards": list(wards),
-        "selected_county": selected_county,
-        "selected_constituency": selected_constituency,
-        "selected_ward": selected_ward,
-        "has_swap_preferences": has_swap_preferences,
-        "has_level": has_level,
-        "has_subjects": has_subjects,
-        "show_setup_modal": show_setup_modal,
-        "missing_items": missing_items,
-        "user": request.user if request.user.is_authenticated else None,
         "level_filter": "secondary",
-        "bookmarked_ids": bookmarked_ids,
-    }
-    
+    })
     return render(request, "home/level_swaps.html", context)
 
 
@@ -1083,23 +461,28 @@ def fast_swap_detail(request, fastswap_id):
             bookmark_type='fastswap'
         ).exists()
 
-    # Find matches and triangles
-    from .fast_swap_utils import find_mutual_matches_for_fast_swap, find_triangle_matches_for_fast_swap
-    matches = find_mutual_matches_for_fast_swap(fast_swap)
-    triangles = find_triangle_matches_for_fast_swap(fast_swap)
+    # Stored matches and triangles; staff can force a recompute
+    from .fast_swap_store import get_fast_swap_matches
+    if request.method == 'POST' and is_admin and 'recompute_matches' in request.POST:
+        get_fast_swap_matches(fast_swap, recompute=True)
+        messages.success(request, "Matches recomputed.")
+        return redirect('home:fast_swap_detail', fastswap_id=fast_swap.id)
+    matches = get_fast_swap_matches(fast_swap)
     
     context = {
         'fast_swap': fast_swap,
         'display_name': display_name,
         'display_phone': display_phone,
         'show_contact': show_contact,
+        'is_admin': is_admin,
         'acceptable_counties': acceptable_counties,
         'subjects': subjects,
         'is_bookmarked': is_bookmarked,
         'has_active_subscription': has_active_subscription,
         'mutual_matches_fs': matches['fast_swaps'],
         'mutual_matches_users': matches['users'],
-        'triangle_swaps': triangles,
+        'triangle_swaps': matches['triangles'],
+        'matches_computed_at': matches['computed_at'],
     }
     
     return render(request, 'home/fast_swap_detail.html', context)
@@ -1287,7 +670,7 @@ def edit_school(request, school_id):
         form = SchoolForm(instance=school)
     
     # Get all counties for the template
-    counties = Counties.objects.all().order_by('name')
+    counties = geo_cache.counties()
     
     # Set the selected values for the form
     selected_county = school.ward.constituency.county_id if school.ward else None
@@ -1295,13 +678,8 @@ def edit_school(request, school_id):
     selected_ward = school.ward_id if school.ward else None
     
     # Get constituencies and wards based on selected values
-    constituencies = Constituencies.objects.none()
-    wards = Wards.objects.none()
-    
-    if selected_county:
-        constituencies = Constituencies.objects.filter(county_id=selected_county).order_by('name')
-        if selected_constituency:
-            wards = Wards.objects.filter(constituency_id=selected_constituency).order_by('name')
+    constituencies = geo_cache.constituencies(selected_county)
+    wards = geo_cache.wards(selected_constituency) if constituencies else []
     
     return render(request, 'home/school_form.html', {
         'form': form,
@@ -1344,13 +722,7 @@ def get_constituencies(request):
     if not county_id:
         return JsonResponse({'error': 'County ID is required'}, status=400)
     
-    try:
-        constituencies = list(Constituencies.objects.filter(
-            county_id=county_id
-        ).order_by('name').values('id', 'name'))
-        return JsonResponse({'constituencies': constituencies})
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'constituencies': geo_cache.constituencies(county_id)})
 
 
 def get_wards(request):
@@ -1359,13 +731,7 @@ def get_wards(request):
     if not constituency_id:
         return JsonResponse({'error': 'Constituency ID is required'}, status=400)
     
-    try:
-        wards = list(Wards.objects.filter(
-            constituency_id=constituency_id
-        ).order_by('name').values('id', 'name'))
-        return JsonResponse({'wards': wards})
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'wards': geo_cache.wards(constituency_id)})
 
 
 @login_required
@@ -1400,16 +766,60 @@ def add_fast_swap(request):
     })
 
 
+
+def import_fast_swaps(request):
+    """
+    Bulk-import FastSwap entries from a CSV/XLSX upload.
+    Only superusers can import, as with add_fast_swap.
+    """
+    if not request.user.is_superuser:
+        messages.error(request, "You don't have permission to add FastSwap entries.")
+        return redirect('home:home')
+
+    from .fast_swap_import import import_fast_swaps as run_import, iter_rows
+
+    result = None
+    if request.method == 'POST':
+        form = FastSwapImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = run_import(iter_rows(upload.file, upload.name), dry_run=form.cleaned_data['dry_run'])
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                if form.cleaned_data['dry_run']:
+                    messages.success(request, f"{result['valid']} of {result['rows']} rows are ready to import.")
+                else:
+                    messages.success(request, f"Imported {result['created']} of {result['rows']} rows.")
+        else:
+            messages.error(request, 'Please correct the errors below.')
+    else:
+        form = FastSwapImportForm()
+
+    return render(request, 'home/fast_swap_import.html', {
+        'form': form,
+        'result': result,
+        'title': 'Import FastSwap Entries'
+    })
+
+@condition(etag_func=fast_swap_list_etag)
+@cache_anonymous_page
 def fast_swap_list(request):
     """
-    View to list all FastSwap entries.
-    Accessible to all users (authenticated and unauthenticated).
+    View to list all FastSwap entries, newest first, one keyset page at
+    a time (see home.pagination).
+    Accessible to all users (authenticated and unauthenticated);
+    anonymous responses are cached (home.public_cache) and reloads of an
+    unchanged list get a 304 (home.conditional).
     Supports filtering by level, county, constituency, and ward.
     """
-    fast_swaps = FastSwap.objects.all().select_related(
-        'current_county', 'current_constituency', 'current_ward', 
-        'most_preferred', 'level'
-    ).order_by('-created_at')
+    from .pagination import keyset_page
+
+    fast_swaps = FastSwap.objects.select_related(
+        'current_county', 'current_constituency', 'current_ward',
+        'most_preferred', 'level', 'school'
+    )
     
     # Get filter parameters
     level_filter = request.GET.get('level')
@@ -1417,12 +827,12 @@ def fast_swap_list(request):
     constituency_id = request.GET.get('constituency')
     ward_id = request.GET.get('ward')
     
-    # Apply level filter
-    if level_filter:
-        if level_filter == 'primary':
-            fast_swaps = fast_swaps.filter(level__name__icontains='Primary')
-        elif level_filter == 'secondary':
-            fast_swaps = fast_swaps.filter(level__name__icontains='Secondary')
+    # Apply level filter on the indexed level id
+    levels = geo_cache.levels()
+    selected_level_ids = None
+    if level_filter in ('primary', 'secondary'):
+        selected_level_ids = facets.level_ids(level_filter)
+        fast_swaps = fast_swaps.filter(level_id__in=selected_level_ids)
     
     # Apply location filters
     if county_id:
@@ -1431,21 +841,29 @@ def fast_swap_list(request):
         fast_swaps = fast_swaps.filter(current_constituency_id=constituency_id)
     if ward_id:
         fast_swaps = fast_swaps.filter(current_ward_id=ward_id)
+
+    # Total per filter combination, cached briefly: COUNT(*) is the one
+    # query here that still scans every matching row. Keyed on the public
+    # cache version, which every FastSwap write and import bumps.
+    count_key = f'fastswap_list_count:{public_cache_version()}:' + ':'.join(
+        str(value or '') for value in (level_filter, county_id, constituency_id, ward_id)
+    )
+    total_count = cache.get(count_key)
+    if total_count is None:
+        total_count = fast_swaps.count()
+        cache.set(count_key, total_count, FAST_SWAP_COUNT_CACHE_SECONDS)
+
+    page = keyset_page(
+        fast_swaps.prefetch_related('acceptable_county', 'subjects'),
+        cursor=request.GET.get('cursor'),
+    )
     
-    # Get all counties for the filter dropdown
-    counties = Counties.objects.all().order_by('name')
-    
-    # Get all levels for the filter dropdown
-    levels = Level.objects.all().order_by('name')
-    
-    # Get constituencies and wards if filters are applied
-    constituencies = Constituencies.objects.none()
-    wards = Wards.objects.none()
-    
-    if county_id:
-        constituencies = Constituencies.objects.filter(county_id=county_id).order_by('name')
-    if constituency_id:
-        wards = Wards.objects.filter(constituency_id=constituency_id).order_by('name')
+    # Filter dropdowns, from the geography cache, with how many entries
+    # of the selected level each option has
+    facet_counts = facets.option_counts('fast_swaps', selected_level_ids)
+    counties = facets.with_counts(geo_cache.counties(), facet_counts['county'])
+    constituencies = facets.with_counts(geo_cache.constituencies(county_id), facet_counts['constituency'])
+    wards = facets.with_counts(geo_cache.wards(constituency_id), facet_counts['ward'])
     
     # Get bookmarked FastSwap IDs for the current user (use list for template compatibility)
     bookmarked_ids = []
@@ -1455,8 +873,16 @@ def fast_swap_list(request):
             bookmark_type='fastswap'
         ).values_list('fast_swap_id', flat=True))
     
+    # Filters to keep in the page links
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+    
     return render(request, 'home/fast_swap_list.html', {
-        'fast_swaps': fast_swaps,
+        'fast_swaps': page['items'],
+        'total_count': total_count,
+        'next_cursor': page['next_cursor'],
+        'previous_cursor': page['previous_cursor'],
+        'filter_query': filter_query.urlencode(),
         'title': 'FastSwap Entries',
         'counties': counties,
         'constituencies': constituencies,
@@ -1466,7 +892,9 @@ def fast_swap_list(request):
         'selected_county': county_id,
         'selected_constituency': constituency_id,
         'selected_ward': ward_id,
+        'facet_counts': facet_counts,
         'bookmarked_ids': bookmarked_ids,
+        **public_cache_context(),
     })
 
 
@@ -1494,7 +922,7 @@ def swap_preferences(request):
         form = SwapPreferenceForm(instance=preference)
         
     # Get all counties for the template
-    counties = Counties.objects.all().order_by('name')
+    counties = geo_cache.counties()
     
     # Get selected values for form repopulation
     selected_county = preference.desired_county.id if preference.desired_county else None
@@ -1503,13 +931,8 @@ def swap_preferences(request):
     selected_counties = list(preference.open_to_all.values_list('id', flat=True)) if preference.pk else []
     
     # Get constituencies and wards based on selected values
-    constituencies = Constituencies.objects.none()
-    if preference.desired_county:
-        constituencies = preference.desired_county.constituencies_set.order_by('name')
-    
-    wards = Wards.objects.none()
-    if preference.desired_constituency:
-        wards = preference.desired_constituency.wards_set.order_by('name')
+    constituencies = geo_cache.constituencies(preference.desired_county_id)
+    wards = geo_cache.wards(preference.desired_constituency_id)
     
     return render(request, 'home/swap_preferences.html', {
         'form': form,
@@ -18,15 +18,9 @@ class SchoolSearchView(View):
             if not query or len(query) < 2:
                 return JsonResponse({'schools': [], 'status': 'success'})
                 
-            # Search by school name only
-            schools = Schools.objects.select_related('ward__constituency__county').filter(name__icontains=query).order_by('name')[:10] 
-                                 
-                                  # Limit to 10 results, ordered by name
-            
-            # Debug: Log the raw query and results
-            logger.info(f"Raw SQL: {str(schools.query)}")
-            logger.info(f"Found {schools.count()} schools matching: {query}")
-            
+            # Search by school name only; limit to 10 results, ordered by name
+            schools = Schools.objects.select_related('ward__constituency__county').filter(name__icontains=query).order_by('name')[:10]
+
             results = []
             for school in schools:
                 try:
@@ -0,0 +1,50 @@
+/*
+ * Counties, constituencies, wards, levels and subjects for the cascading
+ * dropdowns, resolved in the browser from one bundle instead of a request
+ * per change. The bundle URL comes from {% geography_script %} (see
+ * home.geo_bundle); it is fingerprinted, so browsers keep it until the
+ * data changes.
+ *
+ *   TSCGeography.constituencies(countyId).then(items => ...)
+ *   TSCGeography.wards(constituencyId), .subjects(levelId), .counties(), .levels()
+ *
+ * Every lookup returns a promise of [{id, name}] ([] for an unknown id).
+ */
+(function () {
+    const script = document.currentScript;
+    let loading = null;
+
+    function entries(rows) {
+        return (rows || []).map(([id, name]) => ({ id, name }));
+    }
+
+    function load() {
+        if (!loading) {
+            loading = fetch(script.dataset.bundle, { credentials: 'same-origin' })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`Geography bundle: HTTP ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .catch(error => {
+                    // Let the next lookup try again
+                    loading = null;
+                    throw error;
+                });
+        }
+        return loading;
+    }
+
+    window.TSCGeography = {
+        load,
+        counties: () => load().then(bundle => entries(bundle.counties)),
+        constituencies: countyId => load().then(bundle => entries(bundle.constituencies[countyId])),
+        wards: constituencyId => load().then(bundle => entries(bundle.wards[constituencyId])),
+        levels: () => load().then(bundle => bundle.levels.map(([id, name, code]) => ({ id, name, code }))),
+        subjects: levelId => load().then(bundle => entries(bundle.subjects[levelId])),
+    };
+
+    // Fetch it while the user is still reading the form
+    document.addEventListener('DOMContentLoaded', () => load().catch(() => {}));
+})();
@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.contrib.admin import SimpleListFilter
-from django.db.models import Q, Count
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
 from django.urls import reverse
-from home.models import Schools, SwapPreference, Counties, Constituencies, Wards, Level, Subject, MySubject
+from home.models import Schools, SwapPreference, Counties, Constituencies, Wards, Level, Subject, MatchEdge
 from .models import MyUser, PersonalProfile
 
 
@@ -28,126 +29,28 @@ class PotentialSwapMatchFilter(SimpleListFilter):
             
         try:
             selected_user = MyUser.objects.get(id=self.value())
-        except MyUser.DoesNotExist:
-            return queryset.none()
-            
-        # Get selected user's school location
-        try:
-            user_school = selected_user.profile.school
-            user_county = user_school.ward.constituency.county
-            user_constituency = user_school.ward.constituency
-            user_ward = user_school.ward
-        except AttributeError:
-            # User doesn't have complete school/location data
-            return queryset.none()
-            
-        # Get selected user's swap preferences
-        try:
-            user_prefs = SwapPreference.objects.get(user=selected_user)
-            
-            # Create Q objects for location matching
-            location_q = Q()
-            
-            # Check if user is open to all counties
-            if user_prefs.open_to_all.exists():
-                # User is open to all counties in their open_to_all list
-                location_q |= Q(profile__school__ward__constituency__county__in=user_prefs.open_to_all.all())
-            
-            # Check specific location preferences
-            if user_prefs.desired_county:
-                location_q |= Q(profile__school__ward__constituency__county=user_prefs.desired_county)
-                
-                if user_prefs.desired_constituency:
-                    location_q |= Q(profile__school__ward__constituency=user_prefs.desired_constituency)
-                    
-                    if user_prefs.desired_ward:
-                        location_q |= Q(profile__school__ward=user_prefs.desired_ward)
-            
-            # Start with base query for location matches
-            matches = queryset.filter(
-                # User's current location matches selected user's preferences
-                location_q,
-                # And their preferences match selected user's current location
-                Q(swappreference__open_to_all=user_county) |
-                Q(swappreference__desired_county=user_county) |
-                Q(swappreference__desired_constituency=user_constituency) |
-                Q(swappreference__desired_ward=user_ward),
-                # Exclude the selected user
-                ~Q(id=selected_user.id),
-                # Only include users with a profile and school
-                profile__isnull=False,
-                profile__school__isnull=False
-            )
-            
-            # For secondary/high school, filter by matching subjects
-            if hasattr(user_school, 'level') and ('secondary' in user_school.level.name.lower() or 'high' in user_school.level.name.lower()):
-                # Get selected user's subjects
-                user_subjects = set(MySubject.objects.filter(
-                    user=selected_user
-                ).values_list('subject__id', flat=True))
-                
-                if user_subjects:
-                    # Filter matches to only include users who teach at least one of the same subjects
-                    matches = matches.filter(
-                        id__in=MySubject.objects.filter(
-                            subject__id__in=user_subjects
-                        ).values('user')
-                    )
-            
-            return matches.distinct()
-            
-        except SwapPreference.DoesNotExist:
+        except (MyUser.DoesNotExist, ValueError):
             return queryset.none()
+        
+        # Same matches the dashboard shows, read from the match store
+        return queryset.filter(
+            incoming_match_edges__user_a=selected_user,
+            incoming_match_edges__kind='mutual'
+        ).distinct()
 
 def get_potential_matches_count(self, obj):
     """
-    Calculate and return the number of potential swap matches for a user
+    Return the number of stored swap matches for a user
     """
     try:
         # Check if user has a profile and school
         if not hasattr(obj, 'profile') or not obj.profile.school:
             return "No school assigned"
-            
-        # Get user's school and location
-        user_school = obj.profile.school
-        user_county = user_school.ward.constituency.county
-        
-        # Get user's level
-        if not hasattr(user_school, 'level'):
-            return "No level set"
-            
-        is_secondary = 'secondary' in user_school.level.name.lower() or 'high' in user_school.level.name.lower()
         
-        # Base query for potential matches
-        potential_matches = MyUser.objects.filter(
-            ~Q(id=obj.id),  # Don't match with self
-            profile__isnull=False,
-            profile__school__isnull=False,
-            swappreference__isnull=False
-        )
-        
-        # Filter by swap preferences (county match or open to all)
-        potential_matches = potential_matches.filter(
-            Q(swappreference__desired_county=user_county) |
-            Q(swappreference__open_to_all=user_county)
-        )
+        count = getattr(obj, 'potential_matches_count', None)
+        if count is None:
+            count = obj.match_edges.filter(kind='mutual').count()
         
-        # For secondary/high school, check subject matches
-        if is_secondary:
-            # Get user's subjects
-            user_subjects = set(MySubject.objects.filter(
-                user=obj
-            ).values_list('subject__id', flat=True))
-            
-            if user_subjects:
-                # Only include users who teach at least one of the same subjects
-                potential_matches = potential_matches.filter(
-                    id__in=MySubject.objects.filter(
-                        subject__in=user_subjects
-                    ).values('user')
-                ).distinct()
-        
-        count = potential_matches.count()
         if count > 0:
             url = (
                 reverse('admin:users_myuser_changelist') + 
@@ -263,7 +166,7 @@ class MyUserAdmin(admin.ModelAdmin):
     get_school_location.short_description = 'School Location'
     
     def get_potential_matches_count(self, obj):
-        # This is a simplified version - you might want to implement the full logic here
+        # Annotated in get_queryset from the match store
         try:
             return obj.potential_matches_count
         except AttributeError:
@@ -277,6 +180,12 @@ class MyUserAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
+        match_counts = MatchEdge.objects.filter(
+            user_a=OuterRef('pk'), kind='mutual'
+        ).order_by().values('user_a').annotate(total=Count('id')).values('total')
+        qs = qs.annotate(
+            potential_matches_count=Coalesce(Subquery(match_counts), 0)
+        )
         return qs.prefetch_related(
             'profile__school__level',
             'swappreference__open_to_all',
@@ -293,8 +202,9 @@ class MyUserAdmin(admin.ModelAdmin):
 
 @admin.register(PersonalProfile)
 class PersonalProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'first_name', 'last_name', 'phone', 'location', 'gender', 'created_at')
-    list_filter = ('gender', 'created_at')
+    list_display = ('user', 'first_name', 'last_name', 'phone', 'location', 'current_county', 'gender', 'created_at')
+    list_filter = ('gender', 'current_county', 'created_at')
+    list_select_related = ('user', 'current_county')
     search_fields = ('user__email', 'first_name', 'last_name', 'phone', 'location')
     ordering = ('-created_at',)
 
@@ -1,7 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordChangeForm, UserChangeForm
 from django.forms import ModelMultipleChoiceField, CheckboxSelectMultiple
-from home.models import Level, Subject, MySubject
+from home import geo_cache
+from home.models import Subject, MySubject
 from .models import MyUser, PersonalProfile
 
 class MyUserCreationForm(UserCreationForm):
@@ -223,8 +224,7 @@ class SubjectSelectionForm(forms.Form):
             user_level = self.user.profile.level
         
         # Get all levels for the dropdown
-        levels = Level.objects.all().order_by('name')
-        level_choices = [('', '---------')] + [(level.id, level.name) for level in levels]
+        level_choices = [('', '---------')] + [(level['id'], level['name']) for level in geo_cache.levels()]
         
         # Add level field with dark mode styling
         self.fields['level'] = forms.ChoiceField(
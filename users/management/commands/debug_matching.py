@@ -14,6 +14,7 @@ class Command(BaseCommand):
             role='Teacher'
         ).select_related(
             'profile__school__ward__constituency__county',
+            'profile__current_county',
             'profile__school__level'
         ).prefetch_related(
             'mysubject_set__subject'
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from users.models import MyUser
 from home.matching import find_matches
+from home.match_store import get_stored_matches
 
 
 class Command(BaseCommand):
@@ -37,6 +38,8 @@ class Command(BaseCommand):
             print(f"   ✅ Matches found: {kevin_matches.count()}")
             for match in kevin_matches:
                 print(f"      → {match.email}")
+            kevin_stored = get_stored_matches(kevin)
+            print(f"   📦 Stored matches: {kevin_stored.count()}")
         except Exception as e:
             print(f"   ❌ Error: {e}")
             import traceback
@@ -53,6 +56,8 @@ class Command(BaseCommand):
             print(f"   ✅ Matches found: {harun_matches.count()}")
             for match in harun_matches:
                 print(f"      → {match.email}")
+            harun_stored = get_stored_matches(harun)
+            print(f"   📦 Stored matches: {harun_stored.count()}")
         except Exception as e:
             print(f"   ❌ Error: {e}")
             import traceback
@@ -69,6 +74,8 @@ class Command(BaseCommand):
             print(f"   ✅ Matches found: {mercy_matches.count()}")
             for match in mercy_matches:
                 print(f"      → {match.email}")
+            mercy_stored = get_stored_matches(mercy)
+            print(f"   📦 Stored matches: {mercy_stored.count()}")
         except Exception as e:
             print(f"   ❌ Error: {e}")
             import traceback
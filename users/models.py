@@ -1,7 +1,7 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 from django.utils.translation import gettext_lazy as _
-from home.models import Level, Schools
+from home.models import Constituencies, Counties, Level, Schools
 
 class MyUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -94,6 +94,20 @@ class PersonalProfile(models.Model):
         help_text='Upload a profile picture (JPG, PNG, or GIF, max 2MB)'
     )
     location = models.CharField(max_length=255, blank=True, null=True)
+    # Derived from the user's MySubject rows, see home.subject_sets
+    subject_fingerprint = models.CharField(max_length=40, blank=True, default='', db_index=True)
+    subject_bits = models.BigIntegerField(default=0)
+    # Copied from school.ward.constituency so matchers avoid the four-join
+    # chain. Kept in sync by save() and by home.signals when schools, wards
+    # or constituencies move.
+    current_county = models.ForeignKey(
+        Counties, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='current_profiles', editable=False,
+    )
+    current_constituency = models.ForeignKey(
+        Constituencies, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='current_profiles', editable=False,
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -105,8 +119,22 @@ class PersonalProfile(models.Model):
                 old_instance.profile_picture.delete(save=False)
         except PersonalProfile.DoesNotExist:
             pass
+
+        self.sync_current_location()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'school' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'current_county', 'current_constituency'}
             
         super().save(*args, **kwargs)
+
+    def sync_current_location(self):
+        """Copy the school's constituency and county onto the profile."""
+        location = None
+        if self.school_id:
+            location = Schools.objects.filter(pk=self.school_id).values_list(
+                'ward__constituency_id', 'ward__constituency__county_id'
+            ).first()
+        self.current_constituency_id, self.current_county_id = location or (None, None)
         
     def delete(self, *args, **kwargs):
         # Delete the profile picture file when the profile is deleted
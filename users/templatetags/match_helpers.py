@@ -23,7 +23,7 @@ def get_primary_teacher_matches(user):
         return [], []
     
     # Get user's current location and preferences
-    user_county = user.profile.school.ward.constituency.county if hasattr(user.profile.school, 'ward') else None
+    user_county = user.profile.current_county
     user_pref = user.swappreference
     
     # Base query for potential primary level matches
@@ -36,6 +36,7 @@ def get_primary_teacher_matches(user):
         swappreference__isnull=False
     ).select_related(
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference__desired_county',
         'profile__school__level'
     ).prefetch_related(
@@ -47,7 +48,7 @@ def get_primary_teacher_matches(user):
     
     for match in matches:
         try:
-            match_county = match.profile.school.ward.constituency.county if hasattr(match.profile.school, 'ward') else None
+            match_county = match.profile.current_county
             match_pref = match.swappreference
             
             # Check condition 1: User's current location in match's preferences
@@ -82,6 +83,7 @@ def get_secondary_teacher_matches(user):
     Returns a tuple of (perfect_matches, partial_matches)
     """
     from users.models import MyUser
+    from home.subject_sets import filter_shared_subjects, subject_bitmask
     import logging
     logger = logging.getLogger(__name__)
     
@@ -112,10 +114,8 @@ def get_secondary_teacher_matches(user):
         return [], []
     
     # Get user's current location, preferences, and subjects
-    user_county = None
-    if hasattr(user.profile.school, 'ward') and user.profile.school.ward:
-        user_county = user.profile.school.ward.constituency.county if user.profile.school.ward.constituency else None
-        logger.debug(f"User county: {user_county}" if user_county else "User county not found")
+    user_county = user.profile.current_county
+    logger.debug(f"User county: {user_county}" if user_county else "User county not found")
     
     user_pref = user.swappreference
     user_subjects = set(user.mysubject_set.values_list('subject__id', flat=True))
@@ -133,12 +133,15 @@ def get_secondary_teacher_matches(user):
         mysubject__isnull=False
     ).select_related(
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference__desired_county',
         'profile__school__level'
     ).prefetch_related(
         'swappreference__open_to_all',
         'mysubject_set__subject'
     ).distinct()
+    # Shared-subject check runs in SQL against the stored subject bitsets
+    matches = filter_shared_subjects(matches, subject_bitmask(user_subjects))
     
     perfect_matches = []
     partial_matches = []
@@ -150,10 +153,7 @@ def get_secondary_teacher_matches(user):
             logger.debug(f"\nEvaluating match: {match.email}")
             
             # Get match's county
-            match_county = None
-            if hasattr(match.profile.school, 'ward') and match.profile.school.ward:
-                if hasattr(match.profile.school.ward, 'constituency') and match.profile.school.ward.constituency:
-                    match_county = match.profile.school.ward.constituency.county
+            match_county = match.profile.current_county
             
             logger.debug(f"Match county: {match_county}" if match_county else "No county found for match")
             
@@ -161,7 +161,11 @@ def get_secondary_teacher_matches(user):
             logger.debug(f"Match preferences - desired_county: {getattr(match_pref, 'desired_county', None)}, open_to_all: {match_pref.open_to_all.exists() if hasattr(match_pref, 'open_to_all') else 'N/A'}")
             
             # Get match's subjects
-            match_subjects = set(match.mysubject_set.values_list('subject__id', flat=True))
+            match_subjects = {
+                subject.id
+                for my_subject in match.mysubject_set.all()
+                for subject in my_subject.subject.all()
+            }
             logger.debug(f"Match subjects: {match_subjects}")
             
             # Check condition 1: Shared subjects
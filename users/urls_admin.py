@@ -1,9 +1,10 @@
 from django.urls import path
-from .views_admin import user_management, user_potential_matches
+from .views_admin import swap_clearing, user_management, user_potential_matches
 
 app_name = 'users_admin'
 
 urlpatterns = [
     path('users/', user_management, name='user_management'),
     path('users/<int:user_id>/potential-matches/', user_potential_matches, name='user_potential_matches'),
+    path('clearing/', swap_clearing, name='swap_clearing'),
 ]
@@ -22,6 +22,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods, require_GET
 from django.http import HttpResponseForbidden
 
+from home import geo_cache
 from home.models import (
     Level, Subject, MySubject, Schools, SwapPreference, 
     Counties, Constituencies, Wards, Swaps, SwapRequests
@@ -599,12 +600,13 @@ def dashboard(request):
         # User has a complete profile with school, find actual matches
         is_secondary = hasattr(user.profile.school, 'level') and ('secondary' in user.profile.school.level.name.lower() or 'high' in user.profile.school.level.name.lower())
         
-        # Base queryset for potential matches
-        from home.matching import find_matches
-        matches = find_matches(user)
+        # Stored matches are kept up to date by home.signals
+        from home.match_store import get_stored_matches
+        from home.matching import annotate_match_score
+        matches = annotate_match_score(get_stored_matches(user), user).order_by('-match_score', 'id')
         
-        # Limit to 5 matches for the dashboard
-        matches = matches.distinct()[:5]
+        # Best 5 matches for the dashboard, scored and limited in SQL
+        matches = matches[:5]
         
         # Assign directly - template expects User objects for match_card.html
         potential_matches = matches
@@ -617,83 +619,54 @@ def dashboard(request):
     # Get triangle swaps for this user
     triangle_swaps = []
     user_triangle_swaps = []
+    triangles_computed_at = None
     
     if profile_complete and has_profile and user.profile.school:
-        from home.triangle_swap_utils import (
-            find_triangle_swaps_primary, 
-            find_triangle_swaps_secondary,
-            get_current_county,
-            get_user_subjects
-        )
-        
-        # Determine if user is primary or secondary
-        user_school_level = user.profile.school.level
-        is_secondary = user_school_level and ('secondary' in user_school_level.name.lower() or 'high' in user_school_level.name.lower())
+        # Stored triangles are kept up to date by home.signals
+        from home.triangle_store import get_stored_triangles, get_triangles_computed_at
         
-        # Get all teachers at the same level
-        teachers = MyUser.objects.filter(
-            is_active=True,
-            role='Teacher',
-            profile__isnull=False,
-            profile__school__isnull=False,
-            profile__school__level=user_school_level,
-            swappreference__isnull=False
-        ).select_related(
-            'profile__school__ward__constituency__county',
-            'swappreference__desired_county',
-            'profile__school__level'
-        ).prefetch_related(
-            'swappreference__open_to_all',
-            'mysubject_set__subject'
-        ).distinct()
+        def teacher_name(teacher):
+            profile = teacher.profile
+            if profile.first_name:
+                return profile.first_name + ' ' + (profile.surname or profile.last_name or '')
+            return teacher.email
         
-        # Find triangle swaps
-        if is_secondary:
-            all_triangles = find_triangle_swaps_secondary(teachers)
-        else:
-            all_triangles = find_triangle_swaps_primary(teachers)
+        for triangle in get_stored_triangles(user):
+            # Rotated so that the current user is teacher_a
+            (teacher_a, county_a), (teacher_b, county_b), (teacher_c, county_c) = triangle.rotated_for(user)
+            
+            triangle_data = {
+                'teacher_a': {
+                    'user': teacher_a,
+                    'name': teacher_name(teacher_a),
+                    'current_location': county_a.name,
+                    'wants_location': county_b.name,
+                    'is_current_user': teacher_a.id == user.id,
+                },
+                'teacher_b': {
+                    'user': teacher_b,
+                    'name': teacher_name(teacher_b),
+                    'current_location': county_b.name,
+                    'wants_location': county_c.name,
+                    'is_current_user': teacher_b.id == user.id,
+                },
+                'teacher_c': {
+                    'user': teacher_c,
+                    'name': teacher_name(teacher_c),
+                    'current_location': county_c.name,
+                    'wants_location': county_a.name,
+                    'is_current_user': teacher_c.id == user.id,
+                },
+            }
+            
+            common_subjects = [subject.name for subject in triangle.common_subjects.all()]
+            if common_subjects:
+                triangle_data['common_subjects'] = common_subjects
+            
+            user_triangle_swaps.append(triangle_data)
         
-        # Filter triangles that include the current user
-        for teacher_a, teacher_b, teacher_c in all_triangles:
-            if user.id in [teacher_a.id, teacher_b.id, teacher_c.id]:
-                county_a = get_current_county(teacher_a)
-                county_b = get_current_county(teacher_b)
-                county_c = get_current_county(teacher_c)
-                
-                triangle_data = {
-                    'teacher_a': {
-                        'user': teacher_a,
-                        'name': teacher_a.profile.first_name + ' ' + (teacher_a.profile.surname or teacher_a.profile.last_name or '') if teacher_a.profile.first_name else teacher_a.email,
-                        'current_location': county_a.name if county_a else 'Unknown',
-                        'wants_location': county_b.name if county_b else 'Unknown',
-                        'is_current_user': teacher_a.id == user.id,
-                    },
-                    'teacher_b': {
-                        'user': teacher_b,
-                        'name': teacher_b.profile.first_name + ' ' + (teacher_b.profile.surname or teacher_b.profile.last_name or '') if teacher_b.profile.first_name else teacher_b.email,
-                        'current_location': county_b.name if county_b else 'Unknown',
-                        'wants_location': county_c.name if county_c else 'Unknown',
-                        'is_current_user': teacher_b.id == user.id,
-                    },
-                    'teacher_c': {
-                        'user': teacher_c,
-                        'name': teacher_c.profile.first_name + ' ' + (teacher_c.profile.surname or teacher_c.profile.last_name or '') if teacher_c.profile.first_name else teacher_c.email,
-                        'current_location': county_c.name if county_c else 'Unknown',
-                        'wants_location': county_a.name if county_a else 'Unknown',
-                        'is_current_user': teacher_c.id == user.id,
-                    },
-                }
-                
-                if is_secondary:
-                    # Add common subjects for secondary
-                    subjects_a = get_user_subjects(teacher_a)
-                    subjects_b = get_user_subjects(teacher_b)
-                    subjects_c = get_user_subjects(teacher_c)
-                    common_subjects = subjects_a.intersection(subjects_b).intersection(subjects_c)
-                    from home.models import Subject
-                    triangle_data['common_subjects'] = [Subject.objects.get(id=sid).name for sid in common_subjects if Subject.objects.filter(id=sid).exists()]
-                
-                user_triangle_swaps.append(triangle_data)
+        if user_triangle_swaps:
+            triangles_computed_at = get_triangles_computed_at(user)
     
     # Debug information
     debug_info = {
@@ -733,6 +706,7 @@ def dashboard(request):
         'debug_info': debug_checks,
         'triangle_swaps': user_triangle_swaps if 'user_triangle_swaps' in locals() else [],
         'has_triangle_swaps': len(user_triangle_swaps) > 0 if 'user_triangle_swaps' in locals() else False,
+        'triangles_computed_at': triangles_computed_at,
         
         # Completion status for each section - ensure these are booleans
         'personal_info_complete': bool(personal_info_complete),
@@ -831,7 +805,7 @@ def select_teaching_info(request):
                 messages.error(request, f'An error occurred: {str(e)}')
     
     # GET request or form with errors
-    levels = Level.objects.all().order_by('name')
+    levels = geo_cache.levels()
     
     # Get the user's current level and subjects if they exist
     current_level = profile.level if hasattr(profile, 'level') and profile.level else None
@@ -847,10 +821,7 @@ def select_teaching_info(request):
     current_subjects = [x for x in current_subjects if not (x in seen or seen.add(x))]
     
     # Get subjects for the current level or all subjects if no level selected
-    if current_level:
-        subjects = Subject.objects.filter(level=current_level).order_by('name')
-    else:
-        subjects = Subject.objects.none()
+    subjects = geo_cache.subjects(current_level) if current_level else []
     
     context = {
         'levels': levels,
@@ -1118,16 +1089,14 @@ def get_subjects_for_level(request, level_id):
         
         # Validate level_id
         if level_id == 0 or level_id == '0':
-            subjects = Subject.objects.none()
+            subjects = []
+        elif any(level['id'] == int(level_id) for level in geo_cache.levels()):
+            subjects = geo_cache.subjects(level_id)
         else:
-            try:
-                level = get_object_or_404(Level, id=level_id)
-                subjects = Subject.objects.filter(level=level).order_by('name')
-            except (ValueError, Level.DoesNotExist):
-                return JsonResponse(
-                    {'error': 'Invalid level ID'}, 
-                    status=400
-                )
+            return JsonResponse(
+                {'error': 'Invalid level ID'}, 
+                status=400
+            )
         
         # Get current subject IDs if teacher_id is provided
         current_subjects = []
@@ -1233,21 +1202,19 @@ def manage_teacher_subjects(request, user_id):
                 messages.error(request, f'Error updating teacher information: {str(e)}')
         
         # Get all levels and subjects for the dropdowns
-        levels = Level.objects.all().order_by('name')
-        subjects = Subject.objects.all()
-        if current_level:
-            subjects = subjects.filter(level=current_level)
+        levels = geo_cache.levels()
+        subjects = geo_cache.subjects(current_level) if current_level else geo_cache.subjects()
         
-        # Get location data for the form
-        counties = Counties.objects.all().order_by('name')
-        constituencies = Constituencies.objects.all().order_by('name')
-        wards = Wards.objects.all().order_by('name')
+        # Get location data for the form, from the geography cache
+        counties = geo_cache.counties()
+        constituencies = geo_cache.all_constituencies()
+        wards = geo_cache.all_wards()
         
         # Get the current school if it exists
         current_school = teacher.profile.school if hasattr(teacher, 'profile') and teacher.profile else None
         
         # Get schools for the current ward if available
-        schools = Schools.objects.all().order_by('name')
+        schools = Schools.objects.select_related('ward').order_by('name')
         if current_school and current_school.ward:
             schools = schools.filter(ward=current_school.ward)
         
@@ -1257,7 +1224,7 @@ def manage_teacher_subjects(request, user_id):
         context = {
             'teacher': teacher,
             'levels': levels,
-            'subjects': subjects.order_by('name'),
+            'subjects': subjects,
             'current_level': current_level,
             'current_subjects': [s.id for s in current_subjects],
             'swap_pref': swap_pref,
@@ -1305,6 +1272,7 @@ def primary_matched_swaps(request):
         swappreference__isnull=False  # Only teachers with swap preferences
     ).select_related(
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference__desired_county',  # Direct county reference
         'profile__school__level'
     ).prefetch_related(
@@ -1366,7 +1334,7 @@ def primary_matched_swaps(request):
         if not hasattr(teacher, 'profile') or not teacher.profile.school:
             continue
             
-        county = teacher.profile.school.ward.constituency.county
+        county = teacher.profile.current_county
         if county:
             teachers_by_county.setdefault(county.id, []).append(teacher)
 
@@ -1375,7 +1343,7 @@ def primary_matched_swaps(request):
         if not hasattr(teacher, 'profile') or not teacher.profile.school:
             continue
             
-        current_county = teacher.profile.school.ward.constituency.county
+        current_county = teacher.profile.current_county
         swap_pref = getattr(teacher, 'swappreference', None)
         
         if not swap_pref or not swap_pref.desired_ward:
@@ -1418,6 +1386,7 @@ def primary_triangle_swaps(request):
         swappreference__isnull=False
     ).select_related(
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference__desired_county',
         'profile__school__level'
     ).prefetch_related(
@@ -1487,6 +1456,7 @@ def secondary_triangle_swaps(request):
         swappreference__isnull=False
     ).select_related(
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference__desired_county',
         'profile__school__level'
     ).prefetch_related(
@@ -1564,6 +1534,7 @@ def high_school_matched_swaps(request):
         swappreference__isnull=False
     ).select_related(
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference__desired_county'  # Only need county-level preference
     ).prefetch_related(
         'swappreference__open_to_all',
@@ -1582,7 +1553,7 @@ def high_school_matched_swaps(request):
         if not hasattr(teacher, 'profile') or not teacher.profile.school:
             continue
             
-        county = teacher.profile.school.ward.constituency.county
+        county = teacher.profile.current_county
         if county:
             teachers_by_county.setdefault(county.id, []).append(teacher)
 
@@ -1594,7 +1565,7 @@ def high_school_matched_swaps(request):
             print(f"[DEBUG] Skipping teacher {teacher.id} - missing profile or school")
             continue
             
-        current_county = teacher.profile.school.ward.constituency.county
+        current_county = teacher.profile.current_county
         if not current_county:
             print(f"[DEBUG] Skipping teacher {teacher.id} - school has no county")
             continue
@@ -1685,7 +1656,7 @@ def high_school_matched_swaps(request):
                     'match_score': 100,  # Perfect match
                     'current_county_a': current_county.name,
                     'desired_county_a': desired_county.name,
-                    'current_county_b': match.profile.school.ward.constituency.county.name if hasattr(match, 'profile') and hasattr(match.profile, 'school') else 'Unknown',
+                    'current_county_b': match.profile.current_county.name if match.profile.current_county else 'Unknown',
                     'desired_county_b': current_county.name,  # They're swapping
                     'teacher_a_school': teacher.profile.school.name,
                     'teacher_b_school': match.profile.school.name,
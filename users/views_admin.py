@@ -3,7 +3,8 @@ from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import user_passes_test
 from django.db.models import Q
 from home.models import MySubject, Subject, SwapPreference, Schools
-from home.matching import find_matches
+from home.match_store import get_stored_matches, get_stored_match_counts
+from home.triangle_store import get_stored_triangle_counts, get_stored_triangles
 from .models import MyUser
 
 @staff_member_required
@@ -12,10 +13,15 @@ def user_management(request):
     users = MyUser.objects.prefetch_related(
         'profile__school__level',
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference',
         'mysubject_set__subject'
     ).order_by('-date_joined')
 
+    # One grouped query for every user's stored match count
+    match_counts = get_stored_match_counts()
+    triangle_counts = get_stored_triangle_counts()
+
     # Prepare user data for the template
     user_data = []
     for user in users:
@@ -51,56 +57,15 @@ def user_management(request):
                 'name': school.name,
                 'ward': school.ward.name if school.ward else 'N/A',
                 'constituency': school.ward.constituency.name if school.ward and school.ward.constituency else 'N/A',
-                'county': school.ward.constituency.county.name if school.ward and school.ward.constituency and school.ward.constituency.county else 'N/A',
+                'county': user.profile.current_county.name if user.profile.current_county else 'N/A',
                 'level': school.level.name if hasattr(school, 'level') and school.level else 'N/A'
             }
 
-        # Calculate triangle swaps
-        try:
-            if hasattr(user, 'profile') and user.profile.school and hasattr(user.profile.school, 'level') and hasattr(user, 'swappreference'):
-                from home.triangle_swap_utils import find_triangle_swaps_primary, find_triangle_swaps_secondary
-                from home.models import Level
-                
-                user_level = user.profile.school.level
-                is_secondary = 'secondary' in user_level.name.lower() or 'high' in user_level.name.lower()
-                
-                # Get all teachers at the same level
-                teachers = MyUser.objects.filter(
-                    is_active=True,
-                    role='Teacher',
-                    profile__isnull=False,
-                    profile__school__isnull=False,
-                    profile__school__level=user_level,
-                    swappreference__isnull=False
-                ).select_related(
-                    'profile__school__ward__constituency__county',
-                    'swappreference__desired_county',
-                    'profile__school__level'
-                ).prefetch_related(
-                    'swappreference__open_to_all',
-                    'mysubject_set__subject'
-                ).distinct()
-                
-                # Find triangle swaps
-                if is_secondary:
-                    all_triangles = find_triangle_swaps_secondary(teachers)
-                else:
-                    all_triangles = find_triangle_swaps_primary(teachers)
-                
-                # Count triangles that include this user
-                triangle_count = sum(1 for triangle in all_triangles if user.id in [t.id for t in triangle])
-                user_dict['triangle_swaps'] = triangle_count
-        except Exception as e:
-            print(f"Error calculating triangle swaps for user {user.id}: {str(e)}")
-            user_dict['triangle_swaps'] = 0
+        # Triangle swaps come from the triangle store
+        user_dict['triangle_swaps'] = triangle_counts.get(user.id, 0)
 
-        # Calculate potential matches using the central logic
-        try:
-            # use find_matches to ensure consistency with dashboard and individual view
-            user_dict['potential_matches'] = find_matches(user).count()
-        except Exception as e:
-            print(f"Error calculating matches for user {user.id}: {str(e)}")
-            user_dict['potential_matches'] = 0
+        # Potential matches come from the match store, same as the dashboard
+        user_dict['potential_matches'] = match_counts.get(user.id, 0)
 
         user_data.append(user_dict)
 
@@ -119,6 +84,7 @@ def user_potential_matches(request, user_id):
     user = get_object_or_404(MyUser.objects.prefetch_related(
         'profile__school__level',
         'profile__school__ward__constituency__county',
+        'profile__current_county',
         'swappreference',
         'mysubject_set__subject'
     ), id=user_id)
@@ -156,7 +122,7 @@ def user_potential_matches(request, user_id):
             'name': school.name,
             'ward': school.ward.name if school.ward else 'N/A',
             'constituency': school.ward.constituency.name if school.ward and school.ward.constituency else 'N/A',
-            'county': school.ward.constituency.county.name if school.ward and school.ward.constituency and school.ward.constituency.county else 'N/A',
+            'county': user.profile.current_county.name if user.profile.current_county else 'N/A',
             'level': school.level.name if hasattr(school, 'level') and school.level else 'N/A'
         }
 
@@ -178,11 +144,11 @@ def user_potential_matches(request, user_id):
             'is_hardship': prefs.is_hardship
         }
 
-    # Find potential matches using the central matching logic
+    # Find potential matches from the match store
     potential_matches = []
     
     try:
-        matches = find_matches(user)
+        matches = get_stored_matches(user).prefetch_related('mysubject_set__subject')
         
         # Prepare match data for display
         for match in matches:
@@ -216,7 +182,7 @@ def user_potential_matches(request, user_id):
                     'name': school.name,
                     'ward': school.ward.name if school.ward else 'N/A',
                     'constituency': school.ward.constituency.name if school.ward and school.ward.constituency else 'N/A',
-                    'county': school.ward.constituency.county.name if school.ward and school.ward.constituency and school.ward.constituency.county else 'N/A',
+                    'county': match.profile.current_county.name if match.profile.current_county else 'N/A',
                     'level': school.level.name if hasattr(school, 'level') and school.level else 'N/A'
                 }
             
@@ -239,94 +205,54 @@ def user_potential_matches(request, user_id):
     # Find triangle matches
     triangle_matches = []
     try:
-        from home.triangle_swap_utils import find_triangle_swaps_primary, find_triangle_swaps_secondary
-        
-        if hasattr(user, 'profile') and user.profile.school and hasattr(user.profile.school, 'level') and hasattr(user, 'swappreference'):
-            user_level = user.profile.school.level
-            is_secondary = 'secondary' in user_level.name.lower() or 'high' in user_level.name.lower()
-            
-            # Get all teachers at the same level (needed for triangle search)
-            # This replicates logic from user_management view
-            teachers = MyUser.objects.filter(
-                is_active=True,
-                role='Teacher',
-                profile__isnull=False,
-                profile__school__isnull=False,
-                profile__school__level=user_level,
-                swappreference__isnull=False
-            ).select_related(
-                'profile__school__ward__constituency__county',
-                'swappreference__desired_county',
-                'profile__school__level'
-            ).prefetch_related(
-                'swappreference__open_to_all',
-                'mysubject_set__subject'
-            ).distinct()
+        # Stored triangles through this user, ordered User -> Next -> Next
+        triangles = get_stored_triangles(user).prefetch_related(
+            'teacher_a__profile__school', 'teacher_a__mysubject_set__subject',
+            'teacher_b__profile__school', 'teacher_b__mysubject_set__subject',
+            'teacher_c__profile__school', 'teacher_c__mysubject_set__subject',
+        )
+        for triangle in triangles:
+            teachers_ordered = triangle.rotated_for(user)[1:] # The two OTHER teachers, with their counties
             
-            # Find all triangles
-            if is_secondary:
-                all_triangles = find_triangle_swaps_secondary(teachers)
-            else:
-                all_triangles = find_triangle_swaps_primary(teachers)
-            
-            # Filter for triangles involving this user
-            for triangle in all_triangles:
-                teacher_a, teacher_b, teacher_c = triangle
-                
-                # Check if user is in this triangle
-                user_in_triangle = False
-                teachers_ordered = [] # Will order as User -> Next -> Next
-                
-                if teacher_a.id == user.id:
-                    user_in_triangle = True
-                    teachers_ordered = [teacher_b, teacher_c] # The two OTHER teachers
-                elif teacher_b.id == user.id:
-                    user_in_triangle = True
-                    teachers_ordered = [teacher_c, teacher_a]
-                elif teacher_c.id == user.id:
-                    user_in_triangle = True
-                    teachers_ordered = [teacher_a, teacher_b]
+            # Process these 2 matches for display
+            triangle_data = []
+            for match, county in teachers_ordered:
+                match_info = {
+                    'id': match.id,
+                    'full_name': 'Unknown',
+                    'email': match.email,
+                    'phone': '-',
+                    'school': None,
+                    'subjects': []
+                }
                 
-                if user_in_triangle:
-                    # Process these 2 matches for display
-                    triangle_data = []
-                    for match in teachers_ordered:
-                        match_info = {
-                            'id': match.id,
-                            'full_name': 'Unknown',
-                            'email': match.email,
-                            'phone': '-',
-                            'school': None,
-                            'subjects': []
+                # Name
+                if hasattr(match, 'profile') and match.profile:
+                    name_parts = []
+                    if match.profile.first_name: name_parts.append(match.profile.first_name)
+                    if match.profile.surname: name_parts.append(match.profile.surname)
+                    elif match.profile.last_name: name_parts.append(match.profile.last_name)
+                    if name_parts: match_info['full_name'] = ' '.join(name_parts)
+                    
+                    if match.profile.phone: match_info['phone'] = match.profile.phone
+                    
+                    if match.profile.school:
+                        school = match.profile.school
+                        match_info['school'] = {
+                            'name': school.name,
+                            'county': county.name
                         }
-                        
-                        # Name
-                        if hasattr(match, 'profile') and match.profile:
-                            name_parts = []
-                            if match.profile.first_name: name_parts.append(match.profile.first_name)
-                            if match.profile.surname: name_parts.append(match.profile.surname)
-                            elif match.profile.last_name: name_parts.append(match.profile.last_name)
-                            if name_parts: match_info['full_name'] = ' '.join(name_parts)
-                            
-                            if match.profile.phone: match_info['phone'] = match.profile.phone
-                            
-                            if match.profile.school:
-                                school = match.profile.school
-                                match_info['school'] = {
-                                    'name': school.name,
-                                    'county': school.ward.constituency.county.name if school.ward and school.ward.constituency and school.ward.constituency.county else 'N/A'
-                                }
-                        
-                        # Subjects
-                        if hasattr(match, 'mysubject_set'):
-                            subjects = []
-                            for ms in match.mysubject_set.all():
-                                subjects.extend([s.name for s in ms.subject.all()])
-                            match_info['subjects'] = subjects
-                            
-                        triangle_data.append(match_info)
+                
+                # Subjects
+                if hasattr(match, 'mysubject_set'):
+                    subjects = []
+                    for ms in match.mysubject_set.all():
+                        subjects.extend([s.name for s in ms.subject.all()])
+                    match_info['subjects'] = subjects
                     
-                    triangle_matches.append(triangle_data)
+                triangle_data.append(match_info)
+            
+            triangle_matches.append(triangle_data)
 
     except Exception as e:
         print(f"Error finding triangle matches for {user.email}: {e}")
@@ -343,3 +269,56 @@ def user_potential_matches(request, user_id):
     }
     
     return render(request, 'users/admin/user_potential_matches.html', context)
+
+
+@staff_member_required
+def swap_clearing(request):
+    """
+    Staff report: one clearing run (home.clearing) for the chosen level,
+    showing which disjoint rotations relocate the most teachers.
+    """
+    from home.clearing import DEFAULT_CLEARING_LENGTH, clear_level
+    from home.cycle_finder import get_max_length
+    from home.models import Level
+
+    levels = Level.objects.order_by('id')
+    level = levels.filter(id=request.GET.get('level') or 0).first() or levels.first()
+    try:
+        max_length = int(request.GET.get('max_length', DEFAULT_CLEARING_LENGTH))
+    except ValueError:
+        max_length = DEFAULT_CLEARING_LENGTH
+    max_length = min(max(max_length, 2), get_max_length())
+
+    result = None
+    rotations = []
+    if level:
+        result = clear_level(level, max_length)
+        shown = result['cycles'][:200]
+        teachers = MyUser.objects.filter(
+            id__in={user_id for rotation in shown for user_id in rotation}
+        ).select_related('profile__current_county', 'profile__school').in_bulk()
+        for rotation in shown:
+            members = []
+            for user_id in rotation:
+                teacher = teachers[user_id]
+                profile = getattr(teacher, 'profile', None)
+                name = ' '.join(filter(None, [profile.first_name, profile.surname or profile.last_name])) if profile else ''
+                members.append({
+                    'id': teacher.id,
+                    'name': name or teacher.email,
+                    'county': profile.current_county.name if profile and profile.current_county else 'N/A',
+                    'school': profile.school.name if profile and profile.school else 'N/A',
+                })
+            rotations.append(members)
+
+    context = {
+        'title': 'Swap Clearing',
+        'levels': levels,
+        'level': level,
+        'max_length': max_length,
+        'length_choices': range(2, get_max_length() + 1),
+        'result': result,
+        'rotations': rotations,
+        'by_length': sorted(result['by_length'].items()) if result else [],
+    }
+    return render(request, 'users/admin/swap_clearing.html', context)